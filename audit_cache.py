@@ -0,0 +1,135 @@
+import asyncio
+import datetime
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('audit_cache')
+
+
+class _GuildAuditLog:
+    """Последние записи журнала аудита одного сервера"""
+
+    __slots__ = ("entries", "last_refresh", "lock")
+
+    def __init__(self):
+        # (действие, id цели) -> записи от новых к старым
+        self.entries: Dict[Tuple[Any, int], List[Any]] = {}
+        self.last_refresh = 0.0
+        self.lock = asyncio.Lock()
+
+
+class AuditLogCache:
+    """Общий кэш журнала аудита для обработчиков событий
+
+    Вместо запроса audit_logs(limit=1) на каждое событие кэш забирает
+    последние записи сервера одной пачкой (без фильтра по действию, поэтому
+    пачка годится для всех обработчиков) и индексирует их по паре
+    (действие, id цели). Обновление выполняется не чаще refresh_interval
+    секунд на сервер; одновременные промахи ждут одного и того же запроса.
+    Запись о действии появляется в журнале чуть позже события, поэтому
+    промах не означает отсутствия записи — ответ может прийти с задержкой.
+    """
+
+    def __init__(self, refresh_interval: float = 5.0, batch_size: int = 50, max_age: float = 120.0):
+        """Инициализация кэша
+
+        Args:
+            refresh_interval: Минимальный интервал между запросами журнала сервера, сек
+            batch_size: Сколько записей забирать за один запрос
+            max_age: Записи старше этого возраста не используются для атрибуции, сек
+        """
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self._guilds: Dict[int, _GuildAuditLog] = {}
+
+        # Счетчики для диагностики
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def _lookup(self, log: _GuildAuditLog, action, target_id: int,
+                predicate: Optional[Callable[[Any], bool]]):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for entry in log.entries.get((action, target_id), ()):
+            if (now - entry.created_at).total_seconds() > self.max_age:
+                break
+            try:
+                if predicate is None or predicate(entry):
+                    return entry
+            except AttributeError:
+                continue
+        return None
+
+    async def _refresh(self, guild, log: _GuildAuditLog):
+        """Загрузка последних записей журнала сервера одной пачкой"""
+        entries: Dict[Tuple[Any, int], List[Any]] = {}
+        try:
+            async for entry in guild.audit_logs(limit=self.batch_size):
+                target_id = getattr(entry.target, "id", None)
+                if target_id is not None:
+                    entries.setdefault((entry.action, target_id), []).append(entry)
+        except Exception as e:
+            logger.error(f"Ошибка чтения журнала аудита сервера {guild.id}: {e}")
+            return
+        finally:
+            log.last_refresh = asyncio.get_running_loop().time()
+            self.fetches += 1
+        # Поиск берет первую подходящую запись, поэтому самые новые — в начале
+        for bucket in entries.values():
+            bucket.sort(key=lambda entry: entry.id, reverse=True)
+        log.entries = entries
+
+    async def find(self, guild, action, target_id: int,
+                   predicate: Optional[Callable[[Any], bool]] = None):
+        """Поиск записи журнала аудита о действии над целью
+
+        Args:
+            guild: Сервер Discord
+            action: discord.AuditLogAction
+            target_id: Идентификатор измененного объекта
+            predicate: Дополнительная проверка записи
+
+        Returns:
+            Запись журнала или None
+        """
+        if not guild.me.guild_permissions.view_audit_log:
+            return None
+        log = self._guilds.get(guild.id)
+        if log is None:
+            log = self._guilds[guild.id] = _GuildAuditLog()
+
+        entry = self._lookup(log, action, target_id, predicate)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        async with log.lock:
+            # Пока ждали блокировку, журнал мог обновить другой обработчик
+            entry = self._lookup(log, action, target_id, predicate)
+            if entry is not None:
+                return entry
+            # Не чаще refresh_interval: при всплеске событий все они дождутся
+            # одного следующего запроса вместо запроса на каждое событие
+            remaining = log.last_refresh + self.refresh_interval - asyncio.get_running_loop().time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            await self._refresh(guild, log)
+            return self._lookup(log, action, target_id, predicate)
+
+    async def find_user(self, guild, action, target_id: int,
+                        predicate: Optional[Callable[[Any], bool]] = None) -> Optional[str]:
+        """Имя пользователя, выполнившего действие, или None"""
+        entry = await self.find(guild, action, target_id, predicate)
+        if entry is None or entry.user is None:
+            return None
+        return entry.user.name
+
+    def forget(self, guild_id: int):
+        """Удаление кэша сервера (например, при выходе бота с сервера)"""
+        self._guilds.pop(guild_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий и промахов"""
+        return {"hits": self.hits, "misses": self.misses, "fetches": self.fetches}
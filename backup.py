@@ -0,0 +1,251 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import zipfile
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('backup')
+
+# Имя архива: backup_ГГГГММДД_ЧЧММСС.zip
+BACKUP_NAME_RE = re.compile(r'^backup_\d{8}_\d{6}(?:_\d+)?\.zip$')
+
+
+class BackupManager:
+    """Резервные копии JSON-файлов и корпусов
+
+    Копия снимается в цикле событий: JSON-файлы сериализуются из памяти
+    JsonManager, окна корпусов копируются как массивы идентификаторов
+    (ModelRegistry.snapshot), поэтому состояние согласовано и снимок стоит
+    доли миллисекунды даже для большого корпуса. Декодирование, сжатие и
+    запись архива выполняются в отдельном потоке. Хранится не больше
+    max_count архивов, старые удаляются.
+    """
+
+    def __init__(self, json_manager, models, backup_dir: Optional[str] = None,
+                 max_count: int = 5, compresslevel: int = 6):
+        """Инициализация
+
+        Args:
+            json_manager: Экземпляр JsonManager
+            models: Реестр корпусов (model_registry.ModelRegistry)
+            backup_dir: Директория архивов (по умолчанию <config_dir>/backups)
+            max_count: Сколько последних архивов хранить
+            compresslevel: Уровень сжатия zlib
+        """
+        self.json_manager = json_manager
+        self.models = models
+        self.backup_dir = backup_dir or os.path.join(json_manager.config_dir, "backups")
+        self.max_count = max_count
+        self.compresslevel = compresslevel
+        self._task: Optional[asyncio.Task] = None
+        # Необязательный сборщик замеров (metrics.Metrics)
+        self.metrics = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _json_names(self, files: Optional[List[str]]) -> List[str]:
+        """Имена файлов JsonManager по списку имен файлов из scheduler.json"""
+        if files is None:
+            # Токены в резервные копии не попадают
+            return [name for name in self.json_manager.files if name != "tokens"]
+        names = []
+        for filename in files:
+            name = filename[:-5] if filename.endswith(".json") else filename
+            if name in self.json_manager.files:
+                names.append(name)
+            else:
+                logger.warning(f"Неизвестный файл для резервной копии: {filename}")
+        return names
+
+    def snapshot(self, files: Optional[List[str]] = None) -> Tuple[Dict[str, str], Dict, Dict[str, str]]:
+        """Согласованная копия состояния в памяти (вызывается в цикле событий)
+
+        Args:
+            files: Имена JSON-файлов; None — все файлы JsonManager, кроме tokens
+
+        Returns:
+            (JSON-тексты по именам файлов, окна корпусов, пути незагруженных журналов)
+        """
+        # Перенос актуального состояния (например, списков медиа) в словари
+        self.json_manager.run_flush_hooks()
+        documents = {}
+        for name in self._json_names(files):
+            if not self.json_manager.is_loaded(name) and not os.path.exists(self.json_manager.files[name]):
+                continue
+            try:
+                documents[f"{name}.json"] = json.dumps(getattr(self.json_manager, name),
+                                                       ensure_ascii=False, indent=4)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Ошибка сериализации {name} для резервной копии: {e}")
+        windows, corpus_files = self.models.snapshot()
+        return documents, windows, corpus_files
+
+    async def create(self, files: Optional[List[str]] = None) -> Optional[str]:
+        """Создание архива без блокировки цикла событий
+
+        Если копия уже создается, ждет ее завершения вместо запуска второй.
+
+        Args:
+            files: Имена JSON-файлов; None — все файлы JsonManager, кроме tokens
+
+        Returns:
+            Путь к созданному архиву или None при ошибке
+        """
+        if self.running:
+            return await asyncio.shield(self._task)
+        documents, windows, corpus_files = self.snapshot(files)
+        # Пока архив пишется, идентификаторы слов снимка не освобождаются
+        table = self.models.table
+        table.pin()
+        self._task = asyncio.create_task(asyncio.to_thread(self._write, documents, windows, corpus_files))
+        self._task.add_done_callback(lambda _: table.unpin())
+        return await asyncio.shield(self._task)
+
+    def _archive_path(self) -> str:
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.backup_dir, f"backup_{stamp}.zip")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.backup_dir, f"backup_{stamp}_{suffix}.zip")
+            suffix += 1
+        return path
+
+    def _write(self, documents: Dict[str, str], windows: Dict[str, Tuple[array, array]],
+               corpus_files: Dict[str, str]) -> Optional[str]:
+        """Сжатие и атомарная запись архива (в отдельном потоке)"""
+        start = time.perf_counter()
+        id_to_word = self.models.table.id_to_word
+        try:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            path = self._archive_path()
+            fd, tmp_path = tempfile.mkstemp(dir=self.backup_dir, prefix=".tmp_", suffix=".zip")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED,
+                                         compresslevel=self.compresslevel) as archive:
+                        for name, text in documents.items():
+                            archive.writestr(name, text)
+                        for name, (tokens, offsets) in windows.items():
+                            with archive.open(name, 'w') as entry:
+                                # Таблица закреплена (TokenTable.pin), поэтому
+                                # идентификаторы читаются без блокировки
+                                for i, start_offset in enumerate(offsets):
+                                    end = offsets[i + 1] if i + 1 < len(offsets) else len(tokens)
+                                    line = ' '.join(id_to_word[word_id] for word_id in tokens[start_offset:end])
+                                    entry.write((line + '\n').encode('utf-8'))
+                        for name, filepath in corpus_files.items():
+                            if os.path.exists(filepath):
+                                archive.write(filepath, name)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except Exception as e:
+            logger.error(f"Ошибка создания резервной копии: {e}")
+            return None
+        self._rotate()
+        if self.metrics is not None:
+            self.metrics.record("backup", time.perf_counter() - start)
+        logger.info(f"Резервная копия создана: {path}")
+        return path
+
+    def list_backups(self) -> List[str]:
+        """Имена архивов от старых к новым"""
+        try:
+            return sorted(name for name in os.listdir(self.backup_dir) if BACKUP_NAME_RE.match(name))
+        except FileNotFoundError:
+            return []
+
+    def _rotate(self):
+        """Удаление архивов сверх max_count"""
+        names = self.list_backups()
+        for name in names[:max(0, len(names) - self.max_count)]:
+            try:
+                os.remove(os.path.join(self.backup_dir, name))
+                logger.info(f"Старая резервная копия удалена: {name}")
+            except OSError as e:
+                logger.error(f"Ошибка удаления резервной копии {name}: {e}")
+
+    @staticmethod
+    def _read(path: str) -> Dict[str, bytes]:
+        """Чтение содержимого архива (в отдельном потоке)"""
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+
+    def _replace_corpora(self, entries: Dict[str, bytes]):
+        """Атомарная замена журналов корпусов содержимым архива"""
+        config_dir = self.json_manager.config_dir
+        corpora_dir = os.path.join(config_dir, "corpora")
+        for name, data in entries.items():
+            target = os.path.join(config_dir, name)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp_", suffix=".log")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, target)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        # Журналы разделов, которых не было в копии, удаляются
+        for filename in os.listdir(corpora_dir):
+            if filename.endswith(".log") and f"corpora/{filename}" not in entries:
+                os.remove(os.path.join(corpora_dir, filename))
+
+    async def restore(self, name: str) -> List[str]:
+        """Восстановление из архива
+
+        Архив читается в отдельном потоке. JSON-файлы подменяются в памяти
+        JsonManager и записываются обычным отложенным сбросом, журналы
+        корпусов заменяются и перечитываются без передачи управления циклу
+        событий, поэтому новые сообщения не попадают в старые журналы.
+
+        Args:
+            name: Имя архива из list_backups()
+
+        Returns:
+            Имена восстановленных JSON-файлов
+
+        Raises:
+            FileNotFoundError: Архив не найден
+        """
+        path = os.path.join(self.backup_dir, name)
+        if not BACKUP_NAME_RE.match(name) or not os.path.exists(path):
+            raise FileNotFoundError(path)
+        contents = await asyncio.to_thread(self._read, path)
+
+        documents = {}
+        corpora = {}
+        for entry, data in contents.items():
+            if entry.endswith(".json") and entry[:-5] in self.json_manager.files:
+                try:
+                    documents[entry[:-5]] = json.loads(data.decode('utf-8'))
+                except (UnicodeDecodeError, ValueError) as e:
+                    logger.error(f"Поврежденный файл {entry} в архиве {name}: {e}")
+            elif entry == "corpus.log" or (entry.startswith("corpora/") and entry.count("/") == 1
+                                           and entry.endswith(".log")):
+                corpora[entry] = data
+            else:
+                logger.warning(f"Пропущен неизвестный файл архива: {entry}")
+
+        for json_name, data in documents.items():
+            self.json_manager.replace(json_name, data)
+        if "corpus.log" in corpora:
+            self.models.close()
+            self._replace_corpora(corpora)
+            self.models.reload()
+        logger.info(f"Данные восстановлены из {name}: {', '.join(sorted(documents) + sorted(corpora))}")
+        return sorted(documents)
@@ -0,0 +1,224 @@
+"""Бенчмарки горячих путей бота
+
+Запуск: python benchmarks.py
+"""
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import timeit
+import tracemalloc
+from collections import deque
+
+from types import SimpleNamespace
+
+from config_schema import SCHEMAS
+from corpus_store import CorpusStore
+from markov_engine import MarkovEngine
+from preprocessing import DEFAULT_IGNORE_PATTERNS, MessagePreprocessor
+
+# Небольшой словарь для синтетического корпуса
+VOCABULARY = [
+    "канализация", "труба", "вода", "крыса", "бот", "сервер", "привет", "шутка",
+    "сегодня", "завтра", "опять", "снова", "очень", "совсем", "никогда", "всегда",
+    "дом", "улица", "город", "ночь", "день", "кот", "пес", "игра", "музыка",
+    "голос", "канал", "чат", "мем", "гифка", "картинка", "ответ", "вопрос",
+]
+
+
+def synthetic_messages(total_words, seed=42):
+    """Синтетический поток сообщений общим объемом total_words слов"""
+    rng = random.Random(seed)
+    messages = []
+    count = 0
+    while count < total_words:
+        length = rng.randint(3, 12)
+        words = [rng.choice(VOCABULARY) for _ in range(length)]
+        messages.append(' '.join(words) + rng.choice(['.', '!', '?', '']))
+        count += length
+    return messages
+
+
+def bench_markov(sizes=(1000, 10000, 100000), repeat=20):
+    """Сравнение пересборки markovify.Text на каждое упоминание с MarkovEngine"""
+    print("== Генерация ответа: markovify (пересборка) vs MarkovEngine")
+    try:
+        import markovify
+    except ImportError:
+        markovify = None
+        print("markovify не установлен, сравнение только для MarkovEngine")
+
+    for size in sizes:
+        messages = synthetic_messages(size)
+        corpus = ' '.join(messages)
+
+        engine = MarkovEngine(state_size=2)
+        for message in messages:
+            engine.add_message(engine.table.encode(message))
+
+        engine_time = timeit.timeit(
+            lambda: engine.make_short_sentence(max_chars=100, max_words=10, min_words=2, tries=100),
+            number=repeat
+        ) / repeat
+        line = f"{size:>7} слов: MarkovEngine {engine_time * 1000:8.3f} мс"
+
+        if markovify is not None:
+            def rebuild():
+                model = markovify.Text(corpus, state_size=2)
+                model.make_short_sentence(max_chars=100, max_words=10, min_words=2, tries=100)
+            rebuild_repeat = max(1, repeat // 10)
+            rebuild_time = timeit.timeit(rebuild, number=rebuild_repeat) / rebuild_repeat
+            line += f", markovify {rebuild_time * 1000:9.3f} мс"
+
+        print(line)
+
+
+def bench_corpus(sizes=(1000, 10000, 100000), count=1000):
+    """Добавление сообщения: строка в bot_data vs журнал CorpusStore"""
+    print("== Добавление сообщения в заполненное окно корпуса")
+    for size in sizes:
+        messages = synthetic_messages(size)
+        incoming = synthetic_messages(count * 8, seed=7)[:count]
+
+        # Старый путь: дописывание в строку, split и join всего окна
+        text_corpus = ' '.join(messages)
+        start = time.perf_counter()
+        for message in incoming:
+            text_corpus += message + " "
+            words = text_corpus.split()
+            if len(words) > size:
+                text_corpus = ' '.join(words[-size:])
+        legacy_time = (time.perf_counter() - start) / count
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CorpusStore(os.path.join(tmp, "corpus.log"), max_words=size)
+            engine = MarkovEngine(state_size=2, table=store.table)
+            for ids in store.migrate(messages):
+                engine.add_message(ids)
+            start = time.perf_counter()
+            for message in incoming:
+                ids = store.table.encode(message)
+                evicted = store.append(ids)
+                engine.add_message(ids)
+                for old_ids in evicted:
+                    engine.remove_message(old_ids)
+            store_time = (time.perf_counter() - start) / count
+            store.close()
+
+        print(f"{size:>7} слов: строка {legacy_time * 1e6:9.1f} мкс, "
+              f"журнал + модель {store_time * 1e6:7.1f} мкс")
+
+
+def zipf_messages(total_words, vocabulary_size=50000, seed=42):
+    """Синтетический поток сообщений с распределением слов по закону Ципфа
+
+    В отличие от synthetic_messages словарь большой, поэтому число
+    состояний цепи растет с корпусом, как в живом чате.
+    """
+    rng = random.Random(seed)
+    words = [f"слово{i}" for i in range(vocabulary_size)]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary_size + 1)))
+    messages = []
+    count = 0
+    while count < total_words:
+        length = rng.randint(3, 12)
+        chosen = rng.choices(words, cum_weights=cum_weights, k=length)
+        messages.append(' '.join(chosen) + rng.choice(['.', '!', '?', '']))
+        count += length
+    return messages
+
+
+def legacy_window(messages, state_size=2):
+    """Прежнее представление: окно строк и словари переходов из строк"""
+    # Строки копируются, как при чтении журнала с диска
+    window = deque((' '.join(text.split()), len(text.split())) for text in messages)
+    model = {}
+    for text in messages:
+        items = ["___BEGIN__"] * state_size + text.split() + ["___END__"]
+        for i in range(len(items) - state_size):
+            choices = model.setdefault(tuple(items[i:i + state_size]), {})
+            follow = items[i + state_size]
+            choices[follow] = choices.get(follow, 0) + 1
+    return window, model
+
+
+def measure_bytes(build):
+    """Объем памяти, выделенной при построении структуры, байт"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return used
+
+
+def bench_memory(sizes=(10000, 100000, 1000000)):
+    """Память на слово корпуса: строки и словари vs идентификаторы в массивах"""
+    print("== Память на слово окна корпуса (окно + модель)")
+    for size in sizes:
+        messages = zipf_messages(size)
+        legacy = measure_bytes(lambda: legacy_window(messages))
+
+        def build_compact():
+            with tempfile.TemporaryDirectory() as tmp:
+                store = CorpusStore(os.path.join(tmp, "corpus.log"), max_words=size)
+                engine = MarkovEngine(state_size=2, table=store.table)
+                for ids in store.migrate(messages):
+                    engine.add_message(ids)
+                store.close()
+            return store, engine
+        compact = measure_bytes(build_compact)
+        print(f"{size:>7} слов: строки {legacy / size:6.1f} байт/слово, "
+              f"идентификаторы {compact / size:6.1f} байт/слово ({legacy / compact:.1f}x)")
+
+
+def legacy_preprocess(text):
+    """Прежняя цепочка filter_emojis -> contains_common_pattern -> normalize_text"""
+    emoji_pattern = re.compile(r'[\U0001F000-\U0001FFFF]')
+    text = emoji_pattern.sub('', text).strip()
+    if not text:
+        return None
+    for pattern in DEFAULT_IGNORE_PATTERNS:
+        if re.search(pattern, text.lower()):
+            return None
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = re.sub(r'([а-яА-Яa-zA-Z0-9])_([а-яА-Яa-zA-Z0-9])', r'\1 \2', text)
+    return text
+
+
+def bench_preprocessing(count=20000):
+    """Сравнение прежней цепочки функций с MessagePreprocessor"""
+    print("== Предобработка сообщения")
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    config = {}
+    for name in ("filters", "learning_config"):
+        with open(os.path.join(base_dir, f"{name}.json"), encoding='utf-8') as f:
+            config[name] = json.load(f)
+    manager = SimpleNamespace(
+        files={name: os.path.join(base_dir, f"{name}.json") for name in config},
+        config=lambda name: SCHEMAS[name](config[name], name)
+    )
+    preprocessor = MessagePreprocessor(manager)
+
+    rng = random.Random(1)
+    extras = ["😀", ":)", "<@123456>", "https://example.com/x", "слово_слово", "привет"]
+    messages = []
+    for text in synthetic_messages(count * 8)[:count]:
+        if rng.random() < 0.3:
+            text += " " + rng.choice(extras)
+        messages.append(text)
+
+    legacy_time = timeit.timeit(lambda: [legacy_preprocess(m) for m in messages], number=1) / count
+    new_time = timeit.timeit(lambda: [preprocessor.process(m) for m in messages], number=1) / count
+    print(f"прежняя цепочка {legacy_time * 1e6:6.2f} мкс, MessagePreprocessor {new_time * 1e6:6.2f} мкс")
+
+
+if __name__ == "__main__":
+    bench_markov()
+    bench_corpus()
+    bench_memory()
+    bench_preprocessing()
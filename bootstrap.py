@@ -0,0 +1,302 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from config_schema import SCHEMAS
+from preprocessing import MessagePreprocessor
+
+logger = logging.getLogger('bootstrap')
+
+# Препроцессор рабочего процесса (создается один раз в инициализаторе пула)
+_worker_preprocessor: Optional[MessagePreprocessor] = None
+
+
+def _init_worker(files: Dict[str, str], filters: Dict, learning_config: Dict, command_prefix: str):
+    """Сборка препроцессора в рабочем процессе из копии конфигурации"""
+    global _worker_preprocessor
+    data = {"filters": filters, "learning_config": learning_config}
+    manager = SimpleNamespace(files=files, config=lambda name: SCHEMAS[name](data[name], name))
+    _worker_preprocessor = MessagePreprocessor(manager, command_prefix=command_prefix)
+
+
+def _process_chunk(lines: List[str]) -> List[str]:
+    """Нормализация и фильтрация пачки строк в рабочем процессе
+
+    Returns:
+        Принятые тексты в исходном порядке
+    """
+    accepted = []
+    for line in lines:
+        text = _worker_preprocessor.process(line.strip())
+        if text:
+            accepted.append(text)
+    return accepted
+
+
+class _Tail:
+    """Последние сообщения общим объемом не больше max_words слов"""
+
+    def __init__(self, max_words: int):
+        self.max_words = max_words
+        self.texts: Deque[Tuple[str, int]] = deque()
+        self.words = 0
+
+    def extend(self, texts: List[str]):
+        for text in texts:
+            count = text.count(' ') + 1
+            self.texts.append((text, count))
+            self.words += count
+            while self.words > self.max_words and self.texts:
+                self.words -= self.texts.popleft()[1]
+
+
+class CorpusBootstrap:
+    """Начальное заполнение глобального корпуса из внешнего файла и истории каналов
+
+    Файл читается потоково пачками строк, а история каналов — постранично
+    через channel.history(). Нормализация и фильтрация (MessagePreprocessor)
+    выполняются в пуле процессов; результаты сливаются по порядку, и в
+    памяти остается только то, что поместится в окно корпуса. Новая модель
+    собирается отдельным разделом по частям, не блокируя цикл событий, а
+    бот до замены продолжает отвечать по старой. Текущее окно переносится
+    в новый раздел первым, собранные тексты — после него, так что при
+    переполнении вытесняются самые старые сообщения. Замена — одно
+    присваивание в ModelRegistry.swap_global, сообщения, пришедшие за время
+    сборки, переносятся в новый раздел.
+
+    Сама модель строится в цикле событий пачками по build_batch сообщений,
+    а не в пуле: цепь хранит идентификаторы общей TokenTable этого процесса
+    со счетчиками ссылок, и таблицы переходов из рабочих процессов пришлось
+    бы передавать и переводить в эти идентификаторы — это стоит столько же,
+    сколько добавить те же сообщения в модель на месте.
+    """
+
+    def __init__(self, json_manager, models, preprocessor: MessagePreprocessor,
+                 max_workers: Optional[int] = None, chunk_lines: int = 2000,
+                 build_batch: int = 500):
+        """Инициализация
+
+        Args:
+            json_manager: Экземпляр JsonManager
+            models: Реестр корпусов (model_registry.ModelRegistry)
+            preprocessor: Препроцессор бота (его настройки копируются в рабочие процессы)
+            max_workers: Размер пула процессов (по умолчанию по числу ядер, не больше 4)
+            chunk_lines: Сколько строк отправлять в рабочий процесс за раз
+            build_batch: Сколько сообщений добавлять в модель между передачами управления
+        """
+        self.json_manager = json_manager
+        self.models = models
+        self.preprocessor = preprocessor
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.chunk_lines = chunk_lines
+        self.build_batch = build_batch
+        self._task: Optional[asyncio.Task] = None
+        # Необязательный обработчик прогресса: callback(progress)
+        self.on_progress: Optional[Callable[[Dict], None]] = None
+        self.progress: Dict = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, channels=()) -> bool:
+        """Запуск заполнения в фоне
+
+        Args:
+            channels: Каналы Discord, история которых читается
+
+        Returns:
+            False если заполнение уже выполняется
+        """
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self.run(channels))
+        self._task.add_done_callback(self._log_failure)
+        return True
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        """Журналирование ошибки заполнения, которую никто не ожидает (запуск из on_ready)"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка заполнения корпуса: {task.exception()}", exc_info=task.exception())
+
+    async def wait(self) -> Optional[Dict]:
+        """Ожидание текущего заполнения; итоговый прогресс или None"""
+        if self._task is None:
+            return None
+        return await asyncio.shield(self._task)
+
+    def _report(self, stage: str, **values):
+        if self.progress.get("stage") != stage:
+            logger.info(f"Заполнение корпуса: этап {stage}")
+            self.progress = {"stage": stage}
+        self.progress.update(values)
+        if self.on_progress is not None:
+            try:
+                self.on_progress(dict(self.progress))
+            except Exception as e:
+                logger.error(f"Ошибка обработчика прогресса: {e}")
+
+    def _external_path(self, path: str) -> str:
+        return path if os.path.isabs(path) else os.path.join(self.json_manager.config_dir, path)
+
+    def _read_chunks(self, path: str) -> Iterator[List[str]]:
+        """Потоковое чтение файла пачками по chunk_lines строк"""
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            chunk = []
+            for line in f:
+                chunk.append(line)
+                if len(chunk) >= self.chunk_lines:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    async def _map(self, loop, pool, chunks, tail: _Tail, stage: str, total: int = 0):
+        """Обработка пачек в пуле с ограничением числа пачек в работе"""
+        pending = deque()
+        processed = 0
+        accepted = 0
+        sizes = deque()
+
+        async def collect():
+            nonlocal processed, accepted
+            texts = await pending.popleft()
+            processed += sizes.popleft()
+            accepted += len(texts)
+            tail.extend(texts)
+            self._report(stage, processed=processed, accepted=accepted, total=total, words=tail.words)
+
+        chunk_iter = iter(chunks)
+        while True:
+            # Чтение файла тоже не должно блокировать цикл событий
+            chunk = await asyncio.to_thread(next, chunk_iter, None)
+            if chunk is None:
+                break
+            pending.append(loop.run_in_executor(pool, _process_chunk, chunk))
+            sizes.append(len(chunk))
+            if len(pending) >= self.max_workers * 2:
+                await collect()
+        while pending:
+            await collect()
+
+    async def _history(self, channels, limit: int) -> List[str]:
+        """Тексты сообщений каналов в хронологическом порядке
+
+        discord.py сам запрашивает историю страницами по 100 сообщений.
+        """
+        records = []
+        for channel in channels:
+            fetched = 0
+            try:
+                async for message in channel.history(limit=limit):
+                    fetched += 1
+                    if message.author.bot or self.preprocessor.is_ignored_user(message.author):
+                        continue
+                    if message.content:
+                        records.append((message.created_at, message.content))
+            except Exception as e:
+                logger.error(f"Ошибка чтения истории канала {getattr(channel, 'id', channel)}: {e}")
+            self._report("history", channel=getattr(channel, "id", None), fetched=fetched)
+        records.sort(key=lambda record: record[0])
+        return [content for _, content in records]
+
+    async def run(self, channels=()) -> Dict:
+        """Заполнение корпуса и замена глобальной модели
+
+        Args:
+            channels: Каналы Discord, история которых читается
+
+        Returns:
+            Итоговый прогресс
+        """
+        start = time.perf_counter()
+        sources = self.json_manager.config("learning_config").sources
+        max_words = self.models.max_words
+        self.progress = {}
+
+        # Внешний файл занимает не больше external_corpus_weight окна,
+        # более свежая история каналов — остаток
+        external_tail = _Tail(int(max_words * min(1.0, sources.external_corpus_weight)))
+        history_tail = _Tail(max_words)
+
+        loop = asyncio.get_running_loop()
+        # spawn, а не fork: у процесса бота уже есть потоки (буфер ответов,
+        # поток общей базы, asyncio.to_thread), и унаследованная от них
+        # занятая блокировка повесила бы рабочий процесс
+        pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                {name: self.json_manager.files[name] for name in ("filters", "learning_config")},
+                self.json_manager.filters,
+                self.json_manager.learning_config,
+                self.preprocessor.command_prefix,
+            ),
+        )
+        try:
+            if sources.external_corpus:
+                path = self._external_path(sources.external_corpus_path)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    logger.warning(f"Внешний корпус {path} не найден")
+                else:
+                    logger.info(f"Чтение внешнего корпуса {path} ({size} байт)")
+                    self._report("external", bytes=size)
+                    await self._map(loop, pool, self._read_chunks(path), external_tail, "external")
+            if channels and sources.history_limit:
+                history = await self._history(channels, sources.history_limit)
+                chunks = [history[i:i + self.chunk_lines] for i in range(0, len(history), self.chunk_lines)]
+                await self._map(loop, pool, chunks, history_tail, "history_filter", total=len(history))
+        finally:
+            # Остановка рабочих процессов ждет их завершения, поэтому не в цикле событий
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+        texts = [text for text, _ in external_tail.texts]
+        texts += [text for text, _ in history_tail.texts]
+        if not texts:
+            self._report("done", messages=0, seconds=round(time.perf_counter() - start, 3))
+            logger.info("Заполнение корпуса: нет подходящих сообщений")
+            return dict(self.progress)
+
+        # Новый раздел собирается по частям, бот отвечает по старому. Первым
+        # идет текущее окно: собранные тексты добавляются после него, и при
+        # переполнении FIFO вытесняет прежде всего старые сообщения окна.
+        # Пришедшие после метки сообщения перенесет swap_global
+        current = self.models.global_partition.store
+        seed = list(current.messages())
+        mark = current.pushed
+        partition = self.models.new_global_partition()
+        table = partition.table
+        total = len(seed) + len(texts)
+        messages = itertools.chain(seed, (table.encode(text) for text in texts))
+        try:
+            for built in range(0, total, self.build_batch):
+                partition.extend(list(itertools.islice(messages, self.build_batch)))
+                self._report("build", built=min(built + self.build_batch, total), total=total)
+                await asyncio.sleep(0)
+        except BaseException:
+            # Недостроенный раздел отдает свои слова общей таблице
+            partition.unload()
+            raise
+        dropped = min(len(seed), total - partition.store.message_count)
+        if dropped:
+            logger.warning(f"Заполнение корпуса вытеснило {dropped} из {len(seed)} сообщений текущего окна")
+
+        if not self.models.swap_global(partition, since=mark):
+            self._report("done", messages=0, seconds=round(time.perf_counter() - start, 3))
+            return dict(self.progress)
+        self._report("done", messages=partition.store.message_count, words=partition.word_count,
+                     seconds=round(time.perf_counter() - start, 3))
+        logger.info(f"Корпус заполнен: {partition.store.message_count} сообщений, "
+                    f"{partition.word_count} слов за {time.perf_counter() - start:.1f} с")
+        return dict(self.progress)
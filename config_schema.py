@@ -0,0 +1,463 @@
+import copy
+import datetime
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('config_schema')
+
+
+class ConfigObject:
+    """Типизированная секция конфигурации
+
+    Поля описываются в FIELDS: имя -> (тип, значение по умолчанию[, минимум]).
+    Тип может быть подклассом ConfigObject для вложенной секции или ConfigMap
+    для словаря однотипных секций (имя -> секция). Значения
+    проверяются один раз при создании объекта: отсутствующие и неверные
+    заменяются значениями по умолчанию с предупреждением в журнале, поэтому
+    остальной код читает атрибуты без .get() и проверок типов.
+    """
+
+    __slots__ = ()
+    FIELDS: Dict[str, tuple] = {}
+
+    def __init__(self, data: Optional[Dict] = None, source: str = ""):
+        """Создание секции из словаря
+
+        Args:
+            data: Содержимое секции из JSON-файла
+            source: Путь к секции для сообщений журнала (например, "learning_config.corpus")
+        """
+        if not isinstance(data, dict):
+            if data is not None:
+                logger.warning(f"{source}: ожидался объект, получено {data!r}; используются значения по умолчанию")
+            data = {}
+        for name, spec in self.FIELDS.items():
+            kind, default = spec[0], spec[1]
+            minimum = spec[2] if len(spec) > 2 else None
+            setattr(self, name, self._validate(f"{source}.{name}", kind, data.get(name), default, minimum))
+
+    @staticmethod
+    def _validate(path: str, kind, value, default, minimum):
+        if isinstance(kind, type) and issubclass(kind, ConfigObject):
+            return kind(value, path)
+        if isinstance(kind, ConfigMap):
+            return kind.parse(path, value)
+        # Изменяемое значение по умолчанию копируется, иначе его разделят все объекты
+        if value is None:
+            return copy.deepcopy(default)
+        if kind is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        elif kind is str and isinstance(value, int) and not isinstance(value, bool):
+            # Идентификатор чата Telegram может быть записан числом
+            value = str(value)
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            logger.warning(f"{path}: ожидался {kind.__name__}, получено {value!r}; используется {default!r}")
+            return copy.deepcopy(default)
+        if minimum is not None and value < minimum:
+            logger.warning(f"{path}: значение {value!r} меньше {minimum!r}; используется {default!r}")
+            return default
+        return value
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+
+class ConfigMap:
+    """Тип поля: словарь однотипных секций (например, команды в commands.json)"""
+
+    def __init__(self, item: type):
+        """Инициализация
+
+        Args:
+            item: Подкласс ConfigObject для каждого значения словаря
+        """
+        self.item = item
+
+    def parse(self, path: str, value) -> Dict[str, ConfigObject]:
+        if value is None:
+            return {}
+        if not isinstance(value, dict):
+            logger.warning(f"{path}: ожидался объект, получено {value!r}; используется {{}}")
+            return {}
+        return {key: self.item(data, f"{path}.{key}") for key, data in value.items()}
+
+
+class TokensConfig(ConfigObject):
+    """tokens.json"""
+
+    FIELDS = {
+        "DISCORD_TOKEN": (str, ""),
+        "TELEGRAM_TOKEN": (str, ""),
+        "TELEGRAM_CHAT_ID": (str, ""),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class MarkovSettings(ConfigObject):
+    """learning_config.json: markovify"""
+
+    FIELDS = {
+        "state_size": (int, 2, 1),
+        "max_words": (int, 20, 1),
+        "min_words": (int, 2, 1),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class CorpusSettings(ConfigObject):
+    """learning_config.json: corpus"""
+
+    FIELDS = {
+        "max_size": (int, 10000, 1),
+        "min_size": (int, 100, 0),
+        "rotation_strategy": (str, "fifo"),
+        "backup_interval": (int, 3600, 0),
+        "backup_max_count": (int, 5, 1),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class PartitioningSettings(ConfigObject):
+    """learning_config.json: partitioning"""
+
+    FIELDS = {
+        "enabled": (bool, True),
+        "per_channel": (bool, False),
+        "memory_budget_mb": (float, 64.0, 0.0),
+        "global_weight": (float, 1.0, 0.0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class WeightSettings(ConfigObject):
+    """learning_config.json: weights"""
+
+    FIELDS = {
+        "recent_messages": (float, 1.5, 0.0),
+        "user_specific": (float, 1.0, 0.0),
+        "channel_specific": (float, 1.0, 0.0),
+        "predefined_responses": (float, 1.2, 0.0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class AnalyticsSettings(ConfigObject):
+    """learning_config.json: analytics"""
+
+    FIELDS = {
+        "track_word_frequencies": (bool, True),
+        "track_message_patterns": (bool, True),
+        "track_user_preferences": (bool, True),
+        "sentiment_analysis": (bool, False),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class SourceSettings(ConfigObject):
+    """learning_config.json: sources"""
+
+    FIELDS = {
+        "user_messages": (bool, True),
+        "predefined_phrases": (bool, True),
+        "external_corpus": (bool, False),
+        "external_corpus_path": (str, "external_corpus.txt"),
+        "external_corpus_weight": (float, 0.5, 0.0),
+        "history_channels": (list, []),
+        "history_limit": (int, 1000, 0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class ReplySettings(ConfigObject):
+    """learning_config.json: replies"""
+
+    FIELDS = {
+        "channel_rate": (float, 1.0, 0.01),
+        "channel_burst": (int, 5, 1),
+        "max_queue": (int, 100, 1),
+        "max_age": (float, 15.0, 0.0),
+        "max_batch": (int, 5, 1),
+        "user_cooldown": (float, 3.0, 0.0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class MessageProcessingSettings(ConfigObject):
+    """learning_config.json: message_processing"""
+
+    FIELDS = {
+        "normalize_case": (bool, False),
+        "remove_punctuation": (bool, False),
+        "filter_emojis": (bool, True),
+        "filter_urls": (bool, True),
+        "filter_mentions": (bool, True),
+        "filter_commands": (bool, True),
+        # None — взять min_message_length/max_message_length из filters.json
+        "min_length": (int, None, 0),
+        "max_length": (int, None, 0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class ShardingSettings(ConfigObject):
+    """learning_config.json: sharding"""
+
+    FIELDS = {
+        "enabled": (bool, False),
+        "processes": (int, 2, 1),
+        "shard_count": (int, 0, 0),
+        "generation_processes": (int, 2, 0),
+        "sync_interval": (float, 1.0, 0.1),
+        "busy_timeout": (float, 0.5, 0.0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class LearningConfig(ConfigObject):
+    """learning_config.json (секции, которые читает код бота)"""
+
+    FIELDS = {
+        "enabled": (bool, True),
+        "markovify": (MarkovSettings, None),
+        "corpus": (CorpusSettings, None),
+        "partitioning": (PartitioningSettings, None),
+        "weights": (WeightSettings, None),
+        "analytics": (AnalyticsSettings, None),
+        "sources": (SourceSettings, None),
+        "replies": (ReplySettings, None),
+        "sharding": (ShardingSettings, None),
+        "message_processing": (MessageProcessingSettings, None),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class UrlHandlingSettings(ConfigObject):
+    """filters.json: url_handling"""
+
+    FIELDS = {
+        "allow_urls": (bool, True),
+        "add_to_corpus": (bool, False),
+        "log_only": (bool, True),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class FiltersConfig(ConfigObject):
+    """filters.json"""
+
+    FIELDS = {
+        "emoji_replacements": (dict, {}),
+        "url_handling": (UrlHandlingSettings, None),
+        "min_message_length": (int, 0, 0),
+        "max_message_length": (int, 0, 0),
+        "ignore_users": (list, []),
+        # None — стандартные шаблоны preprocessing.DEFAULT_IGNORE_PATTERNS
+        "ignore_patterns": (list, None),
+        "blacklisted_words": (list, []),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class MessageLengthSettings(ConfigObject):
+    """personality.json: profiles.<профиль>.message_length"""
+
+    FIELDS = {
+        "min_words": (int, 2, 1),
+        "max_words": (int, 10, 1),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class ProfileSettings(ConfigObject):
+    """personality.json: profiles.<профиль> (проценты — числа от 0 до 100)"""
+
+    FIELDS = {
+        "name": (str, None),
+        "randomness": (float, 50.0, 0.0),
+        "message_length": (MessageLengthSettings, None),
+        "response_preferences": (dict, {}),
+        "markov_usage": (float, 50.0, 0.0),
+        "mood": (str, "neutral"),
+        "emoji_usage": (float, 0.0, 0.0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class MoodSettings(ConfigObject):
+    """personality.json: moods.<настроение>"""
+
+    FIELDS = {
+        "trigger_words": (list, []),
+        "response_types": (list, []),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class PersonalityConfig(ConfigObject):
+    """personality.json"""
+
+    FIELDS = {
+        "active_profile": (str, "default"),
+        "profiles": (ConfigMap(ProfileSettings), None),
+        "moods": (ConfigMap(MoodSettings), None),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class SchedulerSettings(ConfigObject):
+    """scheduler.json: settings"""
+
+    FIELDS = {
+        "timezone": (str, None),
+        "retries": (int, 3, 1),
+        "retry_delay": (float, 60.0, 0.0),
+        "max_task_duration": (float, 300.0, 1.0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class TelegramNotificationSettings(ConfigObject):
+    """scheduler.json: notifications.telegram"""
+
+    FIELDS = {
+        "enabled": (bool, False),
+        "levels": (list, []),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class NotificationSettings(ConfigObject):
+    """scheduler.json: notifications"""
+
+    FIELDS = {
+        "telegram": (TelegramNotificationSettings, None),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class SchedulerConfig(ConfigObject):
+    """scheduler.json (задачи остаются словарями: в них записывается next_run)"""
+
+    FIELDS = {
+        "tasks": (dict, {}),
+        "notifications": (NotificationSettings, None),
+        "settings": (SchedulerSettings, None),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class CommandSettings(ConfigObject):
+    """commands.json: commands.<команда>"""
+
+    FIELDS = {
+        "enabled": (bool, True),
+        "permission_level": (int, 0, 0),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class CommandsConfig(ConfigObject):
+    """commands.json"""
+
+    FIELDS = {
+        "prefix": (str, "!"),
+        "commands": (ConfigMap(CommandSettings), None),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+# Типизированные представления файлов для JsonManager.config()
+SCHEMAS = {
+    "tokens": TokensConfig,
+    "learning_config": LearningConfig,
+    "filters": FiltersConfig,
+    "personality": PersonalityConfig,
+    "scheduler": SchedulerConfig,
+    "commands": CommandsConfig,
+}
+
+
+# Обязательная структура файлов данных; недостающие ключи дополняются
+# в памяти при загрузке, а на диск попадают только вместе с изменениями
+DEFAULT_DATA: Dict[str, Dict[str, Any]] = {
+    "tokens": {
+        "DISCORD_TOKEN": "",
+        "TELEGRAM_TOKEN": "",
+        "TELEGRAM_CHAT_ID": ""
+    },
+    "bot_data": {
+        "text_corpus": "",
+        "static_images": [],
+        "gifs": []
+    },
+    "stats": {
+        "general": {
+            "start_date": None,
+            "uptime": 0,
+            "restarts": 0,
+            "version": "1.0.0"
+        },
+        "messages": {
+            "total_received": 0,
+            "total_sent": 0,
+            "by_type": {
+                "text": 0,
+                "image": 0,
+                "gif": 0
+            },
+            "by_day": {},
+            "peak_time": None,
+            "slowest_time": None
+        },
+        "words": {
+            "total_corpus_size": 0,
+            "unique_words": 0,
+            "most_common": {},
+            "average_length": 0,
+            "by_user": {},
+            "window": []
+        },
+        "performance": {
+            "average_response_time": 0,
+            "max_response_time": 0,
+            "memory_usage": {
+                "current": 0,
+                "peak": 0
+            }
+        }
+    },
+}
+
+
+def fill_defaults(name: str, data: Dict) -> Dict:
+    """Дополнение загруженного файла недостающими ключами по умолчанию
+
+    Args:
+        name: Имя файла из JsonManager.files
+        data: Загруженные данные (изменяются на месте)
+
+    Returns:
+        Те же данные
+    """
+    defaults = DEFAULT_DATA.get(name)
+    if defaults is None:
+        return data
+    _merge(data, defaults, f"{name}.")
+    if name == "stats" and data["general"].get("start_date") is None:
+        data["general"]["start_date"] = datetime.datetime.now().isoformat()
+    return data
+
+
+def _merge(data: Dict, defaults: Dict, path: str = ""):
+    for key, value in defaults.items():
+        if key not in data:
+            data[key] = copy.deepcopy(value)
+        elif isinstance(value, (dict, list)) and not isinstance(data[key], type(value)):
+            # Файлы данных изменяются по месту, поэтому вместо объекта-схемы
+            # проверяется хотя бы тип разделов, в которые пишет код
+            logger.warning(f"{path}{key}: ожидался {type(value).__name__}, получено {data[key]!r}; "
+                           f"используется {value!r}")
+            data[key] = copy.deepcopy(value)
+        elif isinstance(value, dict):
+            _merge(data[key], value, f"{path}{key}.")
@@ -0,0 +1,305 @@
+import os
+import logging
+import tempfile
+from array import array
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from vocabulary import TokenTable
+
+logger = logging.getLogger('corpus_store')
+
+
+class CorpusStore:
+    """Хранилище корпуса в виде журнала с дозаписью
+
+    Каждое принятое сообщение дописывается в конец текстового файла
+    отдельной строкой, поэтому стоимость добавления — O(длина сообщения).
+    В памяти держится FIFO-окно сообщений не длиннее max_words слов. Когда
+    в файле накапливается слишком много вытесненных строк, он атомарно
+    переписывается содержимым текущего окна (компакция).
+
+    Окно хранится не строками, а идентификаторами слов из TokenTable в
+    одном массиве array('i') плюс массив смещений начала сообщений.
+    Вытесненные сообщения остаются в начале массивов, пока их не станет
+    больше половины, после чего массивы сдвигаются за один проход.
+    """
+
+    def __init__(self, filepath: str, max_words: int = 10000, compact_factor: float = 2.0,
+                 table: Optional[TokenTable] = None):
+        """Инициализация хранилища
+
+        Args:
+            filepath: Путь к файлу журнала
+            max_words: Максимальный размер окна корпуса в словах
+            compact_factor: Во сколько раз число строк в файле может превышать
+                размер окна перед компакцией
+            table: Общая таблица слов (по умолчанию — собственная)
+        """
+        self.filepath = filepath
+        self.max_words = max_words
+        self.compact_factor = compact_factor
+        self.table = table if table is not None else TokenTable()
+
+        # Окно: идентификаторы слов подряд и смещения начала каждого сообщения
+        self.tokens = array('i')
+        self.offsets = array('q')
+        # Индекс первого сообщения окна в offsets
+        self._first = 0
+        self.word_count = 0
+        # Сколько сообщений добавлено в окно за все время (метка для recent)
+        self.pushed = 0
+        # Количество строк в файле, включая уже вытесненные из окна
+        self.file_lines = 0
+        self._file = None
+
+    @property
+    def message_count(self) -> int:
+        """Количество сообщений в окне"""
+        return len(self.offsets) - self._first
+
+    def _message(self, index: int) -> array:
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else len(self.tokens)
+        return self.tokens[start:end]
+
+    def messages(self) -> Iterator[array]:
+        """Сообщения окна в порядке добавления, каждое — массив идентификаторов"""
+        for index in range(self._first, len(self.offsets)):
+            yield self._message(index)
+
+    def recent(self, mark: int) -> List[array]:
+        """Сообщения окна, добавленные после того, как pushed было равно mark"""
+        count = min(self.pushed - mark, self.message_count)
+        return [self._message(index) for index in range(len(self.offsets) - count, len(self.offsets))]
+
+    def load(self) -> List[array]:
+        """Восстановление окна из журнала
+
+        Returns:
+            Сообщения, попавшие в окно, в порядке добавления
+        """
+        self._reset()
+        self.file_lines = 0
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self.file_lines += 1
+                    ids = self.table.encode(line)
+                    if ids:
+                        self._push(ids)
+        except FileNotFoundError:
+            logger.info(f"Файл корпуса {self.filepath} не найден, будет создан при добавлении")
+        # Журнал мог дорасти через append_line, пока окно не было загружено
+        if self._needs_compaction():
+            self.compact()
+        return list(self.messages())
+
+    def snapshot(self) -> Tuple[array, array]:
+        """Копия окна для записи в другом потоке
+
+        Returns:
+            (идентификаторы слов, смещения начала сообщений от нуля)
+        """
+        if not self.message_count:
+            return array('i'), array('q')
+        base = self.offsets[self._first]
+        return self.tokens[base:], array('q', (offset - base for offset in self.offsets[self._first:]))
+
+    def _reset(self):
+        self.tokens = array('i')
+        self.offsets = array('q')
+        self._first = 0
+        self.word_count = 0
+
+    @staticmethod
+    def append_line(filepath: str, text: str) -> bool:
+        """Дозапись сообщения в журнал без загрузки окна в память
+
+        Args:
+            filepath: Путь к файлу журнала
+            text: Текст сообщения
+
+        Returns:
+            True если запись прошла успешно
+        """
+        text = ' '.join(text.split())
+        if not text:
+            return False
+        try:
+            with open(filepath, 'a', encoding='utf-8') as f:
+                f.write(text + '\n')
+            return True
+        except OSError as e:
+            logger.error(f"Ошибка записи в файл корпуса {filepath}: {e}")
+            return False
+
+    @staticmethod
+    def count_lines(filepath: str) -> int:
+        """Количество строк в журнале (0, если файла нет)"""
+        try:
+            with open(filepath, 'rb') as f:
+                return sum(1 for _ in f)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def compact_file(filepath: str, max_words: int) -> int:
+        """Компакция журнала незагруженного раздела без построения окна
+
+        В файле остаются только последние строки общим объемом не больше
+        max_words слов — те же, что попали бы в окно при загрузке.
+
+        Args:
+            filepath: Путь к файлу журнала
+            max_words: Размер окна корпуса в словах
+
+        Returns:
+            Количество оставшихся строк или -1 при ошибке
+        """
+        tail = deque()
+        words = 0
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                for line in f:
+                    count = len(line.split())
+                    if not count:
+                        continue
+                    tail.append(line)
+                    words += count
+                    while words > max_words and len(tail) > 1:
+                        words -= len(tail.popleft().split())
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.error(f"Ошибка чтения файла корпуса {filepath}: {e}")
+            return -1
+        if not CorpusStore._write_lines(filepath, tail):
+            return -1
+        return len(tail)
+
+    @staticmethod
+    def _write_lines(filepath: str, lines: Iterable[str]) -> bool:
+        """Атомарная запись строк (с переводом строки в конце) поверх журнала"""
+        directory = os.path.dirname(filepath) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".log")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, filepath)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка компакции файла корпуса {filepath}: {e}")
+            return False
+
+    def _needs_compaction(self) -> bool:
+        return self.file_lines > max(self.compact_factor * self.message_count, 100)
+
+    def migrate(self, messages: List[str]) -> List[array]:
+        """Заполнение пустого журнала сообщениями из старого формата
+
+        Args:
+            messages: Сообщения в порядке добавления
+
+        Returns:
+            Сообщения, попавшие в окно
+        """
+        for text in messages:
+            ids = self.table.encode(text)
+            if ids:
+                self._push(ids)
+        self.compact()
+        return list(self.messages())
+
+    def extend(self, messages: List[array]) -> List[array]:
+        """Добавление сообщений в окно без записи в журнал
+
+        Журнал переписывается содержимым окна при следующей компакции.
+
+        Args:
+            messages: Сообщения в виде массивов идентификаторов
+
+        Returns:
+            Список вытесненных из окна сообщений
+        """
+        evicted = []
+        for ids in messages:
+            if ids:
+                evicted.extend(self._push(ids))
+        return evicted
+
+    def _push(self, ids: array) -> List[array]:
+        """Добавление сообщения в окно в памяти с вытеснением старых"""
+        self.offsets.append(len(self.tokens))
+        self.tokens.extend(ids)
+        self.word_count += len(ids)
+        self.pushed += 1
+        evicted = []
+        while self.word_count > self.max_words and self.message_count > 1:
+            old_ids = self._message(self._first)
+            self._first += 1
+            self.word_count -= len(old_ids)
+            evicted.append(old_ids)
+        if self._first > 64 and self._first * 2 > len(self.offsets):
+            self._shift()
+        return evicted
+
+    def _shift(self):
+        """Удаление вытесненных сообщений из начала массивов"""
+        base = self.offsets[self._first]
+        del self.tokens[:base]
+        self.offsets = array('q', (offset - base for offset in self.offsets[self._first:]))
+        self._first = 0
+
+    def append(self, ids: array) -> List[array]:
+        """Добавление нормализованного сообщения в журнал и окно
+
+        Args:
+            ids: Идентификаторы слов сообщения (TokenTable.encode)
+
+        Returns:
+            Список вытесненных из окна сообщений
+        """
+        if not ids:
+            return []
+        evicted = self._push(ids)
+        try:
+            if self._file is None:
+                self._file = open(self.filepath, 'a', encoding='utf-8')
+            self._file.write(self.table.decode(ids) + '\n')
+            self._file.flush()
+            self.file_lines += 1
+        except OSError as e:
+            logger.error(f"Ошибка записи в файл корпуса {self.filepath}: {e}")
+        if self._needs_compaction():
+            self.compact()
+        return evicted
+
+    def compact(self) -> bool:
+        """Атомарная перезапись журнала содержимым текущего окна
+
+        Returns:
+            True если компакция прошла успешно
+        """
+        self.close()
+        if not self._write_lines(self.filepath, (self.table.decode(ids) + '\n' for ids in self.messages())):
+            return False
+        self.file_lines = self.message_count
+        return True
+
+    def close(self):
+        """Закрытие файла журнала"""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
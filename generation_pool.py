@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from model_registry import ModelPartition
+from shared_store import SharedCorpusStore, SharedStore
+from vocabulary import TokenTable
+
+logger = logging.getLogger('generation_pool')
+
+# Глобальная модель рабочего процесса (строится в инициализаторе пула)
+_worker_partition: Optional[ModelPartition] = None
+
+
+def _init_worker(db_path: str, max_words: int, state_size: int):
+    """Построение модели рабочего процесса по окну общего корпуса"""
+    global _worker_partition
+    table = TokenTable()
+    store = SharedCorpusStore(SharedStore(db_path), -1, "", max_words, table)
+    _worker_partition = ModelPartition("global", "", max_words, state_size, table, store)
+    _worker_partition.load()
+
+
+def _generate(min_words: int, max_words: int, max_chars: int, tries: int, attempts: int) -> Optional[str]:
+    """Генерация предложения в рабочем процессе после подтягивания новых сообщений"""
+    _worker_partition.sync()
+    if _worker_partition.word_count < 10:
+        return None
+    for _ in range(attempts):
+        sentence = _worker_partition.engine.make_short_sentence(
+            max_chars=max_chars, max_words=max_words, min_words=min_words, tries=tries
+        )
+        if sentence and len(sentence.split()) >= 2:
+            return sentence
+    return None
+
+
+class GenerationPool:
+    """Генерация ответов по глобальной модели в отдельных процессах
+
+    Каждый рабочий процесс держит свою копию модели, построенную по окну
+    общего корпуса в SharedStore, и перед генерацией дочитывает новые
+    сообщения всех шардов. Цикл событий шарда только ждет результат,
+    поэтому генерация не конкурирует за GIL с heartbeat шлюза Discord.
+    Память на модель умножается на число процессов.
+    """
+
+    def __init__(self, db_path: str, max_words: int = 10000, state_size: int = 2,
+                 processes: int = 2, timeout: float = 2.0, max_chars: int = 100, tries: int = 100):
+        """Инициализация
+
+        Args:
+            db_path: Путь к базе SharedStore
+            max_words: Размер окна корпуса в словах
+            state_size: Размер состояния цепи Маркова
+            processes: Количество рабочих процессов
+            timeout: Сколько ждать ответа процесса, сек
+            max_chars: Максимальная длина предложения
+            tries: Количество попыток генерации одного предложения
+        """
+        self.db_path = db_path
+        self.max_words = max_words
+        self.state_size = state_size
+        self.processes = processes
+        self.timeout = timeout
+        self.max_chars = max_chars
+        self.tries = tries
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        # Счетчики для диагностики
+        self.generated = 0
+        self.failed = 0
+
+    def start(self):
+        """Запуск рабочих процессов"""
+        if self._pool is None:
+            # spawn, как и у процессов-шардов: fork из процесса с живыми
+            # потоками может унаследовать занятую ими блокировку
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(os.path.abspath(self.db_path), self.max_words, self.state_size),
+            )
+
+    async def stop(self):
+        """Остановка рабочих процессов (ожидание — в отдельном потоке)"""
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+    async def generate(self, min_words: int = 2, max_words: int = 10, attempts: int = 15) -> Optional[str]:
+        """Предложение по глобальной модели или None (пул не запущен, таймаут, ошибка)
+
+        Args:
+            min_words: Минимальное количество слов
+            max_words: Максимальное количество слов
+            attempts: Сколько раз повторить make_short_sentence
+        """
+        if self._pool is None:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            sentence = await asyncio.wait_for(
+                loop.run_in_executor(self._pool, _generate, min_words, max_words,
+                                     self.max_chars, self.tries, attempts),
+                self.timeout
+            )
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка генерации в рабочем процессе: {e!r}")
+            return None
+        if sentence is not None:
+            self.generated += 1
+        return sentence
@@ -1,8 +1,13 @@
+import asyncio
 import json
 import os
-import datetime
 import logging
-from typing import Dict, List, Any, Union, Optional, Tuple
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Any, Set, Union, Optional, Tuple
+
+from config_schema import SCHEMAS, ConfigObject, fill_defaults
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, 
@@ -12,17 +17,36 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger('json_manager')
 
 class JsonManager:
-    """Класс для управления всеми JSON-файлами бота"""
+    """Класс для управления всеми JSON-файлами бота
+    
+    Файлы читаются лениво при первом обращении к одноименному атрибуту
+    (json_manager.stats и т.д.), недостающие ключи дополняются значениями
+    по умолчанию только в памяти. На диск файл попадает лишь после
+    mark_dirty, поэтому запуск бота ничего не перезаписывает.
+    """
     
-    def __init__(self, config_dir: str = "config"):
+    def __init__(self, config_dir: str = "config", flush_interval: float = 1.0):
         """Инициализация менеджера JSON-файлов
         
         Args:
             config_dir: Директория, в которой хранятся файлы конфигурации
+            flush_interval: Период отложенной записи измененных файлов, сек.
+                Это же верхняя граница потери данных при аварийном завершении
         """
         self.config_dir = config_dir
+        self.flush_interval = flush_interval
         os.makedirs(config_dir, exist_ok=True)
         
+        # Имена файлов, измененных с момента последней записи
+        self._dirty: Set[str] = set()
+        # Файлы, которые этот процесс не записывает (их ведет главный шард)
+        self.readonly: Set[str] = set()
+        self._write_lock = threading.Lock()
+        # Функции, переносящие актуальное состояние в словари перед записью
+        self._before_flush: List[Callable[[], None]] = []
+        # Необязательный сборщик замеров (metrics.Metrics)
+        self.metrics = None
+        
         # Пути к файлам
         self.files = {
             "tokens": os.path.join(config_dir, "tokens.json"),
@@ -36,19 +60,38 @@ class JsonManager:
             "scheduler": os.path.join(config_dir, "scheduler.json")
         }
         
-        # Загрузка всех файлов
-        self.tokens = self._load_json(self.files["tokens"])
-        self.bot_data = self._load_json(self.files["bot_data"])
-        self.responses = self._load_json(self.files["responses"])
-        self.personality = self._load_json(self.files["personality"])
-        self.filters = self._load_json(self.files["filters"])
-        self.commands = self._load_json(self.files["commands"])
-        self.stats = self._load_json(self.files["stats"])
-        self.learning_config = self._load_json(self.files["learning_config"])
-        self.scheduler = self._load_json(self.files["scheduler"])
+        # Проверенные типизированные представления файлов (config_schema.SCHEMAS)
+        self._configs: Dict[str, ConfigObject] = {}
+        
+    def __getattr__(self, name: str) -> Dict:
+        """Ленивая загрузка файла при первом обращении к атрибуту
+        
+        Вызывается, только если атрибута еще нет; загруженные данные
+        сохраняются как обычный атрибут экземпляра.
+        """
+        files = self.__dict__.get("files", {})
+        if name not in files:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        data = fill_defaults(name, self._load_json(files[name]))
+        setattr(self, name, data)
+        return data
+    
+    def is_loaded(self, name: str) -> bool:
+        """Проверка, был ли файл уже прочитан с диска"""
+        return name in self.__dict__
+    
+    def config(self, name: str) -> ConfigObject:
+        """Типизированное представление файла с проверкой значений
         
-        # Инициализация недостающих файлов с значениями по умолчанию
-        self._init_default_files()
+        Проверка выполняется один раз; объект пересоздается после reload().
+        
+        Args:
+            name: Имя файла из config_schema.SCHEMAS (например, "learning_config")
+        """
+        config = self._configs.get(name)
+        if config is None:
+            config = self._configs[name] = SCHEMAS[name](getattr(self, name), name)
+        return config
         
     def _load_json(self, filepath: str) -> Dict:
         """Загрузка JSON-файла
@@ -69,8 +112,33 @@ class JsonManager:
             logger.error(f"Ошибка декодирования JSON в файле {filepath}")
             return {}
             
+    def reload(self, name: str) -> Dict:
+        """Повторное чтение файла с диска (например, после ручного редактирования)
+        
+        Args:
+            name: Имя файла из self.files
+            
+        Returns:
+            Новое содержимое файла
+        """
+        data = fill_defaults(name, self._load_json(self.files[name]))
+        setattr(self, name, data)
+        self._configs.pop(name, None)
+        return data
+            
+    def replace(self, name: str, data: Dict):
+        """Подмена содержимого файла в памяти с отложенной записью на диск
+        
+        Args:
+            name: Имя файла из self.files
+            data: Новое содержимое
+        """
+        setattr(self, name, fill_defaults(name, data))
+        self._configs.pop(name, None)
+        self.mark_dirty(name)
+            
     def _save_json(self, data: Dict, filepath: str) -> bool:
-        """Сохранение данных в JSON-файл
+        """Атомарное сохранение данных в JSON-файл
         
         Args:
             data: Данные для сохранения
@@ -80,53 +148,136 @@ class JsonManager:
             True если сохранение прошло успешно, иначе False
         """
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
+            text = json.dumps(data, ensure_ascii=False, indent=4)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Ошибка сериализации данных для файла {filepath}: {e}")
+            return False
+        return self._write_atomic(text, filepath)
+    
+    def _write_atomic(self, text: str, filepath: str) -> bool:
+        """Запись текста во временный файл и переименование поверх целевого
+        
+        Args:
+            text: Сериализованные данные
+            filepath: Путь к файлу
+            
+        Returns:
+            True если запись прошла успешно, иначе False
+        """
+        directory = os.path.dirname(filepath) or "."
+        try:
+            with self._write_lock:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, filepath)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
             return True
         except Exception as e:
             logger.error(f"Ошибка сохранения в файл {filepath}: {e}")
             return False
-            
-    def _init_default_files(self):
-        """Инициализация файлов с значениями по умолчанию, если они отсутствуют"""
-        # Проверка и инициализация bot_data.json
-        if not self.bot_data:
-            self.bot_data = {
-                "text_corpus": "",
-                "static_images": [],
-                "gifs": []
-            }
-            self._save_json(self.bot_data, self.files["bot_data"])
-            
-        # Проверка и инициализация tokens.json
-        if not self.tokens:
-            self.tokens = {
-                "DISCORD_TOKEN": "",
-                "TELEGRAM_TOKEN": "",
-                "TELEGRAM_CHAT_ID": ""
-            }
-            self._save_json(self.tokens, self.files["tokens"])
-            
-        # Проверка и инициализация stats.json
-        if not self.stats:
-            self.stats = {
-                "general": {
-                    "start_date": datetime.datetime.now().isoformat(),
-                    "uptime": 0,
-                    "restarts": 0,
-                    "version": "1.0.0"
-                },
-                "messages": {
-                    "total_received": 0,
-                    "total_sent": 0,
-                    "by_type": {
-                        "text": 0,
-                        "image": 0,
-                        "gif": 0
-                    },
-                    "by_day": {},
-                    "peak_time": None,
-                    "slowest_time": None
-                }
-            }  # Added closing brace here
-            self._save_json(self.stats, self.files["stats"])
\ No newline at end of file
+    
+    def mark_dirty(self, name: str):
+        """Пометка файла как измененного; запись произойдет при ближайшем сбросе
+        
+        Args:
+            name: Имя файла из self.files (например, "stats")
+        """
+        if name not in self.readonly:
+            self._dirty.add(name)
+    
+    def is_dirty(self, name: str) -> bool:
+        """Проверка, ожидает ли файл записи
+        
+        Args:
+            name: Имя файла из self.files
+        """
+        return name in self._dirty
+    
+    def add_flush_hook(self, hook: Callable[[], None]):
+        """Регистрация функции, вызываемой перед каждым сбросом на диск
+        
+        Args:
+            hook: Функция без аргументов, обновляющая словари менеджера
+        """
+        self._before_flush.append(hook)
+    
+    def run_flush_hooks(self):
+        """Перенос актуального состояния в словари менеджера (функции add_flush_hook)"""
+        for hook in self._before_flush:
+            hook()
+    
+    def _snapshot_dirty(self) -> List[Tuple[str, str, str]]:
+        """Сериализация измененных файлов и сброс флагов
+        
+        Returns:
+            Список кортежей (имя файла, путь к файлу, JSON-текст)
+        """
+        if not self._dirty:
+            return []
+        self.run_flush_hooks()
+        snapshots = []
+        for name in sorted(self._dirty):
+            try:
+                text = json.dumps(getattr(self, name), ensure_ascii=False, indent=4)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Ошибка сериализации данных для файла {self.files[name]}: {e}")
+                continue
+            snapshots.append((name, self.files[name], text))
+        self._dirty.clear()
+        return snapshots
+    
+    def flush(self) -> bool:
+        """Немедленная синхронная запись всех измененных файлов
+        
+        Returns:
+            True если все файлы записаны успешно
+        """
+        ok = True
+        for name, filepath, text in self._snapshot_dirty():
+            if not self._write_atomic(text, filepath):
+                self._dirty.add(name)
+                ok = False
+        return ok
+    
+    async def flush_async(self):
+        """Запись измененных файлов без блокировки цикла событий
+        
+        Сериализация выполняется в цикле событий (данные не меняются во время
+        нее), а запись на диск — в отдельном потоке. Если задачу отменили
+        посреди записи (остановка бота), оставшиеся снимки записываются
+        синхронно: флаги уже сброшены, и финальный flush() их бы пропустил.
+        """
+        if not self._dirty:
+            return
+        start = time.perf_counter()
+        snapshots = self._snapshot_dirty()
+        written = 0
+        try:
+            for name, filepath, text in snapshots:
+                if not await asyncio.to_thread(self._write_atomic, text, filepath):
+                    # Повторим при следующем сбросе
+                    self._dirty.add(name)
+                written += 1
+        finally:
+            for name, filepath, text in snapshots[written:]:
+                if not self._write_atomic(text, filepath):
+                    self._dirty.add(name)
+        if self.metrics is not None:
+            self.metrics.record("json_flush", time.perf_counter() - start)
+    
+    async def run_autoflush(self):
+        """Периодическая отложенная запись измененных файлов"""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush_async()
+        finally:
+            # Финальный сброс при остановке
+            self.flush()
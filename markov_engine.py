@@ -0,0 +1,224 @@
+import itertools
+import random
+import re
+import logging
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# BEGIN и END по-прежнему импортируются из этого модуля
+from vocabulary import BEGIN, END, BEGIN_ID, END_ID, TokenTable  # noqa: F401
+
+logger = logging.getLogger('markov_engine')
+
+# Разбиение сообщения на предложения по завершающей пунктуации
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?…])\s+')
+
+# Разрядность идентификатора слова в упакованных ключах и переходах
+STATE_BITS = 32
+WORD_MASK = (1 << STATE_BITS) - 1
+# С какого числа переходов состояние хранится словарем вместо массива
+HASHED_FANOUT = 64
+
+
+class MarkovEngine:
+    """Инкрементальная цепь Маркова
+
+    В отличие от markovify.Text модель не перестраивается целиком: каждое
+    принятое сообщение добавляет свои переходы, а при вытеснении сообщения
+    из окна корпуса его переходы вычитаются. Генерация стоит
+    O(длина предложения) независимо от размера корпуса.
+
+    Слова хранятся идентификаторами из TokenTable. Состояние из state_size
+    идентификаторов упаковывается в одно целое число. Единственный переход
+    состояния (самый частый случай) хранится одним числом
+    (счетчик << STATE_BITS | слово), несколько переходов — массивом
+    array('i'): сначала n следующих слов, затем n счетчиков. Состояния с
+    большим числом переходов (например, начало предложения) переводятся
+    в словарь {слово: счетчик}, чтобы поиск слова не был линейным.
+    """
+
+    def __init__(self, state_size: int = 2, table: Optional[TokenTable] = None):
+        """Инициализация движка
+
+        Args:
+            state_size: Размер состояния цепи (количество слов)
+            table: Общая таблица слов (по умолчанию — собственная)
+        """
+        self.state_size = state_size
+        self.table = table if table is not None else TokenTable()
+        self._state_mask = (1 << (STATE_BITS * state_size)) - 1
+        # Ключ начального состояния (BEGIN, ..., BEGIN)
+        self._begin_state = 0
+        for _ in range(state_size):
+            self._begin_state = self._push_state(self._begin_state, BEGIN_ID)
+
+        # Упакованное состояние -> упакованный переход,
+        # [слово_1..слово_n, счетчик_1..счетчик_n] или {слово: счетчик}
+        self.model: Dict[int, Union[int, array, Dict[int, int]]] = {}
+        # Кэш накопленных весов для состояний-словарей, сбрасывается при изменении
+        self._cumulative: Dict[int, Tuple[List[int], List[int]]] = {}
+        # Количество слов во всех добавленных сообщениях
+        self.word_count = 0
+
+    def _push_state(self, state: int, word_id: int) -> int:
+        """Сдвиг упакованного состояния на одно слово"""
+        return ((state << STATE_BITS) | word_id) & self._state_mask
+
+    def split_sentences(self, ids: Sequence[int]) -> Iterator[Sequence[int]]:
+        """Разбиение сообщения на предложения по словам с завершающей пунктуацией
+
+        Args:
+            ids: Идентификаторы слов сообщения
+
+        Returns:
+            Итератор по срезам ids, каждый — одно предложение
+        """
+        sentence_end = self.table.sentence_end
+        start = 0
+        for i, word_id in enumerate(ids):
+            if sentence_end[word_id]:
+                yield ids[start:i + 1]
+                start = i + 1
+        if start < len(ids):
+            yield ids[start:]
+
+    def _update_sentence(self, ids: Sequence[int], delta: int):
+        """Добавление (delta=1) или удаление (delta=-1) переходов предложения"""
+        model = self.model
+        state = self._begin_state
+        for follow in list(ids) + [END_ID]:
+            transitions = model.get(state)
+            if transitions is None:
+                if delta > 0:
+                    model[state] = (delta << STATE_BITS) | follow
+            elif type(transitions) is int:
+                if transitions & WORD_MASK == follow:
+                    count = (transitions >> STATE_BITS) + delta
+                    if count > 0:
+                        model[state] = (count << STATE_BITS) | follow
+                    else:
+                        del model[state]
+                elif delta > 0:
+                    model[state] = array('i', (transitions & WORD_MASK, follow,
+                                               transitions >> STATE_BITS, delta))
+            elif type(transitions) is dict:
+                count = transitions.get(follow, 0) + delta
+                if count > 0:
+                    transitions[follow] = count
+                elif follow in transitions:
+                    del transitions[follow]
+                    if not transitions:
+                        del model[state]
+                self._cumulative.pop(state, None)
+            else:
+                n = len(transitions) >> 1
+                try:
+                    index = transitions.index(follow, 0, n)
+                except ValueError:
+                    if delta <= 0:
+                        pass
+                    elif n >= HASHED_FANOUT:
+                        table = dict(zip(transitions[:n], transitions[n:]))
+                        table[follow] = delta
+                        model[state] = table
+                    else:
+                        # Новое слово встает в конец списка слов, его счетчик — в конец массива
+                        transitions.insert(n, follow)
+                        transitions.append(delta)
+                else:
+                    count = transitions[n + index] + delta
+                    if count > 0:
+                        transitions[n + index] = count
+                    else:
+                        del transitions[n + index]
+                        del transitions[index]
+                        if n == 2:
+                            # Остался один переход: обратно в упакованное число
+                            model[state] = (transitions[1] << STATE_BITS) | transitions[0]
+            state = self._push_state(state, follow)
+
+    def add_message(self, ids: Sequence[int]):
+        """Добавление переходов сообщения в модель
+
+        Args:
+            ids: Идентификаторы слов нормализованного сообщения
+        """
+        for sentence in self.split_sentences(ids):
+            self._update_sentence(sentence, 1)
+            self.word_count += len(sentence)
+
+    def remove_message(self, ids: Sequence[int]):
+        """Удаление переходов ранее добавленного сообщения
+
+        Args:
+            ids: Идентификаторы слов сообщения в том же виде, в каком оно было добавлено
+        """
+        for sentence in self.split_sentences(ids):
+            self._update_sentence(sentence, -1)
+            self.word_count -= len(sentence)
+
+    def clear(self):
+        """Полная очистка модели"""
+        self.model.clear()
+        self._cumulative.clear()
+        self.word_count = 0
+
+    def _next_word(self, state: int) -> int:
+        """Выбор следующего слова с учетом частот переходов"""
+        transitions = self.model[state]
+        if type(transitions) is int:
+            return transitions & WORD_MASK
+        if type(transitions) is dict:
+            cached = self._cumulative.get(state)
+            if cached is None:
+                cached = self._cumulative[state] = (
+                    list(transitions), list(itertools.accumulate(transitions.values()))
+                )
+            words, weights = cached
+            return random.choices(words, cum_weights=weights)[0]
+        n = len(transitions) >> 1
+        return random.choices(transitions[:n], weights=transitions[n:])[0]
+
+    def walk(self, max_words: Optional[int] = None) -> List[int]:
+        """Случайное блуждание по цепи от начала предложения
+
+        Args:
+            max_words: Прервать блуждание, если слов стало больше
+
+        Returns:
+            Идентификаторы слов предложения
+        """
+        if not self.model:
+            return []
+        state = self._begin_state
+        result = []
+        while True:
+            word_id = self._next_word(state)
+            if word_id == END_ID:
+                break
+            result.append(word_id)
+            if max_words is not None and len(result) > max_words:
+                break
+            state = self._push_state(state, word_id)
+        return result
+
+    def make_short_sentence(self, max_chars: int = 100, max_words: int = 10,
+                            min_words: int = 2, tries: int = 100) -> Optional[str]:
+        """Генерация предложения в заданных границах (аналог markovify)
+
+        Args:
+            max_chars: Максимальная длина предложения в символах
+            max_words: Максимальное количество слов
+            min_words: Минимальное количество слов
+            tries: Количество попыток
+
+        Returns:
+            Сгенерированное предложение или None
+        """
+        for _ in range(tries):
+            ids = self.walk(max_words=max_words)
+            if min_words <= len(ids) <= max_words:
+                sentence = self.table.decode(ids)
+                if len(sentence) <= max_chars:
+                    return sentence
+        return None
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List
+
+logger = logging.getLogger('metrics')
+
+
+class RollingHistogram:
+    """Скользящее окно последних замеров с перцентилями
+
+    Запись замера — это append в deque фиксированной длины, поэтому
+    накладные расходы на горячем пути минимальны; сортировка выполняется
+    только при чтении перцентилей.
+    """
+
+    __slots__ = ("samples", "count", "total", "max")
+
+    def __init__(self, size: int = 1024):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentiles(self, points=(50, 95, 99)) -> Dict[str, float]:
+        """Перцентили по текущему окну замеров"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {f"p{p}": 0.0 for p in points}
+        last = len(ordered) - 1
+        return {f"p{p}": ordered[min(last, int(round(p / 100 * last)))] for p in points}
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+def read_rss() -> int:
+    """Текущий объем резидентной памяти процесса, байт"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдает килобайты, macOS — байты
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, ValueError):
+        return 0
+
+
+class Metrics:
+    """Замеры времени горячих путей бота и памяти процесса"""
+
+    def __init__(self, histogram_size: int = 1024):
+        """Инициализация
+
+        Args:
+            histogram_size: Сколько последних замеров хранить для перцентилей
+        """
+        self.histogram_size = histogram_size
+        self.histograms: Dict[str, RollingHistogram] = {}
+        self.memory_current = 0
+        self.memory_peak = 0
+
+    def record(self, name: str, seconds: float):
+        """Запись замера времени
+
+        Args:
+            name: Название участка (например, "process_message")
+            seconds: Длительность, сек
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = RollingHistogram(self.histogram_size)
+        histogram.add(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Контекстный менеджер для замера времени участка кода"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def sample_memory(self) -> int:
+        """Замер RSS процесса с обновлением пикового значения"""
+        self.memory_current = read_rss()
+        self.memory_peak = max(self.memory_peak, self.memory_current)
+        return self.memory_current
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Сводка по всем участкам в миллисекундах"""
+        result = {}
+        for name, histogram in sorted(self.histograms.items()):
+            entry = {key: round(value * 1000, 3) for key, value in histogram.percentiles().items()}
+            entry["mean"] = round(histogram.mean * 1000, 3)
+            entry["max"] = round(histogram.max * 1000, 3)
+            entry["count"] = histogram.count
+            result[name] = entry
+        return result
+
+    def update_stats(self, stats: Dict, response_key: str = "response"):
+        """Перенос замеров в раздел performance файла stats.json
+
+        Args:
+            stats: Словарь статистики (JsonManager.stats)
+            response_key: Участок, время которого считается временем ответа
+        """
+        self.sample_memory()
+        performance = stats.setdefault("performance", {})
+        response = self.histograms.get(response_key)
+        if response is not None:
+            performance["average_response_time"] = round(response.mean, 4)
+            performance["max_response_time"] = round(response.max, 4)
+        memory = performance.setdefault("memory_usage", {})
+        memory["current"] = self.memory_current
+        memory["peak"] = max(self.memory_peak, memory.get("peak", 0))
+        performance["timings_ms"] = self.summary()
+
+    def render(self) -> List[str]:
+        """Текстовое представление для команды !stats performance"""
+        self.sample_memory()
+        lines = [f"Память: {self.memory_current / 1048576:.1f} МБ (пик {self.memory_peak / 1048576:.1f} МБ)"]
+        for name, entry in self.summary().items():
+            lines.append(
+                f"{name}: p50 {entry['p50']} мс, p95 {entry['p95']} мс, "
+                f"p99 {entry['p99']} мс, max {entry['max']} мс ({entry['count']})"
+            )
+        return lines
@@ -0,0 +1,434 @@
+import os
+import random
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from corpus_store import CorpusStore
+from markov_engine import MarkovEngine
+from shared_store import SharedCorpusStore
+from vocabulary import TokenTable, VocabularyIndex
+
+logger = logging.getLogger('model_registry')
+
+# Во сколько раз журнал незагруженного раздела может превышать его окно перед компакцией
+COLD_COMPACT_FACTOR = 2
+
+# Оценка памяти раздела (замерено tracemalloc на корпусах с распределением Ципфа
+# от 2 до 100 тысяч слов, погрешность в пределах 5%):
+# слово окна — идентификатор в окне и смещение сообщения,
+# уникальное слово — запись частотного словаря и строка в общей таблице,
+# состояние цепи — ключ и переходы в словаре модели
+BYTES_PER_WORD = 20
+BYTES_PER_UNIQUE_WORD = 280
+BYTES_PER_STATE = 230
+
+
+class ModelPartition:
+    """Корпус, модель Маркова и частотный словарь одного раздела (глобальный, сервер или канал)"""
+
+    def __init__(self, key: str, filepath: str, max_words: int, state_size: int,
+                 table: TokenTable, store: Optional[CorpusStore] = None):
+        """Инициализация раздела
+
+        Args:
+            key: Ключ раздела
+            filepath: Путь к журналу корпуса раздела
+            max_words: Максимальный размер окна корпуса в словах
+            state_size: Размер состояния цепи Маркова
+            table: Общая для всех разделов таблица слов
+            store: Готовое хранилище окна (например, shared_store.SharedCorpusStore)
+        """
+        self.key = key
+        self.table = table
+        self.store = store if store is not None else CorpusStore(filepath, max_words=max_words, table=table)
+        self.engine = MarkovEngine(state_size=state_size, table=table)
+        self.vocabulary = VocabularyIndex(table)
+        # Изменения модели и генерация в фоновом потоке (reply_pool) взаимно исключают друг друга
+        self.lock = threading.RLock()
+        # Счетчик добавленных и вытесненных сообщений для определения устаревших ответов
+        self.version = 0
+
+    @property
+    def word_count(self) -> int:
+        return self.store.word_count
+
+    def load(self) -> int:
+        """Загрузка окна из журнала и построение модели
+
+        Returns:
+            Количество загруженных сообщений
+        """
+        with self.lock:
+            messages = self.store.load()
+            for ids in messages:
+                self._add(ids)
+            self.version += len(messages)
+        return len(messages)
+
+    def _add(self, ids: array):
+        """Учет сообщения, вошедшего в окно, в модели, словаре и таблице слов"""
+        self.engine.add_message(ids)
+        self.vocabulary.add(ids)
+        self.table.retain(ids)
+
+    def _remove(self, ids: array):
+        """Учет сообщения, покинувшего окно; слова без вхождений освобождаются таблицей"""
+        self.engine.remove_message(ids)
+        self.vocabulary.remove(ids)
+        self.table.release(ids)
+
+    def _release_window(self):
+        """Снятие вхождений всех слов окна перед его сбросом"""
+        for ids in self.store.messages():
+            self.table.release(ids)
+
+    def migrate(self, messages: List[str]):
+        """Заполнение раздела сообщениями из старого формата"""
+        with self.lock:
+            for ids in self.store.migrate(messages):
+                self._add(ids)
+                self.version += 1
+
+    def extend(self, messages: List[array]):
+        """Добавление сообщений в окно и модель без записи в журнал (см. CorpusStore.extend)"""
+        with self.lock:
+            evicted = self.store.extend(messages)
+            for ids in messages:
+                if ids:
+                    self._add(ids)
+            for old_ids in evicted:
+                self._remove(old_ids)
+            self.version += len(messages) + len(evicted)
+
+    def sync(self, fetched: Optional[Tuple[int, List[Tuple[int, str]]]] = None) -> int:
+        """Подтягивание сообщений других процессов из общего хранилища
+
+        Args:
+            fetched: Результат SharedCorpusStore.fetch, уже полученный в потоке
+                базы; None — прочитать здесь же
+
+        Returns:
+            Количество добавленных сообщений (0 для обычного журнала)
+        """
+        if not hasattr(self.store, "sync"):
+            return 0
+        with self.lock:
+            added, evicted = self.store.sync() if fetched is None else self.store.apply(*fetched)
+            for ids in added:
+                self._add(ids)
+            for old_ids in evicted:
+                self._remove(old_ids)
+            self.version += len(added) + len(evicted)
+        return len(added)
+
+    def add_message(self, text: str):
+        """Добавление сообщения в корпус и модель с вытеснением старых"""
+        with self.lock:
+            ids = self.table.encode(text)
+            evicted = self.store.append(ids)
+            if ids:
+                self._add(ids)
+            for old_ids in evicted:
+                self._remove(old_ids)
+            self.version += 1 + len(evicted)
+
+    def reload(self):
+        """Перечитывание окна из журнала (например, после восстановления копии)"""
+        with self.lock:
+            self._release_window()
+            self.store.close()
+            self.engine.clear()
+            self.vocabulary.clear()
+            self.load()
+            self.version += 1_000_000
+
+    def unload(self):
+        """Выгрузка раздела из памяти: журнал закрывается, слова окна освобождаются
+
+        Модель очищается, поэтому фоновая генерация по выгруженному
+        разделу (reply_pool) больше ничего не выдаст.
+        """
+        with self.lock:
+            self._release_window()
+            self.store.close()
+            self.engine.clear()
+            self.vocabulary.clear()
+            self.version += 1_000_000
+
+    def snapshot(self) -> Tuple[array, array]:
+        """Согласованная копия окна корпуса (см. CorpusStore.snapshot)"""
+        with self.lock:
+            return self.store.snapshot()
+
+    def estimated_bytes(self) -> int:
+        """Приблизительный объем памяти, занимаемый разделом (окно, словарь и модель)"""
+        return (self.store.word_count * BYTES_PER_WORD
+                + self.vocabulary.unique_words * BYTES_PER_UNIQUE_WORD
+                + len(self.engine.model) * BYTES_PER_STATE)
+
+    def close(self):
+        self.store.close()
+
+
+class ModelRegistry:
+    """Реестр корпусов и моделей по серверам и каналам
+
+    Глобальный раздел загружен всегда. Локальные разделы загружаются при
+    первом обращении и вытесняются по LRU, когда их суммарный оценочный
+    объем превышает бюджет памяти. Сообщения для незагруженных разделов
+    только дописываются в их журналы; реестр считает дописанные строки и
+    сжимает журнал до размера окна, когда он вырастает вдвое.
+    """
+
+    def __init__(self, base_dir: str, max_words: int = 10000, state_size: int = 2,
+                 per_channel: bool = False, memory_budget: int = 64 * 1024 * 1024,
+                 local_weight: float = 1.0, global_weight: float = 1.0,
+                 shared=None, origin: int = 0):
+        """Инициализация реестра
+
+        Args:
+            base_dir: Директория конфигурации; глобальный журнал — corpus.log,
+                локальные — в поддиректории corpora
+            max_words: Максимальный размер окна корпуса раздела в словах
+            state_size: Размер состояния цепи Маркова
+            per_channel: Разделять корпуса по каналам, а не только по серверам
+            memory_budget: Бюджет памяти на локальные разделы, байт
+            local_weight: Вес локальной модели при смешивании
+            global_weight: Вес глобальной модели при смешивании
+            shared: Общее хранилище шардов (shared_store.SharedStore); глобальный
+                корпус тогда хранится в нем, а не в corpus.log
+            origin: Номер шарда для записей в общее хранилище
+        """
+        self.base_dir = base_dir
+        self.corpora_dir = os.path.join(base_dir, "corpora")
+        os.makedirs(self.corpora_dir, exist_ok=True)
+        self.max_words = max_words
+        self.state_size = state_size
+        self.per_channel = per_channel
+        self.memory_budget = memory_budget
+        self.local_weight = local_weight
+        self.global_weight = global_weight
+        self.shared = shared
+        self.origin = origin
+
+        # Таблица слов общая для всех разделов: каждое слово хранится один раз
+        self.table = TokenTable()
+        self.global_partition = self.new_global_partition()
+        self._partitions: "OrderedDict[str, ModelPartition]" = OrderedDict()
+        self._memory_used = 0
+        # Незагруженные разделы: ключ -> [строк в журнале, строк в окне после компакции]
+        self._cold_logs: Dict[str, List[int]] = {}
+
+        # Счетчики для диагностики
+        self.loads = 0
+        self.evictions = 0
+
+    def key_for(self, guild_id: Optional[int], channel_id: Optional[int] = None) -> Optional[str]:
+        """Ключ локального раздела для сервера/канала
+
+        Returns:
+            Ключ раздела или None для личных сообщений
+        """
+        if guild_id is None:
+            return None
+        if self.per_channel and channel_id is not None:
+            return f"{guild_id}_{channel_id}"
+        return str(guild_id)
+
+    def _filepath(self, key: str) -> str:
+        return os.path.join(self.corpora_dir, f"{key}.log")
+
+    def get(self, key: str) -> ModelPartition:
+        """Локальный раздел с ленивой загрузкой и обновлением LRU-порядка
+
+        Args:
+            key: Ключ раздела из key_for
+        """
+        partition = self._partitions.get(key)
+        if partition is not None:
+            self._partitions.move_to_end(key)
+            return partition
+
+        partition = ModelPartition(key, self._filepath(key), self.max_words, self.state_size, self.table)
+        partition.load()
+        self._cold_logs.pop(key, None)
+        self._partitions[key] = partition
+        self._memory_used += partition.estimated_bytes()
+        self.loads += 1
+        self._evict()
+        return partition
+
+    def _evict(self):
+        """Вытеснение давно не используемых разделов при превышении бюджета"""
+        while self._memory_used > self.memory_budget and len(self._partitions) > 1:
+            key, partition = self._partitions.popitem(last=False)
+            self._memory_used -= partition.estimated_bytes()
+            partition.unload()
+            self._cold_logs[key] = [partition.store.file_lines, partition.store.message_count]
+            self.evictions += 1
+            logger.info(f"Раздел корпуса {key} выгружен из памяти")
+
+    def add_message(self, text: str, guild_id: Optional[int] = None,
+                    channel_id: Optional[int] = None):
+        """Добавление сообщения в глобальный и локальный разделы
+
+        Args:
+            text: Нормализованный текст сообщения
+            guild_id: Идентификатор сервера (None для личных сообщений)
+            channel_id: Идентификатор канала
+        """
+        self.global_partition.add_message(text)
+        key = self.key_for(guild_id, channel_id)
+        if key is None:
+            return
+        partition = self._partitions.get(key)
+        if partition is None:
+            # Раздел не загружен: только дозапись в журнал, окно построится при загрузке
+            filepath = self._filepath(key)
+            if CorpusStore.append_line(filepath, text):
+                self._count_cold_line(key, filepath)
+            return
+        before = partition.estimated_bytes()
+        partition.add_message(text)
+        self._memory_used += partition.estimated_bytes() - before
+        self._evict()
+
+    def _count_cold_line(self, key: str, filepath: str):
+        """Учет дописанной строки и компакция выросшего журнала незагруженного раздела"""
+        counts = self._cold_logs.get(key)
+        if counts is None:
+            # Размер окна неизвестен: первая же проверка сожмет журнал, если он велик
+            counts = self._cold_logs[key] = [CorpusStore.count_lines(filepath), 0]
+        else:
+            counts[0] += 1
+        if counts[0] > max(COLD_COMPACT_FACTOR * counts[1], 100):
+            kept = CorpusStore.compact_file(filepath, self.max_words)
+            if kept >= 0:
+                counts[:] = [kept, kept]
+
+    def choose(self, guild_id: Optional[int] = None,
+               channel_id: Optional[int] = None, min_words: int = 10) -> ModelPartition:
+        """Выбор раздела для генерации ответа с учетом весов
+
+        Локальная модель выбирается с вероятностью
+        local_weight / (local_weight + global_weight), если в ней достаточно слов.
+
+        Args:
+            guild_id: Идентификатор сервера
+            channel_id: Идентификатор канала
+            min_words: Минимальный размер локального корпуса для использования
+        """
+        key = self.key_for(guild_id, channel_id)
+        if key is None or self.local_weight <= 0:
+            # Без локальных весов раздел не нужен, и загружать его незачем
+            return self.global_partition
+        local = self.get(key)
+        if local.word_count < min_words:
+            return self.global_partition
+        total = self.local_weight + self.global_weight
+        if total <= 0 or random.random() * total < self.local_weight:
+            return local
+        return self.global_partition
+
+    def snapshot(self) -> Tuple[Dict[str, Tuple[array, array]], Dict[str, str]]:
+        """Копия корпусов всех разделов для резервного копирования
+
+        Returns:
+            Окна загруженных разделов и пути журналов незагруженных, по
+            относительным путям журналов ("corpus.log", "corpora/<ключ>.log")
+        """
+        windows = {"corpus.log": self.global_partition.snapshot()}
+        for key, partition in self._partitions.items():
+            windows[f"corpora/{key}.log"] = partition.snapshot()
+        files = {}
+        for filename in os.listdir(self.corpora_dir):
+            name = f"corpora/{filename}"
+            if filename.endswith(".log") and name not in windows:
+                files[name] = os.path.join(self.corpora_dir, filename)
+        return windows, files
+
+    def reload(self):
+        """Перечитывание журналов после их замены на диске
+
+        Глобальный раздел загружается заново сразу, локальные — при
+        следующем обращении.
+        """
+        for partition in self._partitions.values():
+            partition.unload()
+        self._partitions.clear()
+        self._memory_used = 0
+        self._cold_logs.clear()
+        filepath = os.path.join(self.base_dir, "corpus.log")
+        if self.shared is not None and os.path.exists(filepath):
+            # Восстановленный журнал заменяет общий корпус всех шардов
+            with open(filepath, 'r', encoding='utf-8') as f:
+                self.shared.replace_corpus((' '.join(line.split()) for line in f if line.strip()), self.origin)
+        self.global_partition.reload()
+
+    def new_global_partition(self) -> ModelPartition:
+        """Пустой глобальный раздел (для сборки новой модели, см. swap_global)"""
+        filepath = os.path.join(self.base_dir, "corpus.log")
+        store = None
+        if self.shared is not None:
+            store = SharedCorpusStore(self.shared, self.origin, filepath, self.max_words, self.table)
+        return ModelPartition("global", filepath, self.max_words, self.state_size, self.table, store)
+
+    def swap_global(self, partition: ModelPartition, since: int = 0) -> bool:
+        """Атомарная замена глобального раздела заранее собранным
+
+        Сообщения, пришедшие в текущее окно за время сборки, новее собранных
+        и добавляются после них, затем журнал переписывается содержимым
+        нового окна. Генерация в фоновом потоке, начатая по старому разделу,
+        завершается по нему же.
+
+        Args:
+            partition: Раздел из new_global_partition
+            since: Значение store.pushed текущего раздела на начало сборки
+
+        Returns:
+            False если пришедшие за время сборки сообщения сами заполняют
+            окно и собранное было бы вытеснено целиком (замена отменяется)
+        """
+        old = self.global_partition
+        with old.lock:
+            # Строки других шардов, еще не прочитанные здесь, иначе компакция их удалит
+            try:
+                old.sync()
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось дочитать общий корпус перед заменой: {e}")
+            recent = old.store.recent(since)
+            overflow = old.store.pushed - since > len(recent)
+            if overflow or sum(len(ids) for ids in recent) >= self.max_words:
+                logger.warning("За время сборки окно корпуса заполнилось новыми сообщениями, замена отменена")
+                partition.unload()
+                return False
+            built = partition.store.message_count
+            partition.extend(recent)
+            lost = built + len(recent) - partition.store.message_count
+            if lost:
+                logger.warning(f"Новые сообщения вытеснили из окна {lost} из {built} собранных")
+            old.unload()
+            partition.store.compact()
+            self.global_partition = partition
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Состояние реестра для диагностики"""
+        return {
+            "loaded": len(self._partitions),
+            "memory_used": self._memory_used,
+            "memory_budget": self.memory_budget,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "vocabulary": len(self.table),
+        }
+
+    def close(self):
+        """Закрытие журналов всех разделов"""
+        self.global_partition.close()
+        for partition in self._partitions.values():
+            partition.close()
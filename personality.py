@@ -0,0 +1,232 @@
+import random
+import re
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config_schema import MoodSettings, PersonalityConfig, ProfileSettings
+
+logger = logging.getLogger('personality')
+
+# Типы ответа на упоминание и соответствующие ключи response_preferences
+RESPONSE_TYPES = ("text", "static_image", "gif")
+PREFERENCE_KEYS = {"text": "text", "static_image": "image", "gif": "gif"}
+
+# Эмодзи, которые добавляются к текстовым ответам с вероятностью emoji_usage
+EMOJIS = ("😂", "🤔", "😎", "🐀", "💩", "🙃", "😏", "🔥", "👀", "🤡")
+
+
+class AliasSampler:
+    """Выборка из дискретного распределения за O(1) (метод Уолкера/Воуза)
+
+    Таблицы строятся один раз за O(n); каждая выборка — одно случайное число.
+    """
+
+    __slots__ = ("items", "probabilities", "aliases")
+
+    def __init__(self, items: Sequence, weights: Sequence[float]):
+        """Построение таблиц
+
+        Args:
+            items: Элементы
+            weights: Неотрицательные веса (хотя бы один положительный)
+        """
+        n = len(items)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("нужен хотя бы один элемент с положительным весом")
+        self.items = tuple(items)
+        self.probabilities = [0.0] * n
+        self.aliases = [0] * n
+        scaled = [weight * n / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Остатки из-за погрешности округления
+        for i in small + large:
+            self.probabilities[i] = 1.0
+
+    def sample(self):
+        u = random.random() * len(self.items)
+        i = int(u)
+        return self.items[i] if u - i < self.probabilities[i] else self.items[self.aliases[i]]
+
+
+class Profile:
+    """Профиль личности, подготовленный для выборки без пересчетов"""
+
+    __slots__ = ("key", "name", "raw", "mood", "randomness", "min_words", "max_words",
+                 "markov_probability", "emoji_probability", "_response_samplers", "_category_samplers")
+
+    def __init__(self, key: str, settings: ProfileSettings, raw: Dict,
+                 moods: Optional[Dict[str, MoodSettings]] = None):
+        """Подготовка профиля
+
+        randomness — доля равномерного распределения, подмешанного к
+        предпочтениям профиля: при 0 веса берутся как есть, при 100 все
+        варианты равновероятны. mood — настроение профиля: его категории
+        фраз чаще выбираются в ответ на слова-триггеры других настроений.
+
+        Args:
+            key: Ключ профиля в personality.json
+            settings: Проверенные параметры профиля (config_schema.ProfileSettings)
+            raw: Исходный словарь профиля (для буфера ответов)
+            moods: Настроения из personality.json
+        """
+        self.key = key
+        self.raw = raw
+        self.name = settings.name or key
+        self.mood = settings.mood
+        self.randomness = min(1.0, settings.randomness / 100)
+        self.min_words = settings.message_length.min_words
+        self.max_words = settings.message_length.max_words
+        self.markov_probability = settings.markov_usage / 100
+        self.emoji_probability = settings.emoji_usage / 100
+
+        # Отдельный сэмплер для каждого набора доступных типов ответа:
+        # (есть картинки, есть GIF) -> сэмплер, чтобы выборка оставалась O(1)
+        preferences = settings.response_preferences
+        self._response_samplers: Dict[Tuple[bool, bool], AliasSampler] = {}
+        for has_images in (False, True):
+            for has_gifs in (False, True):
+                available = [kind for kind in RESPONSE_TYPES
+                             if kind == "text"
+                             or (kind == "static_image" and has_images)
+                             or (kind == "gif" and has_gifs)]
+                weights = [max(0.0, float(preferences.get(PREFERENCE_KEYS[kind], 1))) for kind in available]
+                if sum(weights) <= 0:
+                    weights = [1.0] * len(available)
+                self._response_samplers[(has_images, has_gifs)] = AliasSampler(available, self._blend(weights))
+
+        # Категории фраз каждого настроения; категории настроения профиля весомее
+        moods = moods or {}
+        own = set(moods[self.mood].response_types) if self.mood in moods else set()
+        self._category_samplers: Dict[str, AliasSampler] = {}
+        for mood, mood_settings in moods.items():
+            categories = list(dict.fromkeys(mood_settings.response_types))
+            if categories:
+                weights = [2.0 if category in own else 1.0 for category in categories]
+                self._category_samplers[mood] = AliasSampler(categories, self._blend(weights))
+
+    def _blend(self, weights: List[float]) -> List[float]:
+        """Смешивание нормированных весов с равномерными в доле randomness"""
+        total = sum(weights)
+        uniform = self.randomness / len(weights)
+        return [(1.0 - self.randomness) * weight / total + uniform for weight in weights]
+
+    def response_type(self, has_images: bool, has_gifs: bool) -> str:
+        """Тип ответа по response_preferences среди доступных"""
+        return self._response_samplers[(has_images, has_gifs)].sample()
+
+    def mood_category(self, mood: str) -> Optional[str]:
+        """Категория responses.json для настроения с учетом настроения профиля"""
+        sampler = self._category_samplers.get(mood)
+        return sampler.sample() if sampler is not None else None
+
+    def use_markov(self) -> bool:
+        """Генерировать ли ответ цепью Маркова (markov_usage)"""
+        return random.random() < self.markov_probability
+
+    def decorate(self, text: str) -> str:
+        """Добавление эмодзи к ответу с вероятностью emoji_usage"""
+        if self.emoji_probability and random.random() < self.emoji_probability:
+            return f"{text} {random.choice(EMOJIS)}"
+        return text
+
+
+class PersonalityEngine:
+    """Профили личности и настроения из personality.json
+
+    Все профили и общее регулярное выражение для слов-триггеров настроений
+    собираются один раз при первом обращении. Активный профиль — одна
+    ссылка, поэтому переключение атомарно и ничего не перестраивает; если
+    словарь personality в JsonManager заменен (reload, восстановление копии),
+    все пересобирается при следующем обращении.
+    """
+
+    def __init__(self, json_manager):
+        """Инициализация
+
+        Args:
+            json_manager: Экземпляр JsonManager с файлом personality
+        """
+        self.json_manager = json_manager
+        self._source: Optional[PersonalityConfig] = None
+        self.profiles: Dict[str, Profile] = {}
+        self._active: Optional[Profile] = None
+        self._trigger_re: Optional[re.Pattern] = None
+        self._trigger_moods: Dict[str, str] = {}
+
+    @property
+    def active(self) -> Profile:
+        """Активный профиль (personality.json читается при первом обращении)"""
+        self.refresh()
+        return self._active
+
+    def refresh(self):
+        """Пересборка, если personality.json в JsonManager был перечитан или заменен"""
+        personality = self.json_manager.config("personality")
+        if personality is self._source:
+            return
+        self._source = personality
+        raw_profiles = self.json_manager.personality.get("profiles", {})
+        profiles = {}
+        for key, settings in personality.profiles.items():
+            raw = raw_profiles[key]
+            profiles[key] = Profile(key, settings, raw if isinstance(raw, dict) else {}, personality.moods)
+        if not profiles:
+            profiles = {"default": Profile("default", ProfileSettings(), {}, personality.moods)}
+
+        trigger_moods = {}
+        for mood, settings in personality.moods.items():
+            for word in settings.trigger_words:
+                trigger_moods.setdefault(word.lower(), mood)
+        if trigger_moods:
+            # Длинные слова первыми, чтобы альтернация не останавливалась на префиксе
+            alternatives = "|".join(re.escape(word) for word in sorted(trigger_moods, key=len, reverse=True))
+            self._trigger_re = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE)
+        else:
+            self._trigger_re = None
+        self._trigger_moods = trigger_moods
+
+        self.profiles = profiles
+        active = personality.active_profile
+        if active not in profiles:
+            logger.warning(f"Профиль {active} не найден, используется {next(iter(profiles))}")
+            active = next(iter(profiles))
+        self._active = profiles[active]
+
+    def switch(self, key: str) -> Profile:
+        """Смена активного профиля
+
+        Args:
+            key: Ключ профиля из personality.json
+
+        Raises:
+            KeyError: Профиль не найден
+        """
+        self.refresh()
+        profile = self.profiles[key]
+        previous = self._active
+        self._active = profile
+        self._source.active_profile = key
+        self.json_manager.personality["active_profile"] = key
+        self.json_manager.mark_dirty("personality")
+        logger.info(f"Профиль личности изменен: {previous.key} -> {key}")
+        return profile
+
+    def detect_mood(self, text: str) -> Optional[str]:
+        """Настроение по первому слову-триггеру в тексте или None"""
+        self.refresh()
+        if self._trigger_re is None:
+            return None
+        match = self._trigger_re.search(text)
+        return self._trigger_moods[match.group(0).lower()] if match else None
+
+    def mood_category(self, mood: str) -> Optional[str]:
+        """Категория responses.json для настроения (выборка активного профиля)"""
+        return self.active.mood_category(mood)
@@ -0,0 +1,181 @@
+import os
+import re
+import time
+import string
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('preprocessing')
+
+# Шаблоны приветствий/прощаний, которые не попадают в корпус, если в
+# filters.json не заданы свои ignore_patterns
+DEFAULT_IGNORE_PATTERNS = [
+    r'\bпривет\b', r'\bздравствуй\b', r'\bпока\b', r'\bдосвидания\b',
+    r'\bхай\b', r'\bхеллоу\b', r'\bбай\b', r'\bгудбай\b'
+]
+
+# Диапазон эмодзи, который раньше вырезала filter_emojis
+EMOJI_CLASS = '\U0001F000-\U0001FFFF'
+
+URL_PATTERN = r'(?:https?://|www\.)\S+'
+MENTION_PATTERN = r'<(?:@[!&]?|#)\d+>|@everyone|@here'
+CUSTOM_EMOJI_PATTERN = r'<a?:\w+:\d+>'
+
+# Подчеркивание между буквами/цифрами заменяется пробелом (как в normalize_text)
+UNDERSCORE_RE = re.compile(r'(?<=[а-яА-Яa-zA-Z0-9])_(?=[а-яА-Яa-zA-Z0-9])')
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation + '«»…—–')
+
+
+class MessagePreprocessor:
+    """Однопроходная предобработка сообщений перед добавлением в корпус
+
+    Все регулярные выражения собираются один раз из filters.json и
+    learning_config.json: одна альтернация разбивает сообщение на
+    токены (ссылки, упоминания, эмодзи, слова), вторая проверяет шаблоны
+    игнорирования и слова из черного списка. При изменении файлов на диске
+    конфигурация перечитывается и выражения пересобираются.
+    """
+
+    def __init__(self, json_manager, command_prefix: str = "!", reload_interval: float = 5.0):
+        """Инициализация препроцессора
+
+        Args:
+            json_manager: Экземпляр JsonManager с filters и learning_config
+            command_prefix: Префикс команд бота
+            reload_interval: Как часто проверять изменение файлов, сек
+        """
+        self.json_manager = json_manager
+        self.command_prefix = command_prefix
+        self.reload_interval = reload_interval
+        self._mtimes: Dict[str, float] = {}
+        self._last_check = 0.0
+        self.build()
+
+    def _file_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for name in ("filters", "learning_config"):
+            try:
+                mtimes[name] = os.path.getmtime(self.json_manager.files[name])
+            except OSError:
+                mtimes[name] = 0.0
+        return mtimes
+
+    def maybe_reload(self):
+        """Пересборка, если filters.json или learning_config.json изменились"""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        mtimes = self._file_mtimes()
+        changed = [name for name, mtime in mtimes.items() if mtime != self._mtimes.get(name)]
+        if not changed:
+            return
+        for name in changed:
+            self.json_manager.reload(name)
+        self.build()
+        logger.info(f"Фильтры сообщений перезагружены: {', '.join(changed)}")
+
+    def build(self):
+        """Сборка выражений из текущей конфигурации"""
+        self._mtimes = self._file_mtimes()
+        filters = self.json_manager.config("filters")
+        processing = self.json_manager.config("learning_config").message_processing
+
+        self.filter_urls = processing.filter_urls and not filters.url_handling.add_to_corpus
+        self.filter_mentions = processing.filter_mentions
+        self.filter_commands = processing.filter_commands
+        self.filter_emojis = processing.filter_emojis
+        self.normalize_case = processing.normalize_case
+        self.remove_punctuation = processing.remove_punctuation
+        self.min_length = processing.min_length if processing.min_length is not None else filters.min_message_length
+        self.max_length = processing.max_length if processing.max_length is not None else filters.max_message_length
+        self.ignore_users = {str(user).lower() for user in filters.ignore_users}
+
+        # Текстовые смайлики заменяются эмодзи и дальше обрабатываются как эмодзи
+        self.emoji_replacements: Dict[str, str] = filters.emoji_replacements
+        emoticons = sorted(self.emoji_replacements, key=len, reverse=True)
+
+        # Токенизатор: первая совпавшая группа определяет тип токена
+        parts = [
+            f'(?P<url>{URL_PATTERN})',
+            f'(?P<mention>{MENTION_PATTERN})',
+            f'(?P<emoji>{CUSTOM_EMOJI_PATTERN}|[{EMOJI_CLASS}]+)',
+        ]
+        if emoticons:
+            parts.append('(?P<emoticon>' + '|'.join(re.escape(e) for e in emoticons) + ')')
+        parts.append(f'(?P<word>[^\\s{EMOJI_CLASS}]+)')
+        self.token_re = re.compile('|'.join(parts))
+
+        # Шаблоны игнорирования и черный список — одна альтернация без учета регистра
+        ignore = list(DEFAULT_IGNORE_PATTERNS if filters.ignore_patterns is None else filters.ignore_patterns)
+        blacklist = [w for w in filters.blacklisted_words if w]
+        if blacklist:
+            ignore.append(r'\b(?:' + '|'.join(re.escape(w) for w in blacklist) + r')\b')
+        valid = []
+        for pattern in ignore:
+            try:
+                re.compile(pattern)
+                valid.append(f'(?:{pattern})')
+            except re.error as e:
+                logger.error(f"Некорректный шаблон фильтра {pattern!r}: {e}")
+        self.ignore_re = re.compile('|'.join(valid), re.IGNORECASE) if valid else None
+
+    def is_ignored_user(self, author) -> bool:
+        """Проверка, входит ли автор в filters.ignore_users (по имени или id)"""
+        if not self.ignore_users:
+            return False
+        return str(author.id) in self.ignore_users or author.name.lower() in self.ignore_users
+
+    def process(self, text: str) -> Optional[str]:
+        """Подготовка текста сообщения для корпуса
+
+        Args:
+            text: Исходный текст сообщения
+
+        Returns:
+            Нормализованный текст или None, если сообщение не должно попасть в корпус
+        """
+        if not text:
+            return None
+        if self.filter_commands and text.startswith(self.command_prefix):
+            return None
+
+        tokens: List[str] = []
+        for match in self.token_re.finditer(text):
+            kind = match.lastgroup
+            token = match.group()
+            if kind == "word":
+                if '_' in token:
+                    tokens.extend(UNDERSCORE_RE.sub(' ', token).split())
+                    continue
+            elif kind == "url":
+                if self.filter_urls:
+                    continue
+            elif kind == "mention":
+                if self.filter_mentions:
+                    continue
+            elif kind == "emoji":
+                if self.filter_emojis:
+                    continue
+            elif kind == "emoticon":
+                if self.filter_emojis:
+                    continue
+                token = self.emoji_replacements[token]
+            tokens.append(token)
+
+        if not tokens:
+            return None
+        result = ' '.join(tokens)
+        if self.ignore_re is not None and self.ignore_re.search(result):
+            return None
+        if self.normalize_case:
+            result = result.lower()
+        if self.remove_punctuation:
+            result = ' '.join(result.translate(PUNCTUATION_TABLE).split())
+        if not result:
+            return None
+        if self.min_length and len(result) < self.min_length:
+            return None
+        if self.max_length and len(result) > self.max_length:
+            return None
+        return result
@@ -0,0 +1,252 @@
+"""Офлайн-прогон конвейера обработки сообщений без подключения к Discord
+
+Сообщения из JSONL-журнала (или синтетические) превращаются в поддельные
+объекты discord.Message и прогоняются через DiscordBot.process_message.
+Отправка в Telegram и channel.send заменены заглушками, JsonManager
+работает во временной директории.
+
+Формат строки журнала:
+    {"author": "имя", "content": "текст", "mentions_bot": false,
+     "guild_id": 1, "channel_id": 10,
+     "attachments": [{"filename": "a.png", "size": 1024}]}
+
+Запуск:
+    python replay_benchmark.py --messages 5000
+    python replay_benchmark.py --log chat.jsonl --min-throughput 500 --max-p95-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from benchmarks import VOCABULARY
+
+# Конфигурация копируется во временную директорию, чтобы прогон ее не менял
+CONFIG_FILES = ["personality.json", "filters.json", "commands.json",
+                "learning_config.json", "scheduler.json"]
+
+
+class FakeChannel:
+    """Канал, который только считает отправленные сообщения"""
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.name = f"channel-{channel_id}"
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+
+class FakeAttachment:
+    def __init__(self, filename, size, channel_id):
+        self.filename = filename
+        self.size = size
+        self.url = f"https://cdn.discordapp.com/attachments/{channel_id}/0/{filename}"
+
+    async def read(self):
+        return b"\0" * self.size
+
+
+class FakeRelay:
+    """Заглушка TelegramRelay: считает сообщения, ничего не отправляет"""
+
+    def __init__(self):
+        self.texts = 0
+        self.media = 0
+
+    def send(self, text):
+        self.texts += 1
+        return True
+
+    def send_media(self, media):
+        self.media += len(media)
+        return True
+
+
+def synthetic_chat_log(count, seed=42, mention_rate=0.05, attachment_rate=0.02,
+                       guilds=3, channels_per_guild=3):
+    """Синтетический журнал чата в формате JSONL-записей"""
+    rng = random.Random(seed)
+    authors = [f"user{i}" for i in range(50)]
+    for _ in range(count):
+        guild_id = rng.randint(1, guilds)
+        record = {
+            "author": rng.choice(authors),
+            "content": ' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(2, 14))),
+            "mentions_bot": rng.random() < mention_rate,
+            "guild_id": guild_id,
+            "channel_id": guild_id * 100 + rng.randint(1, channels_per_guild),
+            "attachments": [],
+        }
+        if rng.random() < attachment_rate:
+            record["attachments"].append({
+                "filename": rng.choice(["pic.png", "photo.jpg", "funny.gif", "doc.pdf"]),
+                "size": rng.randint(10_000, 500_000),
+            })
+        yield record
+
+
+def read_chat_log(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_messages(records, bot_user):
+    """Поддельные discord.Message из записей журнала"""
+    channels = {}
+    authors = {}
+    messages = []
+    for record in records:
+        channel_id = record.get("channel_id", 1)
+        channel = channels.get(channel_id)
+        if channel is None:
+            channel = channels[channel_id] = FakeChannel(channel_id)
+        name = record.get("author", "user")
+        author = authors.get(name)
+        if author is None:
+            author = authors[name] = SimpleNamespace(id=len(authors) + 1000, name=name, bot=False)
+        guild_id = record.get("guild_id")
+        messages.append(SimpleNamespace(
+            author=author,
+            content=record.get("content", ""),
+            mentions=[bot_user] if record.get("mentions_bot") else [],
+            attachments=[FakeAttachment(a["filename"], a.get("size", 0), channel_id)
+                         for a in record.get("attachments", [])],
+            guild=SimpleNamespace(id=guild_id) if guild_id is not None else None,
+            channel=channel,
+        ))
+    return messages, channels
+
+
+def bytes_written() -> int:
+    """Байты, записанные процессом (Linux, /proc/self/io), или -1"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return -1
+
+
+def snapshot_files(directory):
+    """Время изменения всех файлов директории: путь -> mtime_ns"""
+    result = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            result[os.path.relpath(path, directory)] = os.stat(path).st_mtime_ns
+    return result
+
+
+async def replay(bot, messages, flush_interval):
+    """Прогон сообщений через process_message с фоновым сбросом JSON"""
+    bot.json_manager.flush_interval = flush_interval
+    autoflush = asyncio.create_task(bot.json_manager.run_autoflush())
+    start = time.perf_counter()
+    for message in messages:
+        with bot.metrics.timer("process_message"):
+            await bot.process_message(message)
+    elapsed = time.perf_counter() - start
+    # Ответы отправляются из очередей каналов с ограничением частоты
+    await bot.replies.stop()
+    autoflush.cancel()
+    try:
+        await autoflush
+    except asyncio.CancelledError:
+        pass
+    return elapsed
+
+
+def run(args) -> int:
+    from sewerdiscord import DiscordBot
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    records = list(read_chat_log(args.log) if args.log else synthetic_chat_log(args.messages))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for filename in CONFIG_FILES:
+            source = os.path.join(base_dir, filename)
+            if os.path.exists(source):
+                shutil.copy(source, tmp)
+
+        files_before = snapshot_files(tmp)
+        start = time.perf_counter()
+        bot = DiscordBot(config_dir=tmp)
+        init_time = time.perf_counter() - start
+        files_after = snapshot_files(tmp)
+        init_written = sorted(name for name, mtime in files_after.items() if files_before.get(name) != mtime)
+        bot.telegram = FakeRelay()
+        bot_user = SimpleNamespace(id=1, name="sewerbot", bot=True)
+        # У неподключенного клиента user берется из состояния соединения
+        bot.bot._connection.user = bot_user
+
+        # Прогрев корпуса, чтобы упоминания генерировали ответы, а не заглушку
+        warmup, _ = build_messages(synthetic_chat_log(args.warmup, seed=7, mention_rate=0), bot_user)
+        messages, channels = build_messages(records, bot_user)
+        asyncio.run(replay(bot, warmup, args.flush_interval))
+
+        bot.reply_pool.start()
+        bot.metrics.histograms.clear()
+        written_before = bytes_written()
+        elapsed = asyncio.run(replay(bot, messages, args.flush_interval))
+        written = bytes_written() - written_before if written_before >= 0 else -1
+        bot.reply_pool.stop()
+        bot.models.close()
+
+    summary = bot.metrics.summary()
+    throughput = len(messages) / elapsed if elapsed else 0.0
+    response = summary.get("response", {})
+    print(f"Запуск DiscordBot: {init_time * 1000:.1f} мс, "
+          f"записано файлов: {len(init_written)} {' '.join(init_written)}".rstrip())
+    print(f"Сообщений: {len(messages)}, время: {elapsed:.3f} с, {throughput:.0f} сообщений/с")
+    if response:
+        print(f"Ответы на упоминания ({response['count']}): p50 {response['p50']} мс, "
+              f"p95 {response['p95']} мс, p99 {response['p99']} мс")
+    if written >= 0:
+        print(f"Записано на диск: {written} байт, {written / max(len(messages), 1):.1f} байт/сообщение")
+    print(f"Отправлено в каналы: {sum(c.sent for c in channels.values())}, "
+          f"в Telegram: {bot.telegram.texts} текстов, {bot.telegram.media} вложений")
+    pool = bot.reply_pool.stats()
+    print(f"Буфер ответов: попаданий {pool['hits']}, промахов {pool['fallbacks']}, устаревших {pool['stale']}")
+    replies = bot.replies.stats()
+    print(f"Очередь ответов: отправлено {replies['sent']} (склеено {replies['coalesced']}), "
+          f"отброшено: переполнение {replies['dropped_full']}, устаревшие {replies['dropped_stale']}, "
+          f"пауза пользователя {replies['dropped_cooldown']}")
+    for name, entry in summary.items():
+        print(f"  {name}: p50 {entry['p50']} мс, p95 {entry['p95']} мс, p99 {entry['p99']} мс")
+
+    # Пороговые проверки для CI
+    failed = False
+    if args.min_throughput and throughput < args.min_throughput:
+        print(f"ОШИБКА: пропускная способность ниже {args.min_throughput} сообщений/с")
+        failed = True
+    if args.max_p95_ms and response and response["p95"] > args.max_p95_ms:
+        print(f"ОШИБКА: p95 ответа выше {args.max_p95_ms} мс")
+        failed = True
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", help="JSONL-журнал чата; без него используются синтетические сообщения")
+    parser.add_argument("--messages", type=int, default=5000, help="Количество синтетических сообщений")
+    parser.add_argument("--warmup", type=int, default=2000, help="Сообщений для прогрева корпуса")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="Период сброса JSON, сек")
+    parser.add_argument("--min-throughput", type=float, default=0, help="Минимум сообщений/с (0 — без проверки)")
+    parser.add_argument("--max-p95-ms", type=float, default=0, help="Максимум p95 ответа, мс (0 — без проверки)")
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
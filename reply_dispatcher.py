@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger('reply_dispatcher')
+
+# Ограничение Discord на длину сообщения
+DISCORD_MAX_MESSAGE_LENGTH = 2000
+
+
+class TokenBucket:
+    """Ведро токенов: не больше capacity отправок подряд и rate отправок в секунду"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Сколько ждать до появления токена, сек"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class PendingReply(NamedTuple):
+    """Ответ, ожидающий отправки"""
+    text: str
+    created: float
+    # Вызывается после успешной отправки (статистика, лог в Telegram)
+    on_sent: Optional[Callable[[], None]]
+
+
+class _ChannelState:
+    __slots__ = ("channel", "bucket", "pending", "worker")
+
+    def __init__(self, channel, bucket: TokenBucket):
+        self.channel = channel
+        self.bucket = bucket
+        self.pending: Deque[PendingReply] = deque()
+        self.worker: Optional[asyncio.Task] = None
+
+
+class ReplyDispatcher:
+    """Отправка ответов бота с ограничением частоты по каналам
+
+    Обработчик упоминания только кладет ответ в очередь канала и сразу
+    возвращается. Для каждого канала с ожидающими ответами работает задача,
+    которая отправляет их не чаще, чем позволяет ведро токенов канала, и
+    склеивает все накопившиеся ответы в одно сообщение. Ответы старше
+    max_age отбрасываются, общее число ожидающих ответов ограничено
+    max_queue. Отдельно действует пауза между ответами одному пользователю.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 5, max_queue: int = 100,
+                 max_age: float = 15.0, max_batch: int = 5, user_cooldown: float = 3.0,
+                 max_channels: int = 1024):
+        """Инициализация
+
+        Args:
+            rate: Сколько сообщений в секунду можно отправлять в один канал
+            burst: Сколько сообщений можно отправить в канал подряд без ожидания
+            max_queue: Максимальное число ожидающих ответов во всех каналах
+            max_age: Ответы, прождавшие дольше, отбрасываются, сек
+            max_batch: Сколько ответов можно склеить в одно сообщение
+            user_cooldown: Минимальная пауза между ответами одному пользователю, сек
+            max_channels: Сколько неактивных каналов хранить до очистки
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_age = max_age
+        self.max_batch = max_batch
+        self.user_cooldown = user_cooldown
+        self.max_channels = max_channels
+
+        self._channels: Dict[int, _ChannelState] = {}
+        self._last_reply: Dict[int, float] = {}
+        self.depth = 0
+
+        # Необязательный сборщик замеров (metrics.Metrics)
+        self.metrics = None
+
+        # Счетчики для диагностики
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.dropped_full = 0
+        self.dropped_stale = 0
+        self.dropped_cooldown = 0
+
+    def allow_user(self, user_id: int) -> bool:
+        """Проверка паузы между ответами пользователю (с отметкой ответа)
+
+        Args:
+            user_id: Идентификатор автора упоминания
+
+        Returns:
+            False если пользователю уже отвечали меньше user_cooldown секунд назад
+        """
+        if self.user_cooldown <= 0:
+            return True
+        now = time.monotonic()
+        last = self._last_reply.get(user_id)
+        if last is not None and now - last < self.user_cooldown:
+            self.dropped_cooldown += 1
+            return False
+        self._last_reply[user_id] = now
+        if len(self._last_reply) > 4096:
+            self._last_reply = {key: value for key, value in self._last_reply.items()
+                                if now - value < self.user_cooldown}
+        return True
+
+    def submit(self, channel, text: str, on_sent: Optional[Callable[[], None]] = None) -> bool:
+        """Постановка ответа в очередь канала
+
+        Args:
+            channel: Канал Discord
+            text: Текст ответа
+            on_sent: Вызывается после успешной отправки
+
+        Returns:
+            False если очередь переполнена и ответ отброшен
+        """
+        if self.depth >= self.max_queue:
+            self.dropped_full += 1
+            return False
+        state = self._channels.get(channel.id)
+        if state is None:
+            if len(self._channels) >= self.max_channels:
+                self._prune()
+            state = self._channels[channel.id] = _ChannelState(channel, TokenBucket(self.rate, self.burst))
+        state.pending.append(PendingReply(text[:DISCORD_MAX_MESSAGE_LENGTH], time.monotonic(), on_sent))
+        self.depth += 1
+        if state.worker is None:
+            state.worker = asyncio.create_task(self._run(state))
+        return True
+
+    def _prune(self):
+        """Удаление каналов без ожидающих ответов с полным ведром"""
+        now = time.monotonic()
+        for key, state in list(self._channels.items()):
+            if state.worker is None and not state.pending and state.bucket.full(now):
+                del self._channels[key]
+
+    def _batch(self, state: _ChannelState, now: float) -> List[PendingReply]:
+        """Извлечение пачки ответов для одного сообщения без устаревших"""
+        batch = []
+        length = 0
+        while state.pending and len(batch) < self.max_batch:
+            reply = state.pending[0]
+            if now - reply.created > self.max_age:
+                state.pending.popleft()
+                self.depth -= 1
+                self.dropped_stale += 1
+                continue
+            if batch and length + 1 + len(reply.text) > DISCORD_MAX_MESSAGE_LENGTH:
+                break
+            state.pending.popleft()
+            self.depth -= 1
+            batch.append(reply)
+            length += len(reply.text) + (1 if length else 0)
+        return batch
+
+    async def _run(self, state: _ChannelState):
+        """Отправка ответов одного канала, пока очередь не опустеет"""
+        try:
+            while state.pending:
+                wait = state.bucket.delay(time.monotonic())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                now = time.monotonic()
+                batch = self._batch(state, now)
+                if not batch:
+                    continue
+                state.bucket.take(now)
+                try:
+                    await state.channel.send("\n".join(reply.text for reply in batch))
+                except Exception as e:
+                    self.failed += len(batch)
+                    logger.error(f"Ошибка отправки ответа в канал {state.channel.id}: {e}")
+                    continue
+                self.sent += 1
+                self.coalesced += len(batch) - 1
+                if self.metrics is not None:
+                    self.metrics.record("reply_delay", time.monotonic() - batch[0].created)
+                for reply in batch:
+                    if reply.on_sent is not None:
+                        try:
+                            reply.on_sent()
+                        except Exception as e:
+                            logger.error(f"Ошибка обработчика отправленного ответа: {e}")
+        finally:
+            state.worker = None
+
+    async def stop(self, timeout: float = 10.0):
+        """Отправка оставшихся ответов и остановка задач каналов
+
+        Args:
+            timeout: Сколько ждать опустошения очередей, сек
+        """
+        workers = [state.worker for state in self._channels.values() if state.worker is not None]
+        if not workers:
+            return
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"Не удалось отправить {self.depth} ответов до остановки")
+        for state in self._channels.values():
+            self.depth -= len(state.pending)
+            state.pending.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.depth,
+            "channels": sum(1 for state in self._channels.values() if state.worker is not None),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "dropped_full": self.dropped_full,
+            "dropped_stale": self.dropped_stale,
+            "dropped_cooldown": self.dropped_cooldown,
+        }
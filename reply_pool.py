@@ -0,0 +1,173 @@
+import queue
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger('reply_pool')
+
+
+class _Pool:
+    """Готовые предложения для одного раздела и набора параметров"""
+
+    __slots__ = ("partition", "min_words", "max_words", "size", "sentences", "queued")
+
+    def __init__(self, partition, min_words: int, max_words: int, size: int):
+        self.partition = partition
+        self.min_words = min_words
+        self.max_words = max_words
+        self.size = size
+        # (предложение, версия раздела на момент генерации)
+        self.sentences: Deque[Tuple[str, int]] = deque()
+        self.queued = False
+
+
+class ReplyPool:
+    """Буфер заранее сгенерированных ответов
+
+    Фоновый поток держит для каждого раздела (сервер/канал) и профиля
+    личности небольшой запас предложений, поэтому ответ на упоминание
+    берется из буфера за O(1), а не генерируется сотнями попыток на месте.
+    Предложения, сгенерированные до существенного изменения корпуса,
+    отбрасываются как устаревшие.
+    """
+
+    def __init__(self, max_pools: int = 64, stale_fraction: float = 0.25, stale_min: int = 50,
+                 max_chars: int = 100, tries: int = 100):
+        """Инициализация буфера
+
+        Args:
+            max_pools: Максимальное количество буферов (LRU)
+            stale_fraction: Доля окна корпуса, после изменения которой ответы устаревают
+            stale_min: Минимальное число изменений корпуса для устаревания
+            max_chars: Максимальная длина предложения
+            tries: Количество попыток генерации одного предложения
+        """
+        self.max_pools = max_pools
+        self.stale_fraction = stale_fraction
+        self.stale_min = stale_min
+        self.max_chars = max_chars
+        self.tries = tries
+
+        self._pools: "OrderedDict[Tuple[str, str], _Pool]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._requests: "queue.Queue[Optional[_Pool]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        # Счетчики для диагностики
+        self.hits = 0
+        self.fallbacks = 0
+        self.stale = 0
+        self.generated = 0
+
+    def start(self):
+        """Запуск фонового потока пополнения"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reply-pool", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Остановка фонового потока"""
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @staticmethod
+    def pool_size(profile: Dict) -> int:
+        """Размер буфера по доле ответов цепью Маркова в профиле"""
+        markov_usage = profile.get("markov_usage", 50)
+        return max(2, round(16 * markov_usage / 100))
+
+    def _pool(self, partition, profile_name: str, profile: Dict) -> _Pool:
+        key = (partition.key, profile_name)
+        length = profile.get("message_length", {})
+        min_words = length.get("min_words", 2)
+        max_words = length.get("max_words", 10)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None or pool.partition is not partition:
+                # Новый буфер или раздел был выгружен и загружен заново
+                pool = self._pools[key] = _Pool(partition, min_words, max_words, self.pool_size(profile))
+                while len(self._pools) > self.max_pools:
+                    self._pools.popitem(last=False)
+            else:
+                self._pools.move_to_end(key)
+            return pool
+
+    def _is_stale(self, partition, version: int) -> bool:
+        threshold = max(self.stale_min, int(partition.store.message_count * self.stale_fraction))
+        return partition.version - version > threshold
+
+    def take(self, partition, profile_name: str, profile: Dict) -> Optional[str]:
+        """Готовый ответ из буфера или None, если буфер пуст
+
+        Args:
+            partition: Раздел модели (model_registry.ModelPartition)
+            profile_name: Имя активного профиля личности
+            profile: Параметры профиля из personality.json
+        """
+        pool = self._pool(partition, profile_name, profile)
+        sentence = None
+        while pool.sentences:
+            try:
+                candidate, version = pool.sentences.popleft()
+            except IndexError:
+                break
+            if self._is_stale(partition, version):
+                self.stale += 1
+                continue
+            sentence = candidate
+            break
+        if sentence is None:
+            self.fallbacks += 1
+        else:
+            self.hits += 1
+        self._request(pool)
+        return sentence
+
+    def _request(self, pool: _Pool):
+        """Постановка буфера в очередь на пополнение"""
+        if not pool.queued and len(pool.sentences) < pool.size:
+            pool.queued = True
+            self._requests.put(pool)
+
+    def _run(self):
+        """Цикл фонового пополнения буферов"""
+        while True:
+            pool = self._requests.get()
+            if pool is None:
+                return
+            try:
+                self._refill(pool)
+            except Exception as e:
+                logger.error(f"Ошибка пополнения буфера ответов: {e}")
+            finally:
+                pool.queued = False
+
+    def _refill(self, pool: _Pool):
+        partition = pool.partition
+        failures = 0
+        while len(pool.sentences) < pool.size and failures < 3:
+            # Блокировка берется на одно предложение, чтобы не задерживать
+            # добавление сообщений в цикле событий
+            with partition.lock:
+                if partition.word_count < 10:
+                    return
+                sentence = partition.engine.make_short_sentence(
+                    max_chars=self.max_chars,
+                    max_words=pool.max_words,
+                    min_words=pool.min_words,
+                    tries=self.tries
+                )
+                version = partition.version
+            if sentence is None:
+                failures += 1
+                continue
+            pool.sentences.append((sentence, version))
+            self.generated += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий и промахов буфера"""
+        return {"hits": self.hits, "fallbacks": self.fallbacks,
+                "stale": self.stale, "generated": self.generated, "pools": len(self._pools)}
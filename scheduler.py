@@ -0,0 +1,185 @@
+import asyncio
+import datetime
+import heapq
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+logger = logging.getLogger('scheduler')
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Обработчик действия: получает parameters из scheduler.json
+ActionHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class TaskScheduler:
+    """Планировщик задач из scheduler.json
+
+    Время следующего запуска задач хранится в куче, поэтому цикл спит ровно
+    до ближайшей задачи, а не опрашивает список. Каждая задача выполняется
+    с ограничением settings.max_task_duration и повторяется до
+    settings.retries раз. Время следующего запуска записывается в
+    scheduler.json до выполнения задачи, так что перезапуск бота не
+    приводит к повторному срабатыванию.
+    """
+
+    def __init__(self, json_manager, notify: Optional[Callable[[str], None]] = None):
+        """Инициализация планировщика
+
+        Args:
+            json_manager: Экземпляр JsonManager с конфигурацией scheduler
+            notify: Функция отправки уведомлений об ошибках (например, в Telegram)
+        """
+        self.json_manager = json_manager
+        self.notify = notify
+        self.handlers: Dict[str, ActionHandler] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._wakeup = asyncio.Event()
+        self._running: Dict[str, asyncio.Task] = {}
+
+        settings = self.json_manager.config("scheduler").settings
+        self.retries = settings.retries
+        self.retry_delay = settings.retry_delay
+        self.max_task_duration = settings.max_task_duration
+        self.timezone = self._load_timezone(settings.timezone)
+
+    @staticmethod
+    def _load_timezone(name: Optional[str]) -> datetime.tzinfo:
+        if name and ZoneInfo is not None:
+            try:
+                return ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                logger.warning(f"Часовой пояс {name} не найден, используется UTC")
+        return datetime.timezone.utc
+
+    @property
+    def tasks(self) -> Dict[str, Dict[str, Any]]:
+        return self.json_manager.config("scheduler").tasks
+
+    def register(self, action_type: str, handler: ActionHandler):
+        """Регистрация обработчика для action.type
+
+        Args:
+            action_type: Тип действия из scheduler.json (backup, clean, ...)
+            handler: Корутина, принимающая parameters действия
+        """
+        self.handlers[action_type] = handler
+
+    def _now(self) -> datetime.datetime:
+        return datetime.datetime.now(self.timezone)
+
+    def next_run_after(self, task: Dict[str, Any], after: datetime.datetime) -> datetime.datetime:
+        """Время следующего запуска задачи после заданного момента
+
+        Задачи с time_of_day запускаются в это время в подходящие дни
+        (days или day_of_week), остальные — через interval секунд.
+        """
+        time_of_day = task.get("time_of_day")
+        if not time_of_day:
+            return after + datetime.timedelta(seconds=task.get("interval", 3600))
+
+        hour, minute = (int(part) for part in time_of_day.split(":"))
+        days = task.get("days") or ([task["day_of_week"]] if task.get("day_of_week") else WEEKDAYS)
+        allowed = {WEEKDAYS.index(day.lower()) for day in days if day.lower() in WEEKDAYS}
+        candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= after:
+            candidate += datetime.timedelta(days=1)
+        for _ in range(8):
+            if not allowed or candidate.weekday() in allowed:
+                break
+            candidate += datetime.timedelta(days=1)
+        return candidate
+
+    def _schedule(self, name: str, when: datetime.datetime):
+        self.tasks[name]["next_run"] = when.isoformat()
+        self.json_manager.mark_dirty("scheduler")
+        heapq.heappush(self._heap, (when.timestamp(), name))
+        self._wakeup.set()
+
+    def load(self):
+        """Заполнение кучи из scheduler.json с учетом сохраненного next_run"""
+        self._heap.clear()
+        now = self._now()
+        for name, task in self.tasks.items():
+            if not task.get("enabled", False):
+                continue
+            when = None
+            if task.get("next_run"):
+                try:
+                    when = datetime.datetime.fromisoformat(task["next_run"])
+                    if when.tzinfo is None:
+                        when = when.replace(tzinfo=self.timezone)
+                except ValueError:
+                    logger.warning(f"Некорректный next_run у задачи {name}: {task['next_run']}")
+            if when is None:
+                when = self.next_run_after(task, now)
+            heapq.heappush(self._heap, (when.timestamp(), name))
+        logger.info(f"Загружено задач планировщика: {len(self._heap)}")
+
+    async def run(self):
+        """Основной цикл: сон до ближайшей задачи и ее запуск"""
+        self.load()
+        try:
+            while True:
+                if not self._heap:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                timestamp, name = self._heap[0]
+                delay = timestamp - self._now().timestamp()
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                heapq.heappop(self._heap)
+                task = self.tasks.get(name)
+                if task is None or not task.get("enabled", False):
+                    continue
+                # Следующий запуск сохраняем до выполнения задачи
+                self._schedule(name, self.next_run_after(task, self._now()))
+                if name in self._running:
+                    logger.warning(f"Задача {name} еще выполняется, запуск пропущен")
+                    continue
+                job = asyncio.create_task(self._execute(name, task))
+                self._running[name] = job
+                job.add_done_callback(lambda _, name=name: self._running.pop(name, None))
+        finally:
+            for job in list(self._running.values()):
+                job.cancel()
+
+    async def _execute(self, name: str, task: Dict[str, Any]) -> bool:
+        """Выполнение задачи с ограничением времени и повторными попытками"""
+        action = task.get("action", {})
+        handler = self.handlers.get(action.get("type"))
+        if handler is None:
+            logger.warning(f"Нет обработчика для действия {action.get('type')} задачи {name}")
+            return False
+
+        for attempt in range(1, self.retries + 1):
+            try:
+                await asyncio.wait_for(handler(action.get("parameters", {})), self.max_task_duration)
+                logger.info(f"Задача {name} выполнена")
+                return True
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                error = f"превышено время выполнения ({self.max_task_duration} с)"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            logger.error(f"Ошибка задачи {name} (попытка {attempt}/{self.retries}): {error}")
+            if attempt < self.retries:
+                await asyncio.sleep(self.retry_delay)
+
+        telegram = self.json_manager.config("scheduler").notifications.telegram
+        if self.notify and telegram.enabled and "error" in telegram.levels:
+            self.notify(f"Задача планировщика {name} не выполнена: {error}")
+        return False
@@ -1,14 +1,32 @@
 import discord
 from discord.ext import commands
-import markovify
+import asyncio
+import heapq
+import multiprocessing
 import random
-import re
-import requests
 import os
+import sqlite3
+import time
 import datetime
-from tenacity import retry, stop_after_attempt, wait_fixed
 import logging
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
 from json_manager import JsonManager
+from audit_cache import AuditLogCache
+from backup import BackupManager
+from bootstrap import CorpusBootstrap
+from generation_pool import GenerationPool
+from markov_engine import SENTENCE_SPLIT_RE
+from model_registry import ModelRegistry
+from personality import PersonalityEngine
+from preprocessing import MessagePreprocessor
+from scheduler import TaskScheduler
+from shared_store import SharedStore
+from metrics import Metrics
+from reply_dispatcher import ReplyDispatcher
+from reply_pool import ReplyPool
+from telegram_relay import TelegramMedia, TelegramRelay
+from vocabulary import UserWordWindow
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, 
@@ -20,32 +38,84 @@ logger = logging.getLogger('discord_bot')
 class DiscordBot:
     """Класс для управления Discord ботом с интеграцией JsonManager"""
     
-    def __init__(self):
-        # Инициализация JsonManager
-        self.json_manager = JsonManager()
+    def __init__(self, config_dir="config", shard_ids=None, shard_count=None):
+        """Инициализация бота
+        
+        Args:
+            config_dir: Директория с JSON-файлами и журналами корпуса
+            shard_ids: Шарды Discord этого процесса (режим нескольких процессов)
+            shard_count: Общее число шардов; если задано, корпус, статистика
+                и медиа хранятся в общей базе shared.db
+        """
+        # Замеры времени горячих путей и памяти (раздел performance в stats.json)
+        self.metrics = Metrics()
+        # Отсчет холодного запуска до on_ready
+        self._started = time.perf_counter()
         
-        # Получение токенов из JsonManager
-        self.DISCORD_TOKEN = self.json_manager.tokens.get("DISCORD_TOKEN", "")
-        self.TELEGRAM_TOKEN = self.json_manager.tokens.get("TELEGRAM_TOKEN", "")
-        self.TELEGRAM_CHAT_ID = self.json_manager.tokens.get("TELEGRAM_CHAT_ID", "")
+        # Инициализация JsonManager
+        self.json_manager = JsonManager(config_dir)
+        self.json_manager.metrics = self.metrics
         
-        # Если токены отсутствуют, используем заглушки (только для разработки)
+        # Получение токенов из JsonManager (файл не перезаписывается)
+        tokens = self.json_manager.config("tokens")
+        self.DISCORD_TOKEN = tokens.DISCORD_TOKEN
+        self.TELEGRAM_TOKEN = tokens.TELEGRAM_TOKEN
+        self.TELEGRAM_CHAT_ID = tokens.TELEGRAM_CHAT_ID
         if not all([self.DISCORD_TOKEN, self.TELEGRAM_TOKEN, self.TELEGRAM_CHAT_ID]):
-            self.DISCORD_TOKEN = ''
-            self.TELEGRAM_TOKEN = ''
-            self.TELEGRAM_CHAT_ID = ''
-            # Обновляем токены в JsonManager
-            self.json_manager.tokens = {
-                "DISCORD_TOKEN": self.DISCORD_TOKEN,
-                "TELEGRAM_TOKEN": self.TELEGRAM_TOKEN,
-                "TELEGRAM_CHAT_ID": self.TELEGRAM_CHAT_ID
-            }
-            self.json_manager._save_json(self.json_manager.tokens, self.json_manager.files["tokens"])
+            logger.warning(f"Не все токены заданы в {self.json_manager.files['tokens']}")
+        
+        # Фоновая пересылка логов в Telegram
+        self.telegram = TelegramRelay(self.TELEGRAM_TOKEN, self.TELEGRAM_CHAT_ID)
+        self.telegram.metrics = self.metrics
         
         # Получение данных бота из JsonManager
-        self.text_corpus = self.json_manager.bot_data.get("text_corpus", "")
+        learning_config = self.json_manager.config("learning_config")
+        
+        # Режим шардов: главный процесс (с шардом 0) ведет stats.json,
+        # bot_data.json и планировщик, остальные передают приращения через базу
+        self.shard_ids = shard_ids
+        self.primary = not shard_ids or 0 in shard_ids
+        self.shared = None
+        self.stat_deltas = None
+        # Ссылки на медиа, еще не записанные в общую базу (вид, ссылка)
+        self._media_outbox = []
+        self._trim_mark = 0
+        if shard_count:
+            self.shared = SharedStore(os.path.join(self.json_manager.config_dir, "shared.db"))
+            if not self.primary:
+                self.json_manager.readonly.update({"stats", "bot_data"})
+                self.stat_deltas = Counter()
+        
+        partitioning = learning_config.partitioning
+        self.models = ModelRegistry(
+            self.json_manager.config_dir,
+            max_words=learning_config.corpus.max_size,
+            state_size=learning_config.markovify.state_size,
+            per_channel=partitioning.per_channel,
+            memory_budget=int(partitioning.memory_budget_mb * 1024 * 1024),
+            local_weight=learning_config.weights.channel_specific if partitioning.enabled else 0.0,
+            global_weight=partitioning.global_weight,
+            shared=self.shared,
+            origin=shard_ids[0] if shard_ids else 0
+        )
+        self.load_corpus()
+        
+        # Резервные копии JSON-файлов и корпусов (команда !backup и задача backup)
+        self.backups = BackupManager(
+            self.json_manager, self.models,
+            max_count=learning_config.corpus.backup_max_count
+        )
+        self.backups.metrics = self.metrics
+        # Медиа сериализуются только при отложенной записи, а не на каждое сообщение
+        self.json_manager.add_flush_hook(self.sync_bot_data)
+        # Окно слов по пользователям (words.by_user), ведет главный процесс
+        self._user_words = None
+        if self.primary:
+            self.json_manager.add_flush_hook(self.sync_user_words)
         self.static_images = self.json_manager.bot_data.get("static_images", [])
         self.gifs = self.json_manager.bot_data.get("gifs", [])
+        if self.shared is not None:
+            self.load_shared_media()
         
         # Настройка бота Discord
         intents = discord.Intents.default()
@@ -54,52 +124,410 @@ class DiscordBot:
         intents.messages = True
         intents.members = True
         intents.guilds = True
-        self.bot = commands.Bot(command_prefix='!', intents=intents)
+        if shard_count:
+            self.bot = commands.AutoShardedBot(command_prefix='!', intents=intents,
+                                               shard_ids=shard_ids, shard_count=shard_count)
+        else:
+            self.bot = commands.Bot(command_prefix='!', intents=intents)
         
-        # Список часто встречающихся шаблонов приветствий/прощаний для фильтрации
-        self.common_patterns = [
-            r'\bпривет\b', r'\bздравствуй\b', r'\bпока\b', r'\bдосвидания\b', 
-            r'\bхай\b', r'\bхеллоу\b', r'\bбай\b', r'\bгудбай\b'
-        ]
+        # Буфер заранее сгенерированных ответов на упоминания
+        self.reply_pool = ReplyPool()
+        
+        # Очереди ответов по каналам с ограничением частоты отправки
+        replies = learning_config.replies
+        self.replies = ReplyDispatcher(
+            rate=replies.channel_rate,
+            burst=replies.channel_burst,
+            max_queue=replies.max_queue,
+            max_age=replies.max_age,
+            max_batch=replies.max_batch,
+            user_cooldown=replies.user_cooldown
+        )
+        self.replies.metrics = self.metrics
+        
+        # В режиме шардов генерация по глобальной модели идет в отдельных процессах
+        sharding = learning_config.sharding
+        self.sync_interval = sharding.sync_interval
+        self.busy_timeout = sharding.busy_timeout
+        self.generator = None
+        if self.shared is not None and sharding.generation_processes:
+            self.generator = GenerationPool(
+                self.shared.path,
+                max_words=learning_config.corpus.max_size,
+                state_size=learning_config.markovify.state_size,
+                processes=sharding.generation_processes
+            )
+        
+        # Профили личности и настроения из personality.json
+        self.personality = PersonalityEngine(self.json_manager)
+        
+        # Общий кэш журнала аудита для обработчиков изменений сервера
+        self.audit_cache = AuditLogCache()
+        
+        # Предобработка сообщений, собранная из filters.json и learning_config.json
+        self.preprocessor = MessagePreprocessor(
+            self.json_manager,
+            command_prefix=self.json_manager.config("commands").prefix
+        )
+        
+        # Начальное заполнение корпуса из внешнего файла и истории каналов
+        self.bootstrap = CorpusBootstrap(self.json_manager, self.models, self.preprocessor)
         
-        # Настройка обработчиков событий
+        # Планировщик задач из scheduler.json
+        self.scheduler = TaskScheduler(self.json_manager, notify=self.send_to_telegram)
+        self.setup_scheduler()
+        self._uptime_mark = time.monotonic()
+        
+        # Настройка обработчиков событий и команд
         self.setup_event_handlers()
+        self.setup_commands()
         
         # Обновление статистики
         self.update_stats_on_start()
+        self.metrics.record("init", time.perf_counter() - self._started)
         
-    def update_bot_data(self):
-        """Обновление данных бота в JsonManager"""
-        self.json_manager.bot_data["text_corpus"] = self.text_corpus
+    def load_corpus(self):
+        """Восстановление глобального корпуса из журнала и построение модели"""
+        loaded = self.models.global_partition.load()
+        legacy_corpus = self.json_manager.bot_data.get("text_corpus", "")
+        if not loaded and legacy_corpus:
+            # Перенос корпуса из старого формата (одна строка в bot_data.json)
+            self.models.global_partition.migrate(SENTENCE_SPLIT_RE.split(legacy_corpus))
+            self.json_manager.bot_data["text_corpus"] = ""
+            self.json_manager.mark_dirty("bot_data")
+            logger.info(f"Корпус перенесен в {self.models.global_partition.store.filepath}")
+    
+    def add_to_corpus(self, text, guild_id=None, channel_id=None):
+        """Добавление сообщения в глобальный и локальный корпуса"""
+        with self.metrics.timer("corpus_update"):
+            if self.models.local_weight > 0:
+                self.models.add_message(text, guild_id, channel_id)
+            else:
+                self.models.global_partition.add_message(text)
+    
+    def load_shared_media(self):
+        """Списки медиа из общей базы; при первом запуске туда переносится bot_data.json"""
+        for kind, media in (("image", self.static_images), ("gif", self.gifs)):
+            if self.primary and media and not self.shared.media(kind):
+                self.shared.replace_media(kind, media)
+        self.static_images = self.shared.media("image")
+        self.gifs = self.shared.media("gif")
+    
+    def remember_media(self, kind, url):
+        """Запоминание ссылки на картинку ("image") или GIF ("gif"), хранится 50 последних"""
+        media = self.static_images if kind == "image" else self.gifs
+        media.append(url)
+        if len(media) > 50:
+            media.pop(0)
+        if self.shared is not None:
+            # Запишется в общую базу на ближайшем такте обмена
+            self._media_outbox.append((kind, url))
+        self.update_bot_data()
+    
+    def _exchange_shared(self, store, last_id, epoch, texts, media, deltas):
+        """Запись пачки изменений шарда и чтение чужих (выполняется в потоке базы)
+        
+        Returns:
+            (результат SharedCorpusStore.fetch, картинки, GIF, слитые
+            счетчики) или None, если запись прошла, а чтение — нет
+        """
+        self.shared.write_batch(store.origin, texts, media, deltas)
+        try:
+            fetched = store.fetch(last_id, epoch)
+            images = self.shared.media("image")
+            gifs = self.shared.media("gif")
+            counters = {}
+            if self.primary:
+                counters = self.shared.drain_counters()
+                # Строки, вытесненные из окон всех шардов, больше не нужны
+                top = self.shared.last_id()
+                if top - self._trim_mark > 1000:
+                    self.shared.trim(self.models.max_words * 2)
+                    self._trim_mark = top
+            return fetched, images, gifs, counters
+        except sqlite3.Error as e:
+            # Пачка уже записана, повторять ее нельзя
+            logger.error(f"Ошибка чтения общей базы: {e}")
+            return None
+    
+    async def sync_shared(self):
+        """Обмен состоянием с другими шардами через общую базу
+        
+        Запросы выполняются в потоке базы (SharedStore.submit), в цикле
+        событий остаются только сбор пачки и применение результата.
+        """
+        store = self.models.global_partition.store
+        texts = store.take_outbox()
+        media, self._media_outbox = self._media_outbox, []
+        deltas = self.stat_deltas
+        if deltas is not None:
+            self.stat_deltas = Counter()
+        future = self.shared.submit(self._exchange_shared, store, store.last_id, store.epoch,
+                                    texts, media, deltas)
+        try:
+            result = await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            # Пачка уже в потоке базы: дожидаемся ее, чтобы не потерять и не повторить
+            try:
+                result = future.result()
+            except sqlite3.Error:
+                result = None
+            if result is not None:
+                self._apply_shared(store, *result)
+            raise
+        except sqlite3.Error:
+            store.requeue(texts)
+            self._media_outbox[:0] = media
+            if deltas:
+                self.stat_deltas.update(deltas)
+            raise
+        if result is not None:
+            self._apply_shared(store, *result)
+    
+    def _apply_shared(self, store, fetched, images, gifs, counters):
+        """Применение прочитанного в потоке базы состояния других шардов"""
+        with self.metrics.timer("shared_sync"):
+            # Сообщения других шардов в глобальную модель
+            if store is self.models.global_partition.store:
+                self.models.global_partition.sync(fetched)
+            # Ссылки этого шарда, добавленные после сбора пачки, еще не в базе
+            for kind, url in self._media_outbox:
+                (images if kind == "image" else gifs).append(url)
+            images, gifs = images[-50:], gifs[-50:]
+            if images != self.static_images or gifs != self.gifs:
+                self.static_images = images
+                self.gifs = gifs
+                self.update_bot_data()
+            for path, value in counters.items():
+                self._apply_stat(path, value)
+    
+    async def run_shared_sync(self):
+        """Периодический обмен состоянием с другими шардами"""
+        try:
+            while True:
+                await asyncio.sleep(self.sync_interval)
+                try:
+                    await self.sync_shared()
+                except sqlite3.Error as e:
+                    logger.error(f"Ошибка обмена с общей базой: {e}")
+        finally:
+            # Непереданные сообщения, медиа и статистика не теряются при остановке
+            store = self.models.global_partition.store
+            media, self._media_outbox = self._media_outbox, []
+            try:
+                self.shared.submit(self.shared.write_batch, store.origin, store.take_outbox(),
+                                   media, self.stat_deltas).result()
+                if self.stat_deltas:
+                    self.stat_deltas.clear()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи в общую базу: {e}")
+    
+    def sync_bot_data(self):
+        """Перенос актуальных данных бота в JsonManager перед записью"""
+        if not self.json_manager.is_dirty("bot_data"):
+            return
         self.json_manager.bot_data["static_images"] = self.static_images
         self.json_manager.bot_data["gifs"] = self.gifs
-        self.json_manager._save_json(self.json_manager.bot_data, self.json_manager.files["bot_data"])
+    
+    def user_words(self):
+        """Окно слов по пользователям поверх текущего stats.json
+        
+        Пересоздается, если файл заменили (например, восстановлением копии).
+        """
+        words_stats = self.json_manager.stats["words"]
+        if self._user_words is None or self._user_words.counts is not words_stats.get("by_user"):
+            self._user_words = UserWordWindow(words_stats, self.models.max_words)
+        return self._user_words
+    
+    def sync_user_words(self):
+        """Перенос окна слов по пользователям в stats.json перед записью"""
+        if self._user_words is not None and self.json_manager.is_dirty("stats"):
+            self.user_words().update_stats(self.json_manager.stats["words"])
+    
+    def update_bot_data(self):
+        """Пометка данных бота как измененных (запись выполняется отложенно)"""
+        self.json_manager.mark_dirty("bot_data")
     
     def update_stats_on_start(self):
         """Обновление статистики при запуске бота"""
         # Увеличиваем счетчик перезапусков
-        self.json_manager.stats["general"]["restarts"] += 1
-        self.json_manager._save_json(self.json_manager.stats, self.json_manager.files["stats"])
+        self.count_stat("general", "restarts")
+    
+    def _apply_stat(self, path, value):
+        if path[:2] == ("words", "by_user"):
+            # Слова старых сообщений вычитаются по мере вытеснения из окна
+            self.user_words().add(path[2], value)
+            self.json_manager.mark_dirty("stats")
+            return
+        node = self.json_manager.stats
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = node.get(path[-1], 0) + value
+        self.json_manager.mark_dirty("stats")
+    
+    def count_stat(self, *path, value=1):
+        """Приращение счетчика stats.json по пути ключей
+        
+        Во вспомогательных шардах приращения копятся и передаются главному
+        через общую базу (sync_shared).
+        """
+        if self.stat_deltas is not None:
+            self.stat_deltas[path] += value
+        else:
+            self._apply_stat(path, value)
+    
+    def track_word_frequencies(self):
+        """Флаг analytics.track_word_frequencies из learning_config.json"""
+        return self.json_manager.config("learning_config").analytics.track_word_frequencies
+    
+    def update_word_stats(self, author_id, text):
+        """Учет слов пользователя в разделе words статистики
+        
+        Частоты слов окна ведет словарь глобального раздела; здесь
+        считается число слов по пользователям (по id, имя может меняться)
+        среди последних слов в объеме окна корпуса.
+        """
+        if not self.track_word_frequencies():
+            return
+        self.count_stat("words", "by_user", str(author_id), value=len(text.split()))
     
     def update_message_stats(self, message_type="text", is_received=True):
         """Обновление статистики сообщений"""
-        if is_received:
-            self.json_manager.stats["messages"]["total_received"] += 1
-        else:
-            self.json_manager.stats["messages"]["total_sent"] += 1
+        self.count_stat("messages", "total_received" if is_received else "total_sent")
         
         # Обновляем статистику по типу сообщений
         if message_type in self.json_manager.stats["messages"]["by_type"]:
-            self.json_manager.stats["messages"]["by_type"][message_type] += 1
+            self.count_stat("messages", "by_type", message_type)
         
         # Обновляем статистику по дням
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-        if today not in self.json_manager.stats["messages"]["by_day"]:
-            self.json_manager.stats["messages"]["by_day"][today] = 0
-        self.json_manager.stats["messages"]["by_day"][today] += 1
+        self.count_stat("messages", "by_day", today)
+    
+    def setup_scheduler(self):
+        """Регистрация обработчиков действий планировщика"""
+        self.scheduler.register("backup", self.task_backup)
+        self.scheduler.register("clean", self.task_clean)
+        self.scheduler.register("update_stats", self.task_update_stats)
+        self.scheduler.register("send_message", self.task_send_message)
+        self.scheduler.register("change_profile", self.task_change_profile)
+    
+    async def task_backup(self, parameters):
+        """Резервная копия файлов данных и корпусов (сжатие в отдельном потоке)"""
+        path = await self.backups.create(parameters.get("files", ["bot_data.json", "stats.json", "personality.json"]))
+        if path is None:
+            raise RuntimeError("не удалось создать резервную копию")
+    
+    async def replace_shared_media(self):
+        """Перезапись списков медиа в общей базе текущими (в потоке базы)"""
+        self._media_outbox.clear()
+        for kind, media in (("image", self.static_images), ("gif", self.gifs)):
+            await asyncio.wrap_future(self.shared.submit(self.shared.replace_media, kind, list(media)))
+    
+    async def restore_backup(self, name):
+        """Восстановление данных из архива резервной копии
+        
+        Args:
+            name: Имя архива из BackupManager.list_backups()
+        """
+        restored = await self.backups.restore(name)
+        if "bot_data" in restored:
+            self.static_images = self.json_manager.bot_data["static_images"]
+            self.gifs = self.json_manager.bot_data["gifs"]
+            if self.shared is not None:
+                await self.replace_shared_media()
+        return restored
+    
+    async def task_clean(self, parameters):
+        """Удаление ссылок на медиа, срок действия которых истек
         
-        # Сохраняем обновленную статистику
-        self.json_manager._save_json(self.json_manager.stats, self.json_manager.files["stats"])
+        Ссылки Discord CDN содержат параметр ex — время истечения подписи;
+        после него ссылка перестает открываться и отвечать ею бессмысленно.
+        Параметр older_than задачи (в секундах) дополнительно удаляет ссылки,
+        подпись которых выдана раньше (параметр is).
+        """
+        now = time.time()
+        older_than = parameters.get("older_than")
+        
+        def alive(url):
+            query = parse_qs(urlparse(url).query)
+            try:
+                if "ex" in query and int(query["ex"][0], 16) <= now:
+                    return False
+                if older_than is not None and "is" in query:
+                    return int(query["is"][0], 16) > now - older_than
+            except ValueError:
+                pass
+            return True
+        
+        types = parameters.get("types", ["images", "gifs"])
+        removed = 0
+        if "images" in types:
+            before = len(self.static_images)
+            self.static_images[:] = [url for url in self.static_images if alive(url)]
+            removed += before - len(self.static_images)
+        if "gifs" in types:
+            before = len(self.gifs)
+            self.gifs[:] = [url for url in self.gifs if alive(url)]
+            removed += before - len(self.gifs)
+        if removed:
+            if self.shared is not None:
+                await self.replace_shared_media()
+            self.update_bot_data()
+            logger.info(f"Удалено устаревших ссылок на медиа: {removed}")
+    
+    async def task_update_stats(self, parameters):
+        """Обновление времени работы и замеров производительности в статистике"""
+        now = time.monotonic()
+        self.json_manager.stats["general"]["uptime"] += int(now - self._uptime_mark)
+        self._uptime_mark = now
+        self.metrics.update_stats(self.json_manager.stats)
+        if self.track_word_frequencies():
+            self.models.global_partition.vocabulary.update_stats(self.json_manager.stats["words"])
+        self.json_manager.mark_dirty("stats")
+    
+    async def task_send_message(self, parameters):
+        """Отправка фразы из responses.json в канал"""
+        channel_id = parameters.get("channel_id")
+        if not channel_id:
+            logger.warning("Для отправки сообщения по расписанию не задан channel_id")
+            return
+        await self.bot.wait_until_ready()
+        channel = self.bot.get_channel(int(channel_id))
+        if channel is None:
+            raise RuntimeError(f"Канал {channel_id} не найден")
+        
+        phrases = self.response_phrases(parameters.get("message_type", ""))
+        if not phrases:
+            logger.warning(f"Нет фраз для типа {parameters.get('message_type')}")
+            return
+        
+        text = parameters.get("prefix", "") + random.choice(phrases)
+        if parameters.get("additional_text"):
+            text += " " + parameters["additional_text"]
+        await channel.send(text)
+        self.update_message_stats(message_type="text", is_received=False)
+    
+    def response_phrases(self, category):
+        """Фразы responses.json по категории вида "reactions.positive"
+        
+        Для категории со вложенными разделами возвращаются фразы всех разделов.
+        """
+        phrases = self.json_manager.responses
+        for part in category.split("."):
+            phrases = phrases.get(part, {}) if isinstance(phrases, dict) else []
+        if isinstance(phrases, dict):
+            phrases = [phrase for group in phrases.values() if isinstance(group, list) for phrase in group]
+        return phrases if isinstance(phrases, list) else []
+    
+    async def task_change_profile(self, parameters):
+        """Смена активного профиля личности"""
+        current = self.personality.active.key
+        excluded = set(parameters.get("excluded", []))
+        candidates = [name for name in self.personality.profiles
+                      if name not in excluded and name != current]
+        if not candidates:
+            return
+        self.personality.switch(random.choice(candidates) if parameters.get("random", True) else candidates[0])
     
     def setup_event_handlers(self):
         """Настройка обработчиков событий Discord"""
@@ -107,6 +535,15 @@ class DiscordBot:
         @self.bot.event
         async def on_ready():
             logger.info(f'{self.bot.user} has connected to Discord!')
+            if self._started is not None:
+                # on_ready повторяется при переподключениях, учитываем только первый
+                startup = time.perf_counter() - self._started
+                self._started = None
+                self.metrics.record("startup", startup)
+                logger.info(f"Запуск до on_ready занял {startup:.2f} с")
+                # Новая установка: корпус заполняется, пока бот уже отвечает
+                if self.primary and self.models.global_partition.word_count < self.json_manager.config("learning_config").corpus.min_size:
+                    self.start_bootstrap()
             
         @self.bot.event
         async def on_message(message):
@@ -114,7 +551,8 @@ class DiscordBot:
                 return
             
             # Обрабатываем сообщение
-            await self.process_message(message)
+            with self.metrics.timer("process_message"):
+                await self.process_message(message)
             
             # Обрабатываем команды
             await self.bot.process_commands(message)
@@ -151,11 +589,14 @@ class DiscordBot:
                 new_nick = after.nick if after.nick else after.name
                 log = f'Никнейм пользователя {before.name} изменен: {old_nick} -> {new_nick}'
                 
-                if after.guild.me.guild_permissions.view_audit_log:
-                    async for entry in after.guild.audit_logs(limit=1, action=discord.AuditLogAction.member_update):
-                        if entry.target.id == after.id and entry.before.nick != entry.after.nick:
-                            log += f' (изменено пользователем {entry.user.name})'
-                            break
+                user_name = await self.audit_cache.find_user(
+                    after.guild, discord.AuditLogAction.member_update, after.id,
+                    # Совпадение по новому значению: более старая запись о смене
+                    # ника в кэше не должна приписать изменение не тому автору
+                    lambda entry: entry.after.nick == after.nick
+                )
+                if user_name:
+                    log += f' (изменено пользователем {user_name})'
                 
                 self.send_to_telegram(log)
         
@@ -165,27 +606,225 @@ class DiscordBot:
                 channel_type = "текстовый" if isinstance(after, discord.TextChannel) else "голосовой"
                 log = f'{channel_type.capitalize()} канал изменен: {before.name} -> {after.name}'
                 
-                if after.guild.me.guild_permissions.view_audit_log:
-                    async for entry in after.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_update):
-                        if entry.target.id == after.id and entry.before.name != entry.after.name:
-                            log += f' (изменено пользователем {entry.user.name})'
-                            break
+                user_name = await self.audit_cache.find_user(
+                    after.guild, discord.AuditLogAction.channel_update, after.id,
+                    lambda entry: entry.after.name == after.name
+                )
+                if user_name:
+                    log += f' (изменено пользователем {user_name})'
                 
                 self.send_to_telegram(log)
         
+        @self.bot.event
+        async def on_guild_remove(guild):
+            self.audit_cache.forget(guild.id)
+        
         @self.bot.event
         async def on_guild_channel_delete(channel):
             channel_type = "текстовый" if isinstance(channel, discord.TextChannel) else "голосовой"
             log = f'{channel_type.capitalize()} канал {channel.name} был удален'
             
-            if channel.guild.me.guild_permissions.view_audit_log:
-                async for entry in channel.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_delete):
-                    if entry.target.id == channel.id:
-                        log += f' (удалено пользователем {entry.user.name})'
-                        break
+            user_name = await self.audit_cache.find_user(
+                channel.guild, discord.AuditLogAction.channel_delete, channel.id
+            )
+            if user_name:
+                log += f' (удалено пользователем {user_name})'
             
             self.send_to_telegram(log)
     
+    def command_enabled(self, name):
+        """Проверка флага enabled команды в commands.json"""
+        command = self.json_manager.config("commands").commands.get(name)
+        return command is None or command.enabled
+    
+    def command_allowed(self, ctx, name):
+        """Проверка, что команда включена и автору хватает прав
+        
+        permission_level из commands.json: 0 — все, 1 — право управлять
+        сообщениями, 2 — администратор сервера.
+        """
+        if not self.command_enabled(name):
+            return False
+        command = self.json_manager.config("commands").commands.get(name)
+        level = command.permission_level if command is not None else 0
+        if level <= 0:
+            return True
+        permissions = getattr(ctx.author, "guild_permissions", None)
+        if permissions is None:
+            # Личные сообщения: права сервера неизвестны
+            return False
+        if permissions.administrator:
+            return True
+        return level == 1 and permissions.manage_messages
+    
+    def setup_commands(self):
+        """Регистрация команд бота"""
+        
+        @self.bot.command(name="stats")
+        async def stats_command(ctx, stats_type="messages"):
+            if not self.command_enabled("stats"):
+                return
+            formatters = {
+                "messages": self.format_message_stats,
+                "words": self.format_word_stats,
+                "performance": self.format_performance_stats,
+            }
+            if stats_type == "all":
+                lines = [line for formatter in formatters.values() for line in formatter()]
+            elif stats_type in formatters:
+                lines = formatters[stats_type]()
+            else:
+                lines = [f"Неизвестный тип статистики: {stats_type}. Доступно: {', '.join(formatters)}, all"]
+            # Ограничение Discord на длину сообщения
+            await ctx.send("\n".join(lines)[:2000])
+        
+        @self.bot.command(name="backup")
+        async def backup_command(ctx, action="create", name=None):
+            if not self.command_allowed(ctx, "backup"):
+                return
+            if action == "list":
+                names = self.backups.list_backups()
+                await ctx.send("Резервные копии:\n" + "\n".join(names) if names else "Резервных копий нет.")
+            elif action == "restore":
+                if name is None:
+                    await ctx.send("Использование: !backup restore <имя архива>")
+                    return
+                try:
+                    restored = await self.restore_backup(name)
+                except FileNotFoundError:
+                    await ctx.send(f"Резервная копия {name} не найдена.")
+                    return
+                await ctx.send(f"Данные восстановлены из {name}: {', '.join(restored) or 'только корпус'}")
+            else:
+                path = await self.backups.create()
+                if path is None:
+                    await ctx.send("Не удалось создать резервную копию.")
+                else:
+                    await ctx.send(f"Резервная копия создана: {os.path.basename(path)}")
+    
+        @self.bot.command(name="profile")
+        async def profile_command(ctx, name=None):
+            if not self.command_enabled("profile"):
+                return
+            if name is None:
+                active = self.personality.active
+                await ctx.send(f"Текущий профиль: {active.key} ({active.name}). "
+                               f"Доступно: {', '.join(self.personality.profiles)}")
+                return
+            if not self.command_allowed(ctx, "profile"):
+                return
+            try:
+                profile = self.personality.switch(name)
+            except KeyError:
+                await ctx.send(f"Профиль {name} не найден. Доступно: {', '.join(self.personality.profiles)}")
+                return
+            await ctx.send(f"Профиль изменен: {profile.key} ({profile.name})")
+    
+        @self.bot.command(name="bootstrap")
+        async def bootstrap_command(ctx, action="start"):
+            if not self.command_allowed(ctx, "bootstrap"):
+                return
+            if action == "status":
+                await ctx.send(self.format_bootstrap_progress())
+                return
+            if not self.start_bootstrap():
+                await ctx.send("Заполнение корпуса уже выполняется или источники не заданы.")
+                return
+            await ctx.send("Заполнение корпуса запущено, прогресс: !bootstrap status")
+            try:
+                result = await self.bootstrap.wait()
+            except Exception as e:
+                logger.error(f"Ошибка заполнения корпуса: {e}")
+                await ctx.send(f"Ошибка заполнения корпуса: {e}")
+                return
+            await ctx.send(f"Корпус заполнен: {result.get('messages', 0)} сообщений, "
+                           f"{result.get('words', 0)} слов за {result.get('seconds', 0)} с")
+    
+    def start_bootstrap(self):
+        """Запуск заполнения корпуса по learning_config.sources
+        
+        Returns:
+            False если заполнение уже идет или не задано ни одного источника
+        """
+        sources = self.json_manager.config("learning_config").sources
+        channels = []
+        for channel_id in sources.history_channels:
+            try:
+                channel = self.bot.get_channel(int(channel_id))
+            except (TypeError, ValueError):
+                channel = None
+            if channel is None:
+                logger.warning(f"Канал {channel_id} для заполнения корпуса не найден")
+            else:
+                channels.append(channel)
+        if not sources.external_corpus and not channels:
+            return False
+        return self.bootstrap.start(channels)
+    
+    def format_bootstrap_progress(self):
+        """Текстовое представление прогресса заполнения корпуса"""
+        progress = self.bootstrap.progress
+        if not progress:
+            return "Заполнение корпуса не запускалось."
+        state = "выполняется" if self.bootstrap.running else "завершено"
+        details = ", ".join(f"{key}: {value}" for key, value in progress.items() if key != "stage")
+        return f"Заполнение корпуса {state}, этап {progress['stage']}: {details}"
+    
+    def format_word_stats(self, top_k=10):
+        """Текстовое представление частотного словаря (O(K), без обхода корпуса)"""
+        vocabulary = self.models.global_partition.vocabulary
+        by_user = self.json_manager.stats["words"]["by_user"]
+        lines = [
+            f"Слов в корпусе: {vocabulary.total_words}, уникальных: {vocabulary.unique_words}, "
+            f"средняя длина: {vocabulary.average_length:.2f}",
+            "Частые слова: " + ", ".join(f"{word} ({count})" for word, count in vocabulary.most_common(top_k)),
+        ]
+        if by_user:
+            top_users = heapq.nlargest(5, by_user.items(), key=lambda item: item[1])
+            lines.append("Больше всех слов: " + ", ".join(
+                f"{self.user_display_name(user_id)} ({count})" for user_id, count in top_users))
+        return lines
+    
+    def user_display_name(self, user_id):
+        """Текущее имя пользователя по id из статистики (или сам id)"""
+        user = self.bot.get_user(int(user_id)) if user_id.isdigit() else None
+        return user.name if user is not None else user_id
+    
+    def format_performance_stats(self):
+        """Текстовое представление замеров производительности"""
+        pool = self.reply_pool.stats()
+        replies = self.replies.stats()
+        audit = self.audit_cache.stats()
+        models = self.models.stats()
+        lines = self.metrics.render()
+        if self.generator is not None:
+            lines.append(f"Процессы генерации: ответов {self.generator.generated}, ошибок {self.generator.failed}")
+        return lines + [
+            f"Буфер ответов: попаданий {pool['hits']}, промахов {pool['fallbacks']}, "
+            f"устаревших {pool['stale']}",
+            f"Очередь ответов: {replies['queued']} в {replies['channels']} каналах, отправлено {replies['sent']} "
+            f"(склеено {replies['coalesced']}), отброшено: переполнение {replies['dropped_full']}, "
+            f"устаревшие {replies['dropped_stale']}, пауза пользователя {replies['dropped_cooldown']}",
+            f"Кэш журнала аудита: попаданий {audit['hits']}, промахов {audit['misses']}, "
+            f"запросов к API {audit['fetches']}",
+            f"Разделы корпуса: загружено {models['loaded']}, память {models['memory_used'] / 1048576:.1f} из "
+            f"{models['memory_budget'] / 1048576:.1f} МБ, загрузок {models['loads']}, вытеснений {models['evictions']}"
+        ]
+    
+    def active_profile(self):
+        """Имя и параметры активного профиля личности"""
+        profile = self.personality.active
+        return profile.key, profile.raw
+    
+    def format_message_stats(self):
+        """Текстовое представление статистики сообщений"""
+        messages = self.json_manager.stats["messages"]
+        by_type = messages["by_type"]
+        return [
+            f"Получено сообщений: {messages['total_received']}, отправлено: {messages['total_sent']}",
+            f"Текст: {by_type.get('text', 0)}, картинки: {by_type.get('image', 0)}, GIF: {by_type.get('gif', 0)}",
+        ]
+    
     async def process_message(self, message):
         """Обработка сообщений от пользователей"""
         
@@ -195,177 +834,258 @@ class DiscordBot:
             self.send_to_telegram(log)
             self.update_message_stats(message_type="text", is_received=True)
             
-            # Обработка вложений
+            # Обработка вложений: файлы не сохраняются на диск, а пересылаются
+            # в Telegram одной группой из фоновой задачи
+            media = []
             for attachment in message.attachments:
-                if attachment.url.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    self.static_images.append(attachment.url)
-                    if len(self.static_images) > 50:
-                        self.static_images.pop(0)
-                    image_path = f'./{attachment.filename}'
-                    await attachment.save(image_path)
-                    self.send_image_to_telegram(image_path)
-                    os.remove(image_path)
+                # URL вложений Discord содержат параметры запроса после '?'
+                path = attachment.url.lower().split('?')[0]
+                if path.endswith(('.png', '.jpg', '.jpeg')):
+                    self.remember_media("image", attachment.url)
+                    media.append(TelegramMedia("photo", attachment.filename, attachment.size,
+                                               attachment.url, attachment.read))
                     self.update_message_stats(message_type="image", is_received=True)
-                elif attachment.url.lower().endswith('.gif'):
-                    self.gifs.append(attachment.url)
-                    if len(self.gifs) > 50:
-                        self.gifs.pop(0)
-                    image_path = f'./{attachment.filename}'
-                    await attachment.save(image_path)
-                    self.send_image_to_telegram(image_path)
-                    os.remove(image_path)
+                elif path.endswith('.gif'):
+                    self.remember_media("gif", attachment.url)
+                    media.append(TelegramMedia("animation", attachment.filename, attachment.size,
+                                               attachment.url, attachment.read))
                     self.update_message_stats(message_type="gif", is_received=True)
                 else:
                     self.send_to_telegram(f'Вложение от {message.author.name}: {attachment.url} (не изображение)')
+            if media:
+                self.send_media_to_telegram(media)
         
-        # Фильтрация и обработка входящего сообщения
-        filtered_content = self.filter_emojis(message.content)
-        
-        # Проверяем, не содержит ли сообщение типичных шаблонов (приветствие/прощание)
-        if filtered_content and not self.contains_common_pattern(filtered_content):
-            normalized_content = self.normalize_text(filtered_content)
-            # Добавляем новый текст в корпус, только если это не типичный шаблон
-            self.text_corpus += normalized_content + " "
+        # Фильтрация и нормализация входящего сообщения за один проход;
+        # типичные шаблоны (приветствие/прощание) и черный список отсекаются
+        with self.metrics.timer("preprocess"):
+            self.preprocessor.maybe_reload()
+            normalized_content = None
+            if not self.preprocessor.is_ignored_user(message.author):
+                normalized_content = self.preprocessor.process(message.content)
         
-        words = self.text_corpus.split()
-        if len(words) > 1000:
-            self.text_corpus = ' '.join(words[-1000:])
-        
-        # Сохраняем обновленные данные
-        self.update_bot_data()
+        if normalized_content:
+            # Старые сообщения вытесняются из окна автоматически
+            self.add_to_corpus(
+                normalized_content,
+                guild_id=message.guild.id if message.guild else None,
+                channel_id=message.channel.id
+            )
+            self.update_word_stats(message.author.id, normalized_content)
         
         # Обработка упоминаний бота
         if self.bot.user in message.mentions:
-            if len(words) < 10 and not self.static_images and not self.gifs:
-                await message.channel.send("Недостаточно данных для генерации ответа.")
-                return
-            
-            # Выбираем тип ответа: текст, изображение или GIF
-            response_type = random.choice(
-                ["text", "static_image", "gif"]
-                if self.static_images and self.gifs else
-                ["text", "static_image"] if self.static_images else
-                ["text", "gif"] if self.gifs else
-                ["text"]
-            )
-            
-            if response_type == "text" and words:
-                # Выбираем между генерацией через markovify и полностью случайными словами
-                use_markov = random.choice([True, False])
-                generated_message = self.generate_response(self.text_corpus, words, use_markov)
-                await message.channel.send(generated_message)
-                self.send_to_telegram(f'Бот ответил {message.author.name}: {generated_message}')
-                self.update_message_stats(message_type="text", is_received=False)
-            
-            elif response_type == "static_image" and self.static_images:
-                image_url = random.choice(self.static_images)
-                await message.channel.send(image_url)
-                self.send_to_telegram(f'Бот ответил {message.author.name} картинкой: {image_url}')
-                self.update_message_stats(message_type="image", is_received=False)
-            
-            elif response_type == "gif" and self.gifs:
-                gif_url = random.choice(self.gifs)
-                await message.channel.send(gif_url)
-                self.send_to_telegram(f'Бот ответил {message.author.name} GIF: {gif_url}')
-                self.update_message_stats(message_type="gif", is_received=False)
-    
-    # Функция фильтрации эмодзи
-    def filter_emojis(self, text):
-        emoji_pattern = re.compile(r'[\U0001F000-\U0001FFFF]')
-        return emoji_pattern.sub('', text).strip()
-    
-    # Нормализация текста
-    def normalize_text(self, text):
-        text = re.sub(r'\s+', ' ', text).strip()
-        text = re.sub(r'([а-яА-Яa-zA-Z0-9])_([а-яА-Яa-zA-Z0-9])', r'\1 \2', text)
-        return text
-    
-    # Функция, проверяющая содержит ли сообщение типичный шаблон
-    def contains_common_pattern(self, message):
-        for pattern in self.common_patterns:
-            if re.search(pattern, message.lower()):
-                return True
-        return False
+            with self.metrics.timer("response"):
+                await self.reply_to_mention(message)
+    
+    async def reply_to_mention(self, message):
+        """Ответ на упоминание бота текстом, картинкой или GIF"""
+        # Пауза между ответами одному пользователю из learning_config.json
+        if not self.replies.allow_user(message.author.id):
+            return
+        
+        # Модель сервера/канала смешивается с глобальной по весам из learning_config
+        partition = self.models.choose(
+            guild_id=message.guild.id if message.guild else None,
+            channel_id=message.channel.id
+        )
+        if partition.word_count < 10 and not self.static_images and not self.gifs:
+            self.replies.submit(message.channel, "Недостаточно данных для генерации ответа.")
+            return
+        
+        # Тип ответа выбирается по response_preferences активного профиля
+        profile = self.personality.active
+        response_type = profile.response_type(bool(self.static_images), bool(self.gifs))
+        
+        if response_type == "text" and partition.word_count:
+            # Слово-триггер настроения: ответ готовой фразой из responses.json
+            generated_message = self.mood_response(message.content)
+            if generated_message is None:
+                # Цепь Маркова или случайные слова с вероятностью markov_usage
+                use_markov = profile.use_markov()
+                use_pool = True
+                if use_markov and self.generator is not None and partition is self.models.global_partition:
+                    # Готовый ответ из буфера, а при промахе — глобальная модель
+                    # в процессе генерации (режим шардов)
+                    generated_message = self.reply_pool.take(partition, *self.active_profile())
+                    use_pool = False
+                    if generated_message is None:
+                        with self.metrics.timer("generate_remote"):
+                            generated_message = await self.generator.generate(profile.min_words, profile.max_words)
+                if generated_message is None:
+                    # Буфер уже проверен выше, повторный take вынул бы второй ответ
+                    generated_message = self.generate_response(use_markov, partition, use_pool)
+            generated_message = profile.decorate(generated_message)
+            self.queue_reply(message, generated_message, "text",
+                             f'Бот ответил {message.author.name}: {generated_message}')
+        
+        elif response_type == "static_image" and self.static_images:
+            image_url = random.choice(self.static_images)
+            self.queue_reply(message, image_url, "image",
+                             f'Бот ответил {message.author.name} картинкой: {image_url}')
+        
+        elif response_type == "gif" and self.gifs:
+            gif_url = random.choice(self.gifs)
+            self.queue_reply(message, gif_url, "gif",
+                             f'Бот ответил {message.author.name} GIF: {gif_url}')
+    
+    def queue_reply(self, message, content, message_type, log):
+        """Постановка ответа в очередь канала; статистика и лог — после отправки"""
+        def on_sent():
+            self.send_to_telegram(log)
+            self.update_message_stats(message_type=message_type, is_received=False)
+        self.replies.submit(message.channel, content, on_sent)
+    
+    def mood_response(self, text):
+        """Фраза для настроения, найденного по словам-триггерам, или None"""
+        mood = self.personality.detect_mood(text)
+        if mood is None:
+            return None
+        category = self.personality.mood_category(mood)
+        if category is None:
+            return None
+        phrases = self.response_phrases(category)
+        return random.choice(phrases) if phrases else None
     
     # Функция генерации случайных слов из корпуса
-    def generate_random_words(self, words, min_length=3, max_length=8):
-        if len(words) < min_length:
+    def generate_random_words(self, vocabulary, min_length=3, max_length=8):
+        if vocabulary.total_words < min_length:
             return "Недостаточно данных для генерации ответа."
         
         # Выбираем случайное количество слов
-        word_count = random.randint(min_length, min(max_length, len(words)))
-        
-        # Выбираем случайные слова из корпуса
-        selected_words = []
-        for _ in range(word_count):
-            # Берем случайное слово из корпуса
-            selected_words.append(random.choice(words))
+        word_count = random.randint(min_length, min(max_length, vocabulary.total_words))
         
-        # Соединяем слова в предложение
-        return ' '.join(selected_words)
+        # Слова выбираются из частотного словаря с вероятностью, пропорциональной
+        # частоте, без построения списка всех слов корпуса
+        return ' '.join(vocabulary.sample(word_count))
     
-    # Модифицированная функция генерации ответа с использованием markovify
-    def generate_response(self, text_corpus, words, use_markov=True):
+    # Генерация ответа по инкрементальной цепи Маркова
+    def generate_response(self, use_markov=True, partition=None, use_pool=True):
+        with self.metrics.timer("generate_response"):
+            return self._generate_response(use_markov, partition, use_pool)
+    
+    def _generate_response(self, use_markov, partition, use_pool=True):
+        partition = partition or self.models.global_partition
         # Проверка на наличие достаточного количества слов в корпусе
-        if len(words) < 10:
+        if partition.word_count < 10:
             return "Недостаточно данных для генерации ответа."
         
-        # Пробуем использовать markovify для более осмысленных ответов
+        # Пробуем использовать цепь Маркова для более осмысленных ответов
         if use_markov:
+            profile_name, profile = self.active_profile()
+            # Сначала берем готовый ответ из буфера, он пополняется в фоне
+            # (use_pool=False, если вызывающий уже получил промах из буфера)
+            if use_pool:
+                generated_response = self.reply_pool.take(partition, profile_name, profile)
+                if generated_response:
+                    return generated_response
+            message_length = profile.get("message_length", {})
             try:
-                text_model = markovify.Text(text_corpus, state_size=2)
-                # Пробуем сгенерировать осмысленное предложение
+                # Буфер пуст: генерируем осмысленное предложение на месте
                 for _ in range(15):
-                    generated_response = text_model.make_short_sentence(
+                    generated_response = partition.engine.make_short_sentence(
                         max_chars=100,
-                        max_words=10,
-                        min_words=2,
+                        max_words=message_length.get("max_words", 10),
+                        min_words=message_length.get("min_words", 2),
                         tries=100
                     )
                     if generated_response and len(generated_response.split()) >= 2:
                         return generated_response
             except Exception as e:
-                logger.error(f"Ошибка при генерации ответа через markovify: {e}")
+                logger.error(f"Ошибка при генерации ответа по цепи Маркова: {e}")
         
-        # Если markovify не справился или не используется, генерируем случайные слова
-        return self.generate_random_words(words)
+        # Если цепь не справилась или не используется, генерируем случайные слова
+        return self.generate_random_words(partition.vocabulary)
     
-    # Функция отправки текстовых сообщений в Telegram с повторными попытками
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
+    # Функция отправки текстовых сообщений в Telegram (не блокирует цикл событий)
     def send_to_telegram(self, message):
-        try:
-            url = f'https://api.telegram.org/bot{self.TELEGRAM_TOKEN}/sendMessage'
-            payload = {'chat_id': self.TELEGRAM_CHAT_ID, 'text': message}
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка отправки в Telegram: {e}")
-            with open("error_log.txt", "a") as f:
-                f.write(f"{datetime.datetime.now()} Ошибка отправки в Telegram: {e}\n")
-            raise
+        self.telegram.send(message)
     
-    # Функция отправки изображений в Telegram с повторными попытками
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-    def send_image_to_telegram(self, image_path):
-        try:
-            url = f'https://api.telegram.org/bot{self.TELEGRAM_TOKEN}/sendPhoto'
-            with open(image_path, 'rb') as image_file:
-                files = {'photo': image_file}
-                payload = {'chat_id': self.TELEGRAM_CHAT_ID}
-                response = requests.post(url, data=payload, files=files)
-                response.raise_for_status()
-        except (requests.exceptions.RequestException, FileNotFoundError) as e:
-            logger.error(f"Ошибка отправки изображения в Telegram: {e}")
-            with open("error_log.txt", "a") as f:
-                f.write(f"{datetime.datetime.now()} Ошибка отправки изображения в Telegram: {e}\n")
-            raise
+    # Функция отправки вложений в Telegram (не блокирует цикл событий)
+    def send_media_to_telegram(self, media):
+        self.telegram.send_media(media)
+    
+    async def start(self):
+        """Запуск бота и фоновых задач в текущем цикле событий"""
+        async with self.bot:
+            await self.telegram.start()
+            self.reply_pool.start()
+            background = []
+            if self.primary:
+                background.append(asyncio.create_task(self.scheduler.run()))
+            if self.shared is not None:
+                # Запросы из цикла событий не должны подолгу ждать чужую запись
+                self.shared.set_timeout(self.busy_timeout)
+                background.append(asyncio.create_task(self.run_shared_sync()))
+                if self.generator is not None:
+                    self.generator.start()
+            autoflush = asyncio.create_task(self.json_manager.run_autoflush())
+            try:
+                await self.bot.start(self.DISCORD_TOKEN)
+            finally:
+                for task in background:
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+                # Отмена задачи записи выполняет финальный сброс на диск
+                autoflush.cancel()
+                try:
+                    await autoflush
+                except asyncio.CancelledError:
+                    pass
+                await self.replies.stop()
+                await self.telegram.stop()
+                self.reply_pool.stop()
+                if self.generator is not None:
+                    await self.generator.stop()
+                self.models.close()
+                if self.shared is not None:
+                    self.shared.close()
     
     def run(self):
         """Запуск бота"""
         logger.info("Запуск бота Discord...")
-        self.bot.run(self.DISCORD_TOKEN)
+        try:
+            asyncio.run(self.start())
+        except KeyboardInterrupt:
+            logger.info("Бот остановлен")
+
+def run_shard(config_dir, shard_ids, shard_count):
+    """Запуск процесса с частью шардов Discord"""
+    logger.info(f"Процесс {os.getpid()}: шарды {shard_ids} из {shard_count}")
+    DiscordBot(config_dir, shard_ids=shard_ids, shard_count=shard_count).run()
+
+
+def run_sharded(config_dir="config"):
+    """Запуск бота в нескольких процессах по learning_config.sharding
+    
+    Шарды распределяются по процессам по кругу; состояние, общее для всех
+    шардов, хранится в <config_dir>/shared.db.
+    """
+    sharding = JsonManager(config_dir).config("learning_config").sharding
+    shard_count = sharding.shard_count or sharding.processes
+    processes = min(sharding.processes, shard_count)
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_shard, name=f"shard-{i}",
+                        args=(config_dir, list(range(i, shard_count, processes)), shard_count))
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.join(timeout=15)
+        logger.info("Бот остановлен")
 
 # Функция для запуска бота
 if __name__ == "__main__":
-    discord_bot = DiscordBot()
-    discord_bot.run()
+    if JsonManager().config("learning_config").sharding.enabled:
+        run_sharded()
+    else:
+        discord_bot = DiscordBot()
+        discord_bot.run()
@@ -0,0 +1,421 @@
+import os
+import sqlite3
+import logging
+import threading
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from corpus_store import CorpusStore
+from vocabulary import TokenTable
+
+logger = logging.getLogger('shared_store')
+
+# Разделитель частей ключа счетчика статистики ("messages", "by_type", "text")
+KEY_SEPARATOR = "\x1f"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS corpus (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_kind ON media (kind, id);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SharedStore:
+    """Общее для процессов-шардов хранилище в SQLite (режим WAL)
+
+    Хранит глобальный корпус (по строке на сообщение с номером шарда-источника),
+    приращения счетчиков статистики и списки медиа. Соединение открывается
+    отдельно в каждом процессе и потоке. Шард обращается к базе через
+    submit(): запросы выполняются по порядку в отдельном потоке со своим
+    соединением, поэтому ожидание блокировки записи, занятой другим шардом,
+    не задерживает цикл событий и heartbeat шлюза Discord.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        """Инициализация
+
+        Args:
+            path: Путь к файлу базы
+            timeout: Сколько ждать освобождения блокировки записи, сек
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid = None
+        self.db.executescript(SCHEMA)
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """Соединение текущего потока (после fork открывается заново)"""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            # В WAL достаточно синхронизации при контрольных точках
+            local.db.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.db
+
+    def set_timeout(self, timeout: float):
+        """Ожидание блокировки записи для соединения текущего потока, сек
+
+        Запуск бота понижает его для цикла событий: редкие прямые вызовы
+        оттуда лучше завершатся ошибкой, чем остановят heartbeat.
+        """
+        self.db.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Выполнение fn(*args) в потоке базы (по порядку постановки)
+
+        В цикле событий результат ожидается через asyncio.wrap_future.
+        """
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-store")
+            self._executor_pid = os.getpid()
+        return self._executor.submit(fn, *args)
+
+    @contextmanager
+    def _transaction(self):
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @contextmanager
+    def snapshot(self):
+        """Чтение нескольких запросов из одного согласованного состояния базы"""
+        db = self.db
+        db.execute("BEGIN")
+        try:
+            yield db
+        finally:
+            db.execute("COMMIT")
+
+    # --- Корпус ---
+
+    def write_batch(self, origin: int, texts: List[str], media: List[Tuple[str, str]],
+                    deltas: Optional[Dict[Tuple[str, ...], int]], keep_media: int = 50):
+        """Запись накопленных за такт обмена изменений шарда одной транзакцией
+
+        Args:
+            origin: Номер шарда-источника
+            texts: Новые сообщения корпуса в порядке добавления
+            media: Новые ссылки на медиа (вид, ссылка); старые сверх keep_media удаляются
+            deltas: Приращения счетчиков статистики (путь в stats.json -> приращение)
+            keep_media: Сколько ссылок каждого вида хранить
+        """
+        if not texts and not media and not deltas:
+            return
+        with self._transaction() as db:
+            db.executemany("INSERT INTO corpus (origin, words, text) VALUES (?, ?, ?)",
+                           ((origin, text.count(' ') + 1, text) for text in texts))
+            db.executemany("INSERT INTO media (kind, url) VALUES (?, ?)", media)
+            for kind in {kind for kind, _ in media}:
+                db.execute("DELETE FROM media WHERE kind = ? AND id NOT IN "
+                           "(SELECT id FROM media WHERE kind = ? ORDER BY id DESC LIMIT ?)",
+                           (kind, kind, keep_media))
+            if deltas:
+                db.executemany(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                    ((KEY_SEPARATOR.join(path), value) for path, value in deltas.items())
+                )
+
+    def messages_since(self, last_id: int, exclude_origin: Optional[int] = None,
+                       limit: int = 5000) -> List[Tuple[int, str]]:
+        """Сообщения, добавленные после last_id
+
+        Args:
+            last_id: Номер последней уже прочитанной строки
+            exclude_origin: Пропускать сообщения этого шарда
+            limit: Максимум строк за один вызов
+
+        Returns:
+            Список (номер строки, текст) по возрастанию номера
+        """
+        return self.db.execute(
+            "SELECT id, text FROM corpus WHERE id > ? AND origin != ? ORDER BY id LIMIT ?",
+            (last_id, -1 if exclude_origin is None else exclude_origin, limit)
+        ).fetchall()
+
+    def tail(self, max_words: int) -> List[Tuple[int, str]]:
+        """Последние сообщения общим объемом не больше max_words слов
+
+        Returns:
+            Список (номер строки, текст) по возрастанию номера
+        """
+        rows = []
+        words = 0
+        for row_id, count, text in self.db.execute("SELECT id, words, text FROM corpus ORDER BY id DESC"):
+            if rows and words + count > max_words:
+                break
+            words += count
+            rows.append((row_id, text))
+        rows.reverse()
+        return rows
+
+    def last_id(self) -> int:
+        return self.db.execute("SELECT COALESCE(MAX(id), 0) FROM corpus").fetchone()[0]
+
+    def epoch(self) -> int:
+        """Номер замены общего корпуса; читатели, увидев новый, перечитывают окно"""
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'epoch'").fetchone()
+        return row[0] if row else 0
+
+    def replace_corpus(self, texts: Iterable[str], origin: int,
+                       only_if_empty: bool = False) -> Optional[Tuple[int, int]]:
+        """Атомарная замена общего корпуса
+
+        Args:
+            texts: Новые сообщения в порядке добавления
+            origin: Номер шарда-источника
+            only_if_empty: Заполнять, только если корпус пуст (перенос журнала
+                при первом запуске; проверка и запись в одной транзакции)
+
+        Returns:
+            (новая эпоха, номер последней строки) из той же транзакции
+            или None, если корпус не пуст и only_if_empty
+        """
+        with self._transaction() as db:
+            if only_if_empty and db.execute("SELECT 1 FROM corpus LIMIT 1").fetchone():
+                return None
+            db.execute("DELETE FROM corpus")
+            db.executemany("INSERT INTO corpus (origin, words, text) VALUES (?, ?, ?)",
+                           ((origin, text.count(' ') + 1, text) for text in texts))
+            db.execute("INSERT INTO meta (name, value) VALUES ('epoch', 1) "
+                       "ON CONFLICT (name) DO UPDATE SET value = value + 1")
+            epoch = db.execute("SELECT value FROM meta WHERE name = 'epoch'").fetchone()[0]
+            last_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM corpus").fetchone()[0]
+        return epoch, last_id
+
+    def trim(self, keep_words: int) -> int:
+        """Удаление строк, которые уже не попадают ни в одно окно корпуса
+
+        Args:
+            keep_words: Сколько последних слов сохранить
+
+        Returns:
+            Количество удаленных строк
+        """
+        rows = self.tail(keep_words)
+        if not rows:
+            return 0
+        return self.db.execute("DELETE FROM corpus WHERE id < ?", (rows[0][0],)).rowcount
+
+    # --- Счетчики статистики ---
+
+    def drain_counters(self) -> Dict[Tuple[str, ...], int]:
+        """Чтение и обнуление накопленных приращений (одна транзакция)"""
+        with self._transaction() as db:
+            rows = db.execute("SELECT name, value FROM counters").fetchall()
+            db.execute("DELETE FROM counters")
+        return {tuple(name.split(KEY_SEPARATOR)): value for name, value in rows}
+
+    # --- Медиа ---
+
+    def media(self, kind: str) -> List[str]:
+        """Ссылки на медиа в порядке добавления"""
+        return [url for (url,) in self.db.execute("SELECT url FROM media WHERE kind = ? ORDER BY id", (kind,))]
+
+    def replace_media(self, kind: str, urls: List[str]):
+        """Атомарная замена списка медиа (перенос из bot_data.json, очистка ссылок)"""
+        with self._transaction() as db:
+            db.execute("DELETE FROM media WHERE kind = ?", (kind,))
+            db.executemany("INSERT INTO media (kind, url) VALUES (?, ?)", ((kind, url) for url in urls))
+
+    def _close_local(self):
+        db = getattr(self._local, "db", None)
+        if db is not None and self._local.pid == os.getpid():
+            db.close()
+            self._local.pid = None
+
+    def close(self):
+        """Завершение потока базы и закрытие соединений"""
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.submit(self._close_local).result()
+            self._executor.shutdown()
+        self._executor = None
+        self._close_local()
+        self._local = threading.local()
+
+
+class SharedCorpusStore(CorpusStore):
+    """Окно глобального корпуса поверх SharedStore вместо файла журнала
+
+    Окно в памяти устроено так же, как у CorpusStore. Сообщения этого шарда
+    копятся в outbox и записываются в общую базу пачкой на такте обмена
+    (take_outbox), а сообщения других шардов читаются fetch() в потоке базы
+    и добавляются в окно apply() в цикле событий; sync() делает и то и
+    другое сразу (процессы генерации). Компакция переписывает общий корпус
+    содержимым окна и увеличивает его эпоху: остальные шарды и процессы
+    генерации, заметив это при чтении, заново строят окно по базе.
+    """
+
+    def __init__(self, shared: SharedStore, origin: int, filepath: str, max_words: int = 10000,
+                 table: Optional[TokenTable] = None):
+        """Инициализация
+
+        Args:
+            shared: Общее хранилище
+            origin: Номер шарда; -1 — только чтение (процессы генерации)
+            filepath: Журнал однопроцессного режима, переносится в базу при первом запуске
+            max_words: Максимальный размер окна корпуса в словах
+            table: Общая таблица слов
+        """
+        super().__init__(filepath, max_words=max_words, table=table)
+        self.shared = shared
+        self.origin = origin
+        # Номер последней прочитанной строки общего корпуса
+        self.last_id = 0
+        # Эпоха общего корпуса, по которой построено окно
+        self.epoch = 0
+        # Сообщения этого шарда, еще не записанные в общую базу
+        self.outbox: List[str] = []
+
+    def _needs_compaction(self) -> bool:
+        return False
+
+    def load(self) -> List[array]:
+        self._reset()
+        if self.origin >= 0 and os.path.exists(self.filepath):
+            try:
+                with open(self.filepath, 'r', encoding='utf-8') as f:
+                    texts = [' '.join(line.split()) for line in f if line.strip()]
+            except OSError as e:
+                logger.error(f"Ошибка чтения журнала {self.filepath}: {e}")
+                texts = []
+            if texts and self.shared.replace_corpus(texts, self.origin, only_if_empty=True):
+                logger.info(f"Корпус из {self.filepath} перенесен в {self.shared.path}")
+        with self.shared.snapshot():
+            self.epoch = self.shared.epoch()
+            self.last_id = self.shared.last_id()
+            rows = self.shared.tail(self.max_words)
+        for _, text in rows:
+            ids = self.table.encode(text)
+            if ids:
+                self._push(ids)
+        return list(self.messages())
+
+    def fetch(self, last_id: int, epoch: int) -> Tuple[int, List[Tuple[int, str]]]:
+        """Чтение новых сообщений (только база, для потока базы)
+
+        Args:
+            last_id: Номер последней прочитанной строки
+            epoch: Эпоха, по которой построено окно
+
+        Returns:
+            (текущая эпоха, строки): при той же эпохе — сообщения других
+            шардов после last_id, при новой — хвост всего корпуса для
+            построения окна заново
+        """
+        with self.shared.snapshot():
+            current = self.shared.epoch()
+            if current != epoch:
+                return current, self.shared.tail(self.max_words)
+            rows = []
+            while True:
+                batch = self.shared.messages_since(last_id, exclude_origin=self.origin)
+                if not batch:
+                    return current, rows
+                rows.extend(batch)
+                last_id = batch[-1][0]
+
+    def apply(self, epoch: int, rows: List[Tuple[int, str]]) -> Tuple[List[array], List[array]]:
+        """Добавление прочитанных fetch() сообщений в окно
+
+        Если корпус с тех пор заменили, окно строится заново и все прежние
+        сообщения возвращаются как вытесненные. Результат чтения, начатого
+        до собственной компакции (эпоха старше текущей), отбрасывается.
+
+        Returns:
+            (добавленные сообщения, вытесненные из окна)
+        """
+        added = []
+        evicted = []
+        if epoch < self.epoch:
+            return added, evicted
+        if epoch > self.epoch:
+            evicted = list(self.messages())
+            self._reset()
+            self.epoch = epoch
+            self.last_id = 0
+            # Свои сообщения, еще не записанные в базу, остаются в окне
+            pending = self.outbox
+        else:
+            pending = []
+        for row_id, text in rows:
+            if row_id <= self.last_id:
+                continue
+            self.last_id = row_id
+            ids = self.table.encode(text)
+            if ids:
+                added.append(ids)
+                evicted.extend(self._push(ids))
+        for text in pending:
+            ids = self.table.encode(text)
+            if ids:
+                added.append(ids)
+                evicted.extend(self._push(ids))
+        return added, evicted
+
+    def sync(self) -> Tuple[List[array], List[array]]:
+        """Подтягивание сообщений других шардов (чтение базы в текущем потоке)
+
+        Returns:
+            (добавленные сообщения, вытесненные из окна)
+        """
+        return self.apply(*self.fetch(self.last_id, self.epoch))
+
+    def take_outbox(self) -> List[str]:
+        """Незаписанные сообщения этого шарда для пачки SharedStore.write_batch"""
+        outbox, self.outbox = self.outbox, []
+        return outbox
+
+    def requeue(self, texts: List[str]):
+        """Возврат пачки в начало outbox после ошибки записи"""
+        self.outbox[:0] = texts
+
+    def append(self, ids: array) -> List[array]:
+        if not ids:
+            return []
+        evicted = self._push(ids)
+        self.outbox.append(self.table.decode(ids))
+        return evicted
+
+    def compact(self) -> bool:
+        try:
+            self.epoch, self.last_id = self.shared.replace_corpus(
+                (self.table.decode(ids) for ids in self.messages()), self.origin)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка перезаписи общего корпуса {self.shared.path}: {e}")
+            return False
+        # Ожидавшие записи сообщения уже входят в окно, а значит и в базу
+        self.outbox.clear()
+        return True
+
+    def close(self):
+        pass
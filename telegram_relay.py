@@ -0,0 +1,399 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger('telegram_relay')
+
+# Ограничение Telegram на длину текста в sendMessage
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+# Ограничение Telegram на размер фото в sendPhoto; более крупные отправляются документом
+TELEGRAM_MAX_PHOTO_SIZE = 10 * 1024 * 1024
+# Максимальное количество элементов в sendMediaGroup
+TELEGRAM_MAX_MEDIA_GROUP = 10
+
+
+class TelegramMedia(NamedTuple):
+    """Вложение для пересылки в Telegram
+
+    Содержимое не хранится в очереди: небольшие файлы читаются через read()
+    непосредственно перед отправкой, а крупные потоково скачиваются по url.
+    """
+    kind: str  # "photo" или "animation"
+    filename: str
+    size: int
+    url: str
+    read: Callable[[], Awaitable[bytes]]
+
+
+class TelegramRelay:
+    """Фоновая пересылка логов в Telegram
+
+    Обработчики Discord только кладут сообщения в ограниченную очередь и
+    сразу возвращаются; отправкой занимается отдельная задача с общей
+    keep-alive сессией aiohttp. Подряд идущие текстовые строки склеиваются
+    в один sendMessage в пределах лимита Telegram. Если очередь переполнена,
+    текст дописывается в файл на диске и отправляется при следующем запуске.
+    """
+
+    def __init__(self, token: str, chat_id: str,
+                 api_url: str = "https://api.telegram.org",
+                 queue_size: int = 1000,
+                 batch_delay: float = 0.5,
+                 max_retries: int = 3,
+                 retry_delay: float = 1.0,
+                 spill_path: Optional[str] = "telegram_spill.txt",
+                 error_log_path: str = "error_log.txt",
+                 max_concurrent_uploads: int = 3,
+                 stream_threshold: int = 8 * 1024 * 1024):
+        """Инициализация ретранслятора
+
+        Args:
+            token: Токен Telegram-бота
+            chat_id: Идентификатор чата для пересылки
+            api_url: Базовый адрес Bot API (для тестов — адрес локального сервера)
+            queue_size: Максимальный размер очереди исходящих сообщений
+            batch_delay: Сколько ждать продолжения пачки строк перед отправкой, сек
+            max_retries: Количество попыток отправки одного запроса
+            retry_delay: Начальная задержка между попытками, удваивается, сек
+            spill_path: Файл для текста, не поместившегося в очередь (None — отбрасывать)
+            error_log_path: Файл для записи окончательных ошибок отправки
+            max_concurrent_uploads: Сколько вложений может выгружаться одновременно
+            stream_threshold: Вложения крупнее этого размера не читаются в память,
+                а потоково передаются из Discord в Telegram, байт
+        """
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = api_url.rstrip('/')
+        self.batch_delay = batch_delay
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.spill_path = spill_path
+        self.error_log_path = error_log_path
+        self.stream_threshold = stream_threshold
+        self._upload_semaphore = asyncio.Semaphore(max_concurrent_uploads)
+        self._uploads = set()
+
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Элемент, вынутый из очереди, но не вошедший в текущую пачку
+        self._pending: Optional[Tuple] = None
+
+        # Необязательный сборщик замеров (metrics.Metrics)
+        self.metrics = None
+
+        # Счетчики для диагностики
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Пересылка включена, только если заданы токен и чат"""
+        return bool(self.token and self.chat_id)
+
+    async def start(self):
+        """Создание HTTP-сессии и запуск фоновой задачи отправки"""
+        if self._worker is not None:
+            return
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=8, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=120)
+        )
+        self._restore_spilled()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Отправка оставшихся сообщений и закрытие сессии
+
+        Args:
+            timeout: Сколько ждать опустошения очереди, сек
+        """
+        if self._worker is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Не удалось отправить {self.queue.qsize()} сообщений до остановки")
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._uploads):
+            task.cancel()
+        # Все, что не ушло, сохраняем на диск
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item[0] == "text":
+                self._spill(item[1])
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def send(self, text: str) -> bool:
+        """Постановка текстового сообщения в очередь без ожидания
+
+        Args:
+            text: Текст сообщения
+
+        Returns:
+            True если сообщение попало в очередь
+        """
+        if not self.enabled:
+            return False
+        return self._enqueue(("text", text))
+
+    def send_media(self, media: List[TelegramMedia]) -> bool:
+        """Постановка вложений одного сообщения в очередь без ожидания
+
+        Args:
+            media: Вложения; фото отправляются одной группой sendMediaGroup
+
+        Returns:
+            True если вложения попали в очередь
+        """
+        if not self.enabled or not media:
+            return False
+        return self._enqueue(("media", media))
+
+    def _enqueue(self, item: Tuple) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            if item[0] == "text" and self.spill_path:
+                self._spill(item[1])
+            else:
+                self.dropped += 1
+            return False
+
+    def _spill(self, text: str):
+        """Сохранение текста на диск при переполнении очереди"""
+        try:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                # Одна строка файла — одно сообщение в виде JSON-строки
+                f.write(json.dumps(text, ensure_ascii=False) + '\n')
+            self.spilled += 1
+        except OSError as e:
+            self.dropped += 1
+            logger.error(f"Ошибка сохранения сообщения Telegram на диск: {e}")
+
+    def _restore_spilled(self):
+        """Возврат в очередь сообщений, сохраненных на диск"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        try:
+            with open(self.spill_path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            os.remove(self.spill_path)
+        except OSError as e:
+            logger.error(f"Ошибка чтения сохраненных сообщений Telegram: {e}")
+            return
+        for line in lines:
+            try:
+                self._enqueue(("text", json.loads(line)))
+            except json.JSONDecodeError:
+                continue
+
+    async def _next_item(self, timeout: Optional[float] = None) -> Optional[Tuple]:
+        """Следующий элемент очереди с учетом отложенного"""
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+            return item
+        if timeout is None:
+            return await self.queue.get()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _run(self):
+        """Основной цикл фоновой отправки"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._next_item()
+            if item[0] == "media":
+                # Вложения выгружаются параллельно, не задерживая текстовые логи
+                task = asyncio.create_task(self._upload_media(item[1]))
+                self._uploads.add(task)
+                task.add_done_callback(self._uploads.discard)
+                continue
+
+            # Склеиваем строки, пришедшие в течение batch_delay, в одну пачку
+            lines = [item[1]]
+            taken = 1
+            length = len(item[1])
+            deadline = loop.time() + self.batch_delay
+            while length < TELEGRAM_MAX_MESSAGE_LENGTH:
+                if not self.queue.empty():
+                    nxt = self.queue.get_nowait()
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    nxt = await self._next_item(remaining)
+                    if nxt is None:
+                        break
+                if nxt[0] != "text" or length + 1 + len(nxt[1]) > TELEGRAM_MAX_MESSAGE_LENGTH:
+                    self._pending = nxt
+                    break
+                lines.append(nxt[1])
+                taken += 1
+                length += 1 + len(nxt[1])
+
+            try:
+                for chunk in self._split_text('\n'.join(lines)):
+                    try:
+                        await self._send_text(chunk)
+                    except Exception as e:
+                        # Любая ошибка одной пачки не должна останавливать отправку
+                        self.failed += 1
+                        logger.error(f"Ошибка отправки пачки логов в Telegram: {e!r}")
+            finally:
+                for _ in range(taken):
+                    self.queue.task_done()
+
+    @staticmethod
+    def _split_text(text: str) -> List[str]:
+        """Разбиение текста на части не длиннее лимита Telegram"""
+        return [text[i:i + TELEGRAM_MAX_MESSAGE_LENGTH]
+                for i in range(0, max(len(text), 1), TELEGRAM_MAX_MESSAGE_LENGTH)]
+
+    async def _send_text(self, text: str):
+        url = f'{self.api_url}/bot{self.token}/sendMessage'
+        await self._post(url, lambda: {'json': {'chat_id': self.chat_id, 'text': text}},
+                         "Ошибка отправки в Telegram")
+
+    async def _upload_media(self, media: List[TelegramMedia]):
+        """Выгрузка вложений одного сообщения с ограничением параллелизма"""
+        try:
+            async with self._upload_semaphore:
+                photos = [m for m in media if m.kind == "photo" and m.size <= TELEGRAM_MAX_PHOTO_SIZE]
+                documents = [m for m in media if m.kind == "photo" and m.size > TELEGRAM_MAX_PHOTO_SIZE]
+                animations = [m for m in media if m.kind == "animation"]
+                for i in range(0, len(photos), TELEGRAM_MAX_MEDIA_GROUP):
+                    await self._send_group(photos[i:i + TELEGRAM_MAX_MEDIA_GROUP], "photo")
+                for i in range(0, len(documents), TELEGRAM_MAX_MEDIA_GROUP):
+                    await self._send_group(documents[i:i + TELEGRAM_MAX_MEDIA_GROUP], "document")
+                for item in animations:
+                    await self._send_group([item], "animation")
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка отправки вложений в Telegram: {e}")
+            self._log_error(f"Ошибка отправки вложений в Telegram: {e}")
+        finally:
+            self.queue.task_done()
+
+    async def _load(self, item: TelegramMedia):
+        """Содержимое вложения: байты для небольших файлов, None для потоковых"""
+        if item.size > self.stream_threshold:
+            return None
+        return await item.read()
+
+    async def _stream(self, url: str):
+        """Потоковое чтение вложения из Discord частями"""
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                yield chunk
+
+    async def _send_group(self, media: List[TelegramMedia], media_type: str):
+        """Отправка вложений одним запросом
+
+        Одиночное вложение уходит через sendPhoto/sendDocument/sendAnimation,
+        несколько — через sendMediaGroup.
+
+        Args:
+            media: Вложения одного типа (не больше TELEGRAM_MAX_MEDIA_GROUP)
+            media_type: "photo", "document" или "animation"
+        """
+        contents = await asyncio.gather(*(self._load(item) for item in media))
+
+        def build():
+            form = aiohttp.FormData()
+            form.add_field('chat_id', str(self.chat_id))
+            if len(media) == 1:
+                field = media_type
+            else:
+                descriptors = [{"type": media_type, "media": f"attach://file{i}"}
+                               for i in range(len(media))]
+                form.add_field('media', json.dumps(descriptors))
+            for i, (item, data) in enumerate(zip(media, contents)):
+                name = field if len(media) == 1 else f"file{i}"
+                # Поток создается заново на каждую попытку отправки
+                payload = data if data is not None else self._stream(item.url)
+                form.add_field(name, payload, filename=item.filename)
+            return {'data': form}
+
+        if len(media) == 1:
+            method = {"photo": "sendPhoto", "document": "sendDocument",
+                      "animation": "sendAnimation"}[media_type]
+        else:
+            method = "sendMediaGroup"
+        url = f'{self.api_url}/bot{self.token}/{method}'
+        await self._post(url, build, "Ошибка отправки изображения в Telegram")
+
+    async def _post(self, url: str, build_request, error_message: str) -> bool:
+        """POST-запрос с асинхронными повторными попытками
+
+        Args:
+            url: Адрес метода Bot API
+            build_request: Функция, возвращающая аргументы запроса (тело нельзя переиспользовать)
+            error_message: Текст для журнала ошибок
+
+        Returns:
+            True если запрос выполнен успешно
+        """
+        delay = self.retry_delay
+        for attempt in range(1, self.max_retries + 1):
+            wait = delay
+            start = time.perf_counter()
+            try:
+                async with self.session.post(url, **build_request()) as response:
+                    if response.status == 429:
+                        wait = max(delay, await self._retry_after(response, delay))
+                        error = f"превышен лимит запросов, повтор через {wait} с"
+                    else:
+                        response.raise_for_status()
+                        self.sent += 1
+                        if self.metrics is not None:
+                            self.metrics.record("telegram", time.perf_counter() - start)
+                        return True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            logger.error(f"{error_message} (попытка {attempt}/{self.max_retries}): {error}")
+            if attempt == self.max_retries:
+                self.failed += 1
+                self._log_error(f"{error_message}: {error}")
+                return False
+            await asyncio.sleep(wait)
+            delay *= 2
+        return False
+
+    @staticmethod
+    async def _retry_after(response: aiohttp.ClientResponse, default: float) -> float:
+        """Задержка из ответа 429 (parameters.retry_after)
+
+        Telegram сообщает, сколько нужно подождать; если тело не JSON или
+        в нем нет числа, возвращается default.
+        """
+        try:
+            body = await response.json(content_type=None)
+            return float(body["parameters"]["retry_after"])
+        except Exception:
+            return default
+
+    def _log_error(self, text: str):
+        try:
+            with open(self.error_log_path, "a", encoding='utf-8') as f:
+                f.write(f"{datetime.datetime.now()} {text}\n")
+        except OSError:
+            pass
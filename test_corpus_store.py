@@ -0,0 +1,105 @@
+import os
+import random
+import tempfile
+import unittest
+from collections import deque
+
+from corpus_store import CorpusStore
+
+
+class CorpusStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmp.name, "corpus.log")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open_store(self, max_words=20, compact_factor=2.0):
+        store = CorpusStore(self.filepath, max_words=max_words, compact_factor=compact_factor)
+        self.addCleanup(store.close)
+        return store
+
+    def window(self, store):
+        return [store.table.decode(ids) for ids in store.messages()]
+
+    def read_log(self):
+        with open(self.filepath, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_window_evicts_oldest_messages(self):
+        store = self.open_store(max_words=5)
+        self.assertEqual(store.append(store.table.encode("раз два")), [])
+        self.assertEqual(store.append(store.table.encode("три четыре")), [])
+        evicted = store.append(store.table.encode("пять шесть"))
+        self.assertEqual([store.table.decode(ids) for ids in evicted], ["раз два"])
+        self.assertEqual(self.window(store), ["три четыре", "пять шесть"])
+        self.assertEqual(store.word_count, 4)
+
+    def test_oversized_message_stays_alone_in_window(self):
+        store = self.open_store(max_words=3)
+        store.append(store.table.encode("а б"))
+        store.append(store.table.encode("в г д е ж"))
+        self.assertEqual(self.window(store), ["в г д е ж"])
+
+    def test_randomized_window_matches_fifo(self):
+        """Окно и журнал после сдвигов и компакций совпадают с простой FIFO-очередью"""
+        rng = random.Random(42)
+        store = self.open_store(max_words=50)
+        expected = deque()
+        words = 0
+        for step in range(2000):
+            text = " ".join(f"w{rng.randrange(100)}" for _ in range(rng.randint(1, 8)))
+            store.append(store.table.encode(text))
+            expected.append(text)
+            words += len(text.split())
+            while words > 50 and len(expected) > 1:
+                words -= len(expected.popleft().split())
+            self.assertEqual(store.word_count, words)
+            if step % 100 == 0:
+                self.assertEqual(self.window(store), list(expected))
+                self.assertEqual(store.recent(store.pushed - 1), [store.table.encode(expected[-1])])
+        self.assertLessEqual(len(self.read_log()), max(2 * store.message_count, 100) + 1)
+
+        store.close()
+        reloaded = self.open_store(max_words=50)
+        reloaded.load()
+        self.assertEqual(self.window(reloaded), list(expected))
+
+    def test_compaction_rewrites_log_with_window(self):
+        store = self.open_store(max_words=10)
+        for i in range(150):
+            store.append(store.table.encode(f"сообщение {i}"))
+        lines = self.read_log()
+        self.assertLess(len(lines), 150)
+        self.assertEqual(lines[-store.message_count:], self.window(store))
+        self.assertTrue(store.compact())
+        self.assertEqual(self.read_log(), self.window(store))
+        self.assertEqual(store.file_lines, store.message_count)
+
+    def test_load_compacts_log_grown_while_unloaded(self):
+        for i in range(300):
+            CorpusStore.append_line(self.filepath, f"строка {i}")
+        store = self.open_store(max_words=10)
+        messages = store.load()
+        self.assertEqual([store.table.decode(ids) for ids in messages], [f"строка {i}" for i in range(295, 300)])
+        self.assertEqual(self.read_log(), self.window(store))
+
+    def test_compact_file_keeps_tail(self):
+        for i in range(30):
+            CorpusStore.append_line(self.filepath, f"строка номер {i}")
+        self.assertEqual(CorpusStore.compact_file(self.filepath, max_words=9), 3)
+        self.assertEqual(self.read_log(), [f"строка номер {i}" for i in range(27, 30)])
+        self.assertEqual(CorpusStore.count_lines(self.filepath), 3)
+
+    def test_recent_returns_messages_after_mark(self):
+        store = self.open_store(max_words=100)
+        store.append(store.table.encode("старое"))
+        mark = store.pushed
+        store.extend([store.table.encode("новое один"), store.table.encode("новое два")])
+        self.assertEqual([store.table.decode(ids) for ids in store.recent(mark)], ["новое один", "новое два"])
+        self.assertEqual(store.recent(store.pushed), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
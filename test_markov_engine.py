@@ -0,0 +1,98 @@
+import random
+import unittest
+from collections import deque
+
+from markov_engine import END_ID, HASHED_FANOUT, STATE_BITS, WORD_MASK, MarkovEngine
+from vocabulary import TokenTable
+
+
+def transitions(engine):
+    """Модель в виде {состояние: {слово: счетчик}} независимо от способа хранения"""
+    result = {}
+    for state, value in engine.model.items():
+        if type(value) is int:
+            result[state] = {value & WORD_MASK: value >> STATE_BITS}
+        elif type(value) is dict:
+            result[state] = dict(value)
+        else:
+            n = len(value) >> 1
+            result[state] = dict(zip(value[:n], value[n:]))
+    return result
+
+
+def random_message(rng, words):
+    """Сообщение из 1-12 слов, иногда из нескольких предложений"""
+    message = []
+    for _ in range(rng.randint(1, 12)):
+        word = rng.choice(words)
+        if rng.random() < 0.15:
+            word += rng.choice(".!?")
+        message.append(word)
+    return " ".join(message)
+
+
+class MarkovEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.table = TokenTable()
+        self.engine = MarkovEngine(state_size=2, table=self.table)
+
+    def rebuild(self, messages):
+        """Модель, построенная с нуля по окну сообщений"""
+        engine = MarkovEngine(state_size=2, table=self.table)
+        for ids in messages:
+            engine.add_message(ids)
+        return engine
+
+    def test_add_and_remove_restore_empty_model(self):
+        ids = self.table.encode("раз два три. четыре пять")
+        self.engine.add_message(ids)
+        self.assertEqual(self.engine.word_count, 5)
+        self.engine.remove_message(ids)
+        self.assertEqual(self.engine.model, {})
+        self.assertEqual(self.engine.word_count, 0)
+
+    def test_randomized_window_matches_rebuild(self):
+        """Добавление и вытеснение в FIFO-окне дают ту же модель, что и перестроение"""
+        rng = random.Random(1234)
+        # Мало слов — много общих состояний; "а" встречается часто, чтобы
+        # состояния переходили между числом, массивом и словарем
+        words = [f"w{i}" for i in range(HASHED_FANOUT * 2)] + ["а"] * HASHED_FANOUT
+        window = deque()
+        for step in range(3000):
+            ids = self.table.encode(random_message(rng, words))
+            self.engine.add_message(ids)
+            window.append(ids)
+            while len(window) > rng.randint(1, 60):
+                self.engine.remove_message(window.popleft())
+            if step % 250 == 0:
+                expected = self.rebuild(window)
+                self.assertEqual(transitions(self.engine), transitions(expected))
+                self.assertEqual(self.engine.word_count, expected.word_count)
+        while window:
+            self.engine.remove_message(window.popleft())
+        self.assertEqual(self.engine.model, {})
+        self.assertEqual(self.engine.word_count, 0)
+
+    def test_wide_state_keeps_counts_after_removal(self):
+        messages = [self.table.encode(f"слово{i} конец") for i in range(HASHED_FANOUT + 1)]
+        for ids in messages:
+            self.engine.add_message(ids)
+        begin = self.engine._begin_state
+        self.assertIs(type(self.engine.model[begin]), dict)
+        for ids in messages[1:]:
+            self.engine.remove_message(ids)
+        self.assertEqual(transitions(self.engine), transitions(self.rebuild(messages[:1])))
+
+    def test_generated_sentence_follows_corpus(self):
+        self.engine.add_message(self.table.encode("кот сидит на окне"))
+        self.assertEqual(self.engine.make_short_sentence(min_words=2, max_words=10), "кот сидит на окне")
+        self.assertEqual(self.engine.walk()[-1:], self.table.encode("окне").tolist())
+        self.assertNotIn(END_ID, self.engine.walk())
+
+    def test_empty_model_generates_nothing(self):
+        self.assertEqual(self.engine.walk(), [])
+        self.assertIsNone(self.engine.make_short_sentence())
+
+
+if __name__ == "__main__":
+    unittest.main()
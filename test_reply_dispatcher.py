@@ -0,0 +1,116 @@
+import asyncio
+import time
+import unittest
+
+from reply_dispatcher import DISCORD_MAX_MESSAGE_LENGTH, ReplyDispatcher, TokenBucket
+
+
+class FakeChannel:
+    """Канал Discord, запоминающий отправленные сообщения и время отправки"""
+
+    def __init__(self, channel_id=1, fail=0):
+        self.id = channel_id
+        self.fail = fail
+        self.sent = []
+        self.times = []
+
+    async def send(self, text):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("ошибка отправки")
+        self.sent.append(text)
+        self.times.append(time.monotonic())
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2.0, capacity=3)
+        now = bucket.updated
+        for _ in range(3):
+            self.assertEqual(bucket.delay(now), 0.0)
+            bucket.take(now)
+        self.assertAlmostEqual(bucket.delay(now), 0.5)
+        self.assertEqual(bucket.delay(now + 0.5), 0.0)
+        self.assertFalse(bucket.full(now + 0.5))
+        self.assertTrue(bucket.full(now + 10))
+
+
+class ReplyDispatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_burst_is_coalesced_into_one_message(self):
+        dispatcher = ReplyDispatcher(rate=10.0, burst=1, max_batch=5, user_cooldown=0)
+        channel = FakeChannel()
+        sent = []
+        for i in range(4):
+            dispatcher.submit(channel, f"ответ {i}", on_sent=lambda i=i: sent.append(i))
+        await dispatcher.stop()
+        self.assertEqual(channel.sent, ["ответ 0\nответ 1\nответ 2\nответ 3"])
+        self.assertEqual(sent, [0, 1, 2, 3])
+        self.assertEqual(dispatcher.stats()["coalesced"], 3)
+        self.assertEqual(dispatcher.depth, 0)
+
+    async def test_rate_limits_sends_per_channel(self):
+        dispatcher = ReplyDispatcher(rate=20.0, burst=1, max_batch=1, user_cooldown=0)
+        channel = FakeChannel()
+        for i in range(4):
+            dispatcher.submit(channel, f"ответ {i}")
+        await dispatcher.stop()
+        self.assertEqual(len(channel.sent), 4)
+        gaps = [b - a for a, b in zip(channel.times, channel.times[1:])]
+        self.assertGreaterEqual(min(gaps), 0.04)
+
+    async def test_channels_do_not_wait_for_each_other(self):
+        dispatcher = ReplyDispatcher(rate=1.0, burst=1, max_batch=1, user_cooldown=0)
+        slow, other = FakeChannel(1), FakeChannel(2)
+        dispatcher.submit(slow, "первый")
+        dispatcher.submit(slow, "второй")
+        dispatcher.submit(other, "соседний")
+        await asyncio.sleep(0.05)
+        self.assertEqual(slow.sent, ["первый"])
+        self.assertEqual(other.sent, ["соседний"])
+        await dispatcher.stop(timeout=0.01)
+
+    async def test_full_queue_drops_replies(self):
+        dispatcher = ReplyDispatcher(max_queue=2, user_cooldown=0)
+        channel = FakeChannel()
+        self.assertTrue(dispatcher.submit(channel, "раз"))
+        self.assertTrue(dispatcher.submit(channel, "два"))
+        self.assertFalse(dispatcher.submit(channel, "три"))
+        self.assertEqual(dispatcher.dropped_full, 1)
+        await dispatcher.stop()
+
+    async def test_stale_replies_are_dropped(self):
+        dispatcher = ReplyDispatcher(rate=10.0, burst=1, max_batch=1, max_age=0.05, user_cooldown=0)
+        channel = FakeChannel()
+        for i in range(3):
+            dispatcher.submit(channel, f"ответ {i}")
+        await dispatcher.stop()
+        self.assertEqual(channel.sent, ["ответ 0"])
+        self.assertEqual(dispatcher.dropped_stale, 2)
+
+    async def test_long_replies_are_split_and_truncated(self):
+        dispatcher = ReplyDispatcher(rate=100.0, burst=5, user_cooldown=0)
+        channel = FakeChannel()
+        dispatcher.submit(channel, "а" * 1500)
+        dispatcher.submit(channel, "б" * 3000)
+        await dispatcher.stop()
+        self.assertEqual(channel.sent, ["а" * 1500, "б" * DISCORD_MAX_MESSAGE_LENGTH])
+
+    async def test_failed_send_is_counted_and_worker_continues(self):
+        dispatcher = ReplyDispatcher(rate=100.0, burst=5, max_batch=1, user_cooldown=0)
+        channel = FakeChannel(fail=1)
+        dispatcher.submit(channel, "потерян")
+        dispatcher.submit(channel, "доставлен")
+        await dispatcher.stop()
+        self.assertEqual(channel.sent, ["доставлен"])
+        self.assertEqual(dispatcher.failed, 1)
+
+    def test_user_cooldown(self):
+        dispatcher = ReplyDispatcher(user_cooldown=60.0)
+        self.assertTrue(dispatcher.allow_user(1))
+        self.assertFalse(dispatcher.allow_user(1))
+        self.assertTrue(dispatcher.allow_user(2))
+        self.assertEqual(dispatcher.dropped_cooldown, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import datetime
+import unittest
+
+from config_schema import SCHEMAS
+from scheduler import TaskScheduler
+
+UTC = datetime.timezone.utc
+
+
+class FakeJsonManager:
+    """JsonManager с одним scheduler.json в памяти"""
+
+    def __init__(self, tasks, retries=1, retry_delay=0.0, max_task_duration=1.0):
+        self.scheduler = SCHEMAS["scheduler"]({
+            "tasks": tasks,
+            "settings": {"timezone": "UTC", "retries": retries, "retry_delay": retry_delay,
+                         "max_task_duration": max_task_duration},
+            "notifications": {"telegram": {"enabled": True, "levels": ["error"]}},
+        }, "scheduler")
+        self.dirty = 0
+
+    def config(self, name):
+        return self.scheduler
+
+    def mark_dirty(self, name):
+        self.dirty += 1
+
+
+class NextRunTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = TaskScheduler(FakeJsonManager({}))
+        # Понедельник
+        self.now = datetime.datetime(2024, 1, 1, 12, 0, tzinfo=UTC)
+
+    def test_interval(self):
+        when = self.scheduler.next_run_after({"interval": 90}, self.now)
+        self.assertEqual(when, self.now + datetime.timedelta(seconds=90))
+
+    def test_time_of_day_later_today_and_tomorrow(self):
+        self.assertEqual(self.scheduler.next_run_after({"time_of_day": "18:30"}, self.now),
+                         self.now.replace(hour=18, minute=30))
+        self.assertEqual(self.scheduler.next_run_after({"time_of_day": "09:00"}, self.now),
+                         datetime.datetime(2024, 1, 2, 9, 0, tzinfo=UTC))
+
+    def test_days_of_week(self):
+        when = self.scheduler.next_run_after({"time_of_day": "09:00", "day_of_week": "friday"}, self.now)
+        self.assertEqual(when, datetime.datetime(2024, 1, 5, 9, 0, tzinfo=UTC))
+        when = self.scheduler.next_run_after({"time_of_day": "12:00", "days": ["monday", "wednesday"]}, self.now)
+        self.assertEqual(when, datetime.datetime(2024, 1, 3, 12, 0, tzinfo=UTC))
+
+
+class TaskSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def run_scheduler(self, scheduler, seconds):
+        runner = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(seconds)
+        runner.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await runner
+
+    async def test_tasks_run_in_due_order(self):
+        now = datetime.datetime.now(UTC)
+        tasks = {
+            "later": {"enabled": True, "interval": 3600, "action": {"type": "mark", "parameters": {"name": "later"}},
+                      "next_run": (now + datetime.timedelta(seconds=0.1)).isoformat()},
+            "first": {"enabled": True, "interval": 3600, "action": {"type": "mark", "parameters": {"name": "first"}},
+                      "next_run": (now - datetime.timedelta(seconds=1)).isoformat()},
+            "off": {"enabled": False, "interval": 1, "action": {"type": "mark", "parameters": {"name": "off"}}},
+            "future": {"enabled": True, "interval": 3600, "action": {"type": "mark", "parameters": {"name": "future"}}},
+        }
+        manager = FakeJsonManager(tasks)
+        scheduler = TaskScheduler(manager)
+        calls = []
+
+        async def mark(parameters):
+            calls.append(parameters["name"])
+
+        scheduler.register("mark", mark)
+        await self.run_scheduler(scheduler, 0.3)
+        self.assertEqual(calls, ["first", "later"])
+        # Следующий запуск записан в конфигурацию до выполнения задачи
+        next_run = datetime.datetime.fromisoformat(tasks["first"]["next_run"])
+        self.assertGreater(next_run, now + datetime.timedelta(seconds=3000))
+        self.assertGreaterEqual(manager.dirty, 2)
+
+    async def test_failed_task_is_retried_and_reported(self):
+        now = datetime.datetime.now(UTC)
+        tasks = {"broken": {"enabled": True, "interval": 3600, "action": {"type": "fail"},
+                            "next_run": now.isoformat()}}
+        notifications = []
+        scheduler = TaskScheduler(FakeJsonManager(tasks, retries=3), notify=notifications.append)
+        attempts = []
+
+        async def fail(parameters):
+            attempts.append(parameters)
+            raise RuntimeError("нет диска")
+
+        scheduler.register("fail", fail)
+        await self.run_scheduler(scheduler, 0.1)
+        self.assertEqual(attempts, [{}, {}, {}])
+        self.assertEqual(len(notifications), 1)
+        self.assertIn("нет диска", notifications[0])
+
+    async def test_slow_task_is_cut_by_max_duration(self):
+        now = datetime.datetime.now(UTC)
+        tasks = {"slow": {"enabled": True, "interval": 3600, "action": {"type": "slow"},
+                          "next_run": now.isoformat()}}
+        notifications = []
+        scheduler = TaskScheduler(FakeJsonManager(tasks, max_task_duration=1.0), notify=notifications.append)
+
+        async def slow(parameters):
+            await asyncio.sleep(10)
+
+        scheduler.register("slow", slow)
+        await self.run_scheduler(scheduler, 1.2)
+        self.assertEqual(len(notifications), 1)
+        self.assertIn("превышено время выполнения", notifications[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from telegram_relay import TelegramRelay
+
+
+class FakeTelegram:
+    """Локальный сервер Bot API, отвечающий по заданному сценарию
+
+    Каждый запрос к sendMessage забирает следующий ответ из responses;
+    когда сценарий закончился, отвечает 200.
+    """
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.received = []
+        self.times = []
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", self.send_message)
+        self.server = TestServer(app)
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        loop = asyncio.get_running_loop()
+        self.received.append((await request.json())["text"])
+        self.times.append(loop.time())
+        if self.responses:
+            return self.responses.pop(0)()
+        return web.json_response({"ok": True, "result": {}})
+
+    @property
+    def url(self) -> str:
+        return str(self.server.make_url("")).rstrip("/")
+
+
+class TelegramRelayTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.error_log = os.path.join(self.tmp.name, "error_log.txt")
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def start(self, fake: FakeTelegram, **kwargs) -> TelegramRelay:
+        await fake.server.start_server()
+        self.addAsyncCleanup(fake.server.close)
+        relay = TelegramRelay("token", "42", api_url=fake.url, batch_delay=0.01,
+                              retry_delay=0.01, spill_path=os.path.join(self.tmp.name, "spill.txt"),
+                              error_log_path=self.error_log, **kwargs)
+        await relay.start()
+        self.addAsyncCleanup(relay.stop, 2.0)
+        return relay
+
+    async def wait_sent(self, relay: TelegramRelay):
+        await asyncio.wait_for(relay.queue.join(), 5.0)
+
+    async def test_ok_lines_are_batched(self):
+        fake = FakeTelegram()
+        relay = await self.start(fake)
+        relay.send("first")
+        relay.send("second")
+        await self.wait_sent(relay)
+        self.assertEqual(fake.received, ["first\nsecond"])
+        self.assertEqual((relay.sent, relay.failed), (1, 0))
+
+    async def test_429_waits_retry_after(self):
+        fake = FakeTelegram([
+            lambda: web.json_response({"ok": False, "parameters": {"retry_after": 0.3}}, status=429),
+        ])
+        relay = await self.start(fake)
+        relay.send("limited")
+        await self.wait_sent(relay)
+        self.assertEqual(fake.received, ["limited", "limited"])
+        self.assertGreaterEqual(fake.times[1] - fake.times[0], 0.25)
+        self.assertEqual((relay.sent, relay.failed), (1, 0))
+
+    async def test_5xx_retries_then_gives_up(self):
+        fake = FakeTelegram([lambda: web.Response(status=502)] * 3)
+        relay = await self.start(fake, max_retries=3)
+        relay.send("broken")
+        await self.wait_sent(relay)
+        self.assertEqual(len(fake.received), 3)
+        self.assertEqual((relay.sent, relay.failed), (0, 1))
+        with open(self.error_log, encoding="utf-8") as f:
+            self.assertIn("Ошибка отправки в Telegram", f.read())
+
+    async def test_429_with_non_json_body_keeps_worker_alive(self):
+        fake = FakeTelegram([
+            lambda: web.Response(text="<html>Too Many Requests</html>", status=429),
+            lambda: web.json_response(["not", "a", "dict"], status=429),
+        ])
+        relay = await self.start(fake)
+        relay.send("first")
+        await self.wait_sent(relay)
+        relay.send("second")
+        await self.wait_sent(relay)
+        self.assertFalse(relay._worker.done())
+        self.assertEqual(fake.received, ["first", "first", "first", "second"])
+        self.assertEqual((relay.sent, relay.failed), (2, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+
+from markov_engine import MarkovEngine
+from model_registry import ModelPartition
+from test_markov_engine import transitions
+from vocabulary import END_ID, TokenTable
+
+
+class TokenTableTest(unittest.TestCase):
+    def test_reclaim_frees_only_unreferenced_words(self):
+        table = TokenTable(reclaim_batch=100)
+        kept = table.encode("кот пес")
+        dropped = table.encode("мышь")
+        table.retain(kept)
+        table.retain(dropped)
+        table.release(dropped)
+        self.assertEqual(table.reclaim(), 1)
+        self.assertIsNone(table.id_to_word[dropped[0]])
+        self.assertNotIn("мышь", table.word_to_id)
+        self.assertEqual(table.decode(kept), "кот пес")
+        self.assertEqual(len(table), 4)
+
+    def test_freed_ids_are_reused(self):
+        table = TokenTable(reclaim_batch=100)
+        old = table.encode("мышь")
+        table.retain(old)
+        table.release(old)
+        table.reclaim()
+        new = table.encode("крыса")
+        self.assertEqual(new, old)
+        self.assertEqual(table.decode(new), "крыса")
+
+    def test_release_reclaims_in_batches(self):
+        table = TokenTable(reclaim_batch=3)
+        ids = table.encode("а б")
+        table.retain(ids)
+        table.reclaim()
+        table.release(ids)
+        self.assertEqual(len(table), 4)
+        more = table.encode("в")
+        table.retain(more)
+        table.release(more)
+        self.assertEqual(len(table), 2)
+
+    def test_word_referenced_again_survives_reclaim(self):
+        table = TokenTable(reclaim_batch=100)
+        ids = table.encode("слово")
+        table.retain(ids)
+        table.release(ids)
+        table.retain(table.encode("слово"))
+        self.assertEqual(table.reclaim(), 0)
+        self.assertEqual(table.decode(ids), "слово")
+
+    def test_pinned_table_keeps_ids(self):
+        table = TokenTable(reclaim_batch=100)
+        ids = table.encode("слово")
+        table.pin()
+        self.assertEqual(table.reclaim(), 0)
+        table.unpin()
+        self.assertEqual(table.reclaim(), 1)
+        self.assertIsNone(table.id_to_word[ids[0]])
+
+
+class PartitionChurnTest(unittest.TestCase):
+    def test_randomized_churn_matches_rebuild(self):
+        """После вытеснений модель, словарь и счетчики таблицы совпадают с перестроенными по окну"""
+        rng = random.Random(7)
+        with tempfile.TemporaryDirectory() as tmp:
+            table = TokenTable(reclaim_batch=64)
+            partition = ModelPartition("global", os.path.join(tmp, "corpus.log"), max_words=200,
+                                       state_size=2, table=table)
+            self.addCleanup(partition.close)
+            for step in range(3000):
+                # Словарь постепенно сменяется, чтобы старые слова освобождались
+                base = step // 10
+                text = " ".join(f"w{base + rng.randrange(40)}" + rng.choice(["", "", "", "."])
+                                for _ in range(rng.randint(1, 10)))
+                partition.add_message(text)
+                if step % 300 == 299:
+                    self.check_partition(partition, table)
+            # Таблица не растет вместе со всеми когда-либо встреченными словами
+            self.assertLess(len(table), 2 * len(partition.vocabulary.counts) + 2 * 64 + 2)
+
+    def check_partition(self, partition, table):
+        window = list(partition.store.messages())
+        expected = MarkovEngine(state_size=2, table=table)
+        for ids in window:
+            expected.add_message(ids)
+        self.assertEqual(transitions(partition.engine), transitions(expected))
+
+        counts = Counter(word_id for ids in window for word_id in ids)
+        self.assertEqual(partition.vocabulary.counts, dict(counts))
+        self.assertEqual(partition.vocabulary.total_words, partition.store.word_count)
+
+        table.reclaim()
+        for word_id, word in enumerate(table.id_to_word):
+            if word_id <= END_ID:
+                continue
+            self.assertEqual(table.refs[word_id], counts.get(word_id, 0))
+            if word is None:
+                self.assertNotIn(word_id, counts)
+            else:
+                self.assertIn(word_id, counts)
+                self.assertEqual(table.word_to_id[word], word_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
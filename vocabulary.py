@@ -0,0 +1,328 @@
+import random
+import bisect
+import logging
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger('vocabulary')
+
+# Служебные токены начала и конца предложения (совпадают с markovify)
+BEGIN = "___BEGIN__"
+END = "___END__"
+BEGIN_ID = 0
+END_ID = 1
+
+# Символы, которыми заканчивается предложение
+SENTENCE_END_CHARS = ".!?…"
+
+
+class TokenTable:
+    """Общая таблица интернирования слов в целочисленные идентификаторы
+
+    Корпуса и модели всех разделов хранят вместо строк идентификаторы из
+    одной таблицы, поэтому каждое слово существует в памяти в одном
+    экземпляре. Разделы учитывают вхождения слов своих окон (retain при
+    добавлении сообщения, release при вытеснении); слова без вхождений
+    освобождаются пачкой в reclaim(), а их идентификаторы используются
+    повторно. Пока таблица закреплена (pin), например на время записи
+    резервной копии в другом потоке, идентификаторы не освобождаются.
+    """
+
+    def __init__(self, reclaim_batch: int = 4096):
+        """Инициализация таблицы
+
+        Args:
+            reclaim_batch: Сколько слов без вхождений накапливать перед освобождением
+        """
+        self.word_to_id: Dict[str, int] = {}
+        self.id_to_word: List[Optional[str]] = []
+        # 1, если слово завершает предложение
+        self.sentence_end = bytearray()
+        # Количество вхождений слова в окна загруженных разделов
+        self.refs = array('i')
+        self.reclaim_batch = reclaim_batch
+        # Слова, у которых не осталось вхождений (кандидаты на освобождение)
+        self._released: List[int] = []
+        # Освобожденные идентификаторы для повторного использования
+        self._free: List[int] = []
+        self._pins = 0
+        for word in (BEGIN, END):
+            self.intern(word)
+
+    def __len__(self) -> int:
+        """Количество слов в таблице"""
+        return len(self.id_to_word) - len(self._free)
+
+    def intern(self, word: str) -> int:
+        """Идентификатор слова (создается при первом появлении)"""
+        word_id = self.word_to_id.get(word)
+        if word_id is None:
+            if self._free:
+                word_id = self._free.pop()
+                self.id_to_word[word_id] = word
+                self.sentence_end[word_id] = word[-1] in SENTENCE_END_CHARS
+            else:
+                word_id = len(self.id_to_word)
+                self.id_to_word.append(word)
+                self.sentence_end.append(word[-1] in SENTENCE_END_CHARS)
+                self.refs.append(0)
+            self.word_to_id[word] = word_id
+            # Слово может так и не войти в окно (вытеснено еще при загрузке журнала)
+            self._released.append(word_id)
+        return word_id
+
+    def retain(self, ids: Iterable[int]):
+        """Учет вхождений слов сообщения, вошедшего в окно раздела"""
+        refs = self.refs
+        for word_id in ids:
+            refs[word_id] += 1
+
+    def release(self, ids: Iterable[int]):
+        """Снятие вхождений слов сообщения, покинувшего окно раздела
+
+        Вызывается, когда сообщение уже удалено из модели и словаря
+        раздела; при накоплении reclaim_batch слов без вхождений они
+        освобождаются. Поэтому все закодированные, но еще не учтенные через
+        retain сообщения должны быть учтены до вызова release.
+        """
+        refs = self.refs
+        released = self._released
+        for word_id in ids:
+            refs[word_id] -= 1
+            if not refs[word_id]:
+                released.append(word_id)
+        if len(released) >= self.reclaim_batch:
+            self.reclaim()
+
+    def reclaim(self) -> int:
+        """Освобождение слов без вхождений
+
+        Returns:
+            Количество освобожденных слов
+        """
+        if self._pins:
+            return 0
+        freed = 0
+        for word_id in self._released:
+            word = self.id_to_word[word_id]
+            # Слово могло снова войти в окно или уже быть освобождено
+            if self.refs[word_id] or word is None or word_id <= END_ID:
+                continue
+            del self.word_to_id[word]
+            self.id_to_word[word_id] = None
+            self._free.append(word_id)
+            freed += 1
+        self._released.clear()
+        return freed
+
+    def pin(self):
+        """Запрет освобождения идентификаторов (чтение из другого потока)"""
+        self._pins += 1
+
+    def unpin(self):
+        self._pins -= 1
+
+    def encode(self, text: str) -> array:
+        """Текст сообщения в массив идентификаторов слов"""
+        word_to_id = self.word_to_id
+        ids = array('i')
+        for word in text.split():
+            word_id = word_to_id.get(word)
+            ids.append(self.intern(word) if word_id is None else word_id)
+        return ids
+
+    def decode(self, ids: Iterable[int]) -> str:
+        """Массив идентификаторов обратно в текст"""
+        id_to_word = self.id_to_word
+        return ' '.join(id_to_word[word_id] for word_id in ids)
+
+
+class VocabularyIndex:
+    """Инкрементальный частотный словарь окна корпуса
+
+    Частоты хранятся по идентификаторам общей таблицы TokenTable и меняются
+    при добавлении сообщения в окно и при его вытеснении. Идентификаторы
+    сгруппированы в корзины по частоте (частота -> список id), а непустые
+    частоты хранятся в отсортированном списке, поэтому и изменение частоты,
+    и выборка K самых частых слов стоят O(1)/O(K) без пересчета корпуса.
+    Словарь хранит только слова своего окна, а не всю общую таблицу.
+    """
+
+    def __init__(self, table: TokenTable):
+        """Инициализация словаря
+
+        Args:
+            table: Общая таблица слов
+        """
+        self.table = table
+        # Идентификатор слова -> частота (только слова с ненулевой частотой)
+        self.counts: Dict[int, int] = {}
+
+        # Частота -> идентификаторы слов с этой частотой; позиция id в корзине
+        self._buckets: Dict[int, array] = {}
+        self._position: Dict[int, int] = {}
+        # Непустые частоты по возрастанию
+        self._sorted_counts: List[int] = []
+
+        self.total_words = 0
+        self.total_chars = 0
+        self.unique_words = 0
+
+    def _bucket_remove(self, word_id: int, count: int):
+        bucket = self._buckets[count]
+        index = self._position.pop(word_id)
+        last = bucket.pop()
+        if last != word_id:
+            bucket[index] = last
+            self._position[last] = index
+        if not bucket:
+            del self._buckets[count]
+            del self._sorted_counts[bisect.bisect_left(self._sorted_counts, count)]
+
+    def _bucket_add(self, word_id: int, count: int):
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            bucket = self._buckets[count] = array('i')
+            bisect.insort(self._sorted_counts, count)
+        self._position[word_id] = len(bucket)
+        bucket.append(word_id)
+
+    def _change(self, word_id: int, delta: int):
+        old = self.counts.get(word_id, 0)
+        new = old + delta
+        if new < 0:
+            logger.warning(f"Отрицательная частота слова {self.table.id_to_word[word_id]!r}, пропуск")
+            return
+        if old:
+            self._bucket_remove(word_id, old)
+        else:
+            self.unique_words += 1
+        if new:
+            self._bucket_add(word_id, new)
+            self.counts[word_id] = new
+        else:
+            self.unique_words -= 1
+            del self.counts[word_id]
+        self.total_words += delta
+        self.total_chars += delta * len(self.table.id_to_word[word_id])
+
+    def add(self, ids: Sequence[int]):
+        """Учет слов сообщения, вошедшего в окно"""
+        for word_id in ids:
+            self._change(word_id, 1)
+
+    def remove(self, ids: Sequence[int]):
+        """Учет слов сообщения, вытесненного из окна"""
+        for word_id in ids:
+            self._change(word_id, -1)
+
+    def clear(self):
+        """Полная очистка словаря"""
+        self.__init__(self.table)
+
+    def most_common(self, k: int = 10) -> List[Tuple[str, int]]:
+        """K самых частых слов за O(K)"""
+        result = []
+        for count in reversed(self._sorted_counts):
+            for word_id in self._buckets[count]:
+                result.append((self.table.id_to_word[word_id], count))
+                if len(result) >= k:
+                    return result
+        return result
+
+    def sample(self, k: int) -> List[str]:
+        """Случайные слова с вероятностью, пропорциональной частоте
+
+        Распределение совпадает с random.choice по списку всех слов окна,
+        но список не строится: сначала выбирается корзина с весом
+        частота * размер, затем слово внутри нее.
+        """
+        if not self.total_words:
+            return []
+        counts = self._sorted_counts
+        weights = []
+        total = 0
+        for count in counts:
+            total += count * len(self._buckets[count])
+            weights.append(total)
+        chosen = random.choices(counts, cum_weights=weights, k=k)
+        id_to_word = self.table.id_to_word
+        return [id_to_word[random.choice(self._buckets[count])] for count in chosen]
+
+    @property
+    def average_length(self) -> float:
+        """Средняя длина слова в окне, символов"""
+        return self.total_chars / self.total_words if self.total_words else 0.0
+
+    def update_stats(self, words_stats: Dict, top_k: int = 10):
+        """Перенос показателей в раздел words файла stats.json
+
+        Args:
+            words_stats: Словарь stats["words"]
+            top_k: Сколько самых частых слов сохранять
+        """
+        words_stats["total_corpus_size"] = self.total_words
+        words_stats["unique_words"] = self.unique_words
+        words_stats["most_common"] = dict(self.most_common(top_k))
+        words_stats["average_length"] = round(self.average_length, 2)
+
+
+class UserWordWindow:
+    """Число слов по авторам среди последних max_words принятых слов
+
+    Очередь (автор, слов) в порядке поступления; соседние сообщения одного
+    автора объединяются в одну запись. Когда сумма превышает max_words,
+    слова самых старых записей вычитаются из счетчика их автора, поэтому
+    счетчики повторяют окно корпуса, а не растут бесконечно. Счетчики и
+    очередь хранятся в разделе words файла stats.json (by_user и window).
+    """
+
+    def __init__(self, words_stats: Dict, max_words: int):
+        """Инициализация окна
+
+        Args:
+            words_stats: Словарь stats["words"] (by_user изменяется на месте)
+            max_words: Размер окна в словах
+        """
+        self.counts: Dict[str, int] = words_stats.setdefault("by_user", {})
+        self.window = deque([author, words] for author, words in words_stats.get("window", ()))
+        self.max_words = max_words
+        self.total = sum(words for _, words in self.window)
+        if sum(self.counts.values()) != self.total:
+            # Счетчики старого формата (по именам, без окна) вычесть нечем
+            logger.info("Счетчики слов по пользователям не соответствуют окну и сброшены")
+            self.counts.clear()
+            self.window.clear()
+            self.total = 0
+        self._trim()
+
+    def add(self, author: str, words: int):
+        """Учет слов нового сообщения автора (с вытеснением старых)"""
+        if words <= 0:
+            return
+        if self.window and self.window[-1][0] == author:
+            self.window[-1][1] += words
+        else:
+            self.window.append([author, words])
+        self.counts[author] = self.counts.get(author, 0) + words
+        self.total += words
+        self._trim()
+
+    def _trim(self):
+        while self.total > self.max_words:
+            oldest = self.window[0]
+            excess = min(self.total - self.max_words, oldest[1])
+            oldest[1] -= excess
+            self.total -= excess
+            left = self.counts.get(oldest[0], 0) - excess
+            if left > 0:
+                self.counts[oldest[0]] = left
+            else:
+                self.counts.pop(oldest[0], None)
+            if not oldest[1]:
+                self.window.popleft()
+
+    def update_stats(self, words_stats: Dict):
+        """Перенос очереди в раздел words файла stats.json перед записью"""
+        words_stats["window"] = list(self.window)